@@ -0,0 +1,257 @@
+"""
+Concurrent-session load test for the budget app.
+
+Simulates N browser sessions at once in one process (one Streamlit
+server): each session is an AppTest running streamlit_budget.py against
+the local SQLite stand-in, doing a random mix of realistic flows (month
+navigation, adding transactions, editing debts, viewing the overview).
+For every session count it reports throughput, p50/p95/p99 rerun latency
+and the process RSS, and appends one JSON record per session count to a
+JSON-lines file.
+
+    python benchmarks/load_test.py --sessions 1 5 10 20 --actions 20 --years 5
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+from streamlit import logger as streamlit_logger
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+import budget_data  # noqa: E402
+from local_warehouse import LocalWarehouse, generate_synthetic_data, seed_warehouse  # noqa: E402
+from run_benchmarks import APP_PATH, _git_commit  # noqa: E402
+
+# Relative weight of each flow in a session's random mix
+FLOW_WEIGHTS = {
+    "navigate_months": 4,
+    "add_transaction": 2,
+    "edit_debt": 1,
+    "view_overview": 1,
+}
+
+
+def rss_bytes():
+    """Current resident set size of this process (peak RSS where /proc is missing)."""
+    gc.collect()
+    try:
+        with open("/proc/self/statm") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes on Linux, bytes on macOS
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def share_server_state():
+    """
+    Make concurrent AppTests behave like sessions of one server:
+    - AppTest installs a mock Runtime singleton for the length of each run
+      and clears it afterwards, which breaks the runs of the other sessions
+      still in flight. Keep serving the last mock instead.
+    - AppTest compiles the script on every run with a fresh ScriptCache; a
+      server compiles it once. Share one cache (this also keeps threads
+      from parsing the script at the same time, which CPython's ast
+      module does not survive reliably).
+    """
+    from streamlit.runtime.runtime import Runtime
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    from streamlit.testing.v1 import app_test
+
+    script_cache = ScriptCache()
+    app_test.ScriptCache = lambda: script_cache
+
+    shared = {}
+
+    def instance(cls):
+        if cls._instance is not None:
+            shared["runtime"] = cls._instance
+            return cls._instance
+        if "runtime" not in shared:
+            raise RuntimeError("Runtime hasn't been created!")
+        return shared["runtime"]
+
+    def exists(cls):
+        return cls._instance is not None or "runtime" in shared
+
+    Runtime.instance = classmethod(instance)
+    Runtime.exists = classmethod(exists)
+
+
+class Session:
+    """One simulated browser session: an AppTest plus the timings of its reruns."""
+    def __init__(self, seed, think_s=0.0):
+        from streamlit.testing.v1 import AppTest
+
+        self.at = AppTest.from_file(APP_PATH, default_timeout=120)
+        self.rng = random.Random(seed)
+        self.think_s = think_s
+        self.timings = []   # (flow, seconds)
+        self.errors = []
+
+    def step(self, flow, runnable):
+        start = time.perf_counter()
+        runnable.run()
+        self.timings.append((flow, time.perf_counter() - start))
+        if self.at.exception:
+            self.errors.append(f"{flow}: {self.at.exception[0].message}")
+        if self.think_s:
+            time.sleep(self.rng.uniform(0, 2 * self.think_s))
+
+    def go_to(self, flow, page):
+        radio = self.at.sidebar.radio[0]
+        if radio.value != page:
+            self.step(flow, radio.set_value(page))
+
+    def run(self, actions):
+        self.step("first_load", self.at)
+        flows = list(FLOW_WEIGHTS)
+        weights = [FLOW_WEIGHTS[f] for f in flows]
+        for _ in range(actions):
+            flow = self.rng.choices(flows, weights)[0]
+            try:
+                getattr(self, flow)()
+            except Exception as exc:  # a widget missing after an error rerun, etc.
+                self.errors.append(f"{flow}: {type(exc).__name__}: {exc}")
+
+    # ─── flows ───────────────────────────────────────────────────────────────
+    def navigate_months(self):
+        self.go_to("navigate_months", "Budget Planning")
+        key = self.rng.choice(["next_month_arrow", "prev_month_arrow"])
+        self.step("navigate_months", self.at.button(key=key).click())
+
+    def add_transaction(self):
+        self.go_to("add_transaction", "Budget Planning")
+        self.at.number_input(key="transaction_amount").set_value(round(self.rng.uniform(5, 500), 2))
+        submit = next(b for b in self.at.button if b.label == "Add Transaction")
+        self.step("add_transaction", submit.click())
+
+    def edit_debt(self):
+        self.go_to("edit_debt", "Debt Domination")
+        edit_keys = [b.key for b in self.at.button if (b.key or "").startswith("edit_debt_")]
+        if not edit_keys:
+            return
+        row_id = self.rng.choice(edit_keys)[len("edit_debt_"):]
+        self.step("edit_debt", self.at.button(key=f"edit_debt_{row_id}").click())
+        self.at.number_input(key=f"edit_debt_balance_{row_id}").set_value(round(self.rng.uniform(100, 20000), 2))
+        self.step("edit_debt", self.at.button(key=f"save_debt_{row_id}").click())
+
+    def view_overview(self):
+        self.go_to("view_overview", "Budget Overview")
+
+
+def run_round(n_sessions, actions, seed, think_s):
+    """Run n_sessions concurrently; returns (sessions, wall seconds, RSS while they are alive)."""
+    sessions = [Session(seed * 1000 + i, think_s) for i in range(n_sessions)]
+    start_barrier = threading.Barrier(n_sessions)
+
+    def drive(session):
+        start_barrier.wait()
+        session.run(actions)
+
+    threads = [threading.Thread(target=drive, args=(s,), name=f"session-{i}") for i, s in enumerate(sessions)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+    return sessions, wall, rss_bytes()
+
+
+def summarize(n_sessions, sessions, wall, rss, baseline_rss, size, meta):
+    latencies = np.array([t for s in sessions for _, t in s.timings])
+    by_flow = {}
+    for session in sessions:
+        for flow, seconds in session.timings:
+            by_flow.setdefault(flow, []).append(seconds)
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return dict(meta, **{
+        "benchmark": "load_test",
+        "size": size,
+        "sessions": n_sessions,
+        "reruns": len(latencies),
+        "errors": sum(len(s.errors) for s in sessions),
+        "wall_s": wall,
+        "reruns_per_s": len(latencies) / wall,
+        "p50_s": float(p50),
+        "p95_s": float(p95),
+        "p99_s": float(p99),
+        "flow_p95_s": {flow: float(np.percentile(t, 95)) for flow, t in sorted(by_flow.items())},
+        "rss_bytes": rss,
+        "rss_per_session_bytes": (rss - baseline_rss) / n_sessions,
+    })
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 5, 10, 20],
+                        help="concurrent session counts to test (one round per value)")
+    parser.add_argument("--actions", type=int, default=20, help="flows per session")
+    parser.add_argument("--think-ms", type=float, default=0.0,
+                        help="mean pause between a session's reruns (0 = back to back)")
+    parser.add_argument("--years", type=int, default=5)
+    parser.add_argument("--categories", type=int, default=20)
+    parser.add_argument("--items", type=int, default=4, help="budget items per category")
+    parser.add_argument("--debts", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_results.jsonl", help="JSON-lines file to append to")
+    args = parser.parse_args(argv)
+    # The app's collapsed empty labels log a warning with a stack trace on every rerun
+    streamlit_logger.set_log_level("error")
+    share_server_state()
+
+    meta = {
+        "run_at": datetime.now().isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+    }
+    data = generate_synthetic_data(years=args.years, categories=args.categories,
+                                   items_per_category=args.items, debts=args.debts, seed=args.seed)
+    size = {"years": args.years, "categories": args.categories, "items": args.items,
+            "debts": args.debts, "fact_rows": len(data["fact_budget_inputs"])}
+
+    records = []
+    print(f"{'sessions':>8} {'reruns':>7} {'err':>4} {'rerun/s':>8} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'p99 ms':>8} {'RSS MB':>8} {'MB/sess':>8}")
+    for n_sessions in args.sessions:
+        # A fresh warehouse and cold process-wide caches per round
+        warehouse = LocalWarehouse()
+        seed_warehouse(warehouse, data)
+        budget_data.use_client(warehouse, warehouse.project_id)
+        budget_data.ensure_schema()
+        budget_data.clear_caches()
+        baseline_rss = rss_bytes()
+
+        sessions, wall, rss = run_round(n_sessions, args.actions, args.seed, args.think_ms / 1000)
+        record = summarize(n_sessions, sessions, wall, rss, baseline_rss, size, meta)
+        records.append(record)
+        print(f"{n_sessions:>8} {record['reruns']:>7} {record['errors']:>4} {record['reruns_per_s']:>8.1f} "
+              f"{record['p50_s'] * 1000:>8.0f} {record['p95_s'] * 1000:>8.0f} {record['p99_s'] * 1000:>8.0f} "
+              f"{rss / 1024**2:>8.0f} {record['rss_per_session_bytes'] / 1024**2:>8.1f}")
+        for session in sessions:
+            for error in session.errors[:3]:
+                print(f"    error: {error}")
+        del sessions
+
+    with open(args.output, "a") as fh:
+        for record in records:
+            fh.write(json.dumps(record) + "\n")
+    print(f"Wrote {len(records)} records to {args.output}")
+    return 1 if any(r["errors"] for r in records) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
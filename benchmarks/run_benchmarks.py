@@ -0,0 +1,175 @@
+"""
+Synthetic-data benchmarks for the budget app.
+
+Seeds the local SQLite stand-in with deterministic synthetic data at one
+or more sizes, times each hot path and every page rerun, and appends one
+JSON record per (benchmark, size) to a JSON-lines file.
+
+    python benchmarks/run_benchmarks.py --years 1 5 10 --output bench_results.jsonl
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import date, datetime
+
+import streamlit as st
+from streamlit import logger as streamlit_logger
+from dateutil.relativedelta import relativedelta
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+import budget_data  # noqa: E402
+import budget_views  # noqa: E402
+from local_warehouse import LocalWarehouse, generate_synthetic_data, seed_warehouse  # noqa: E402
+
+APP_PATH = os.path.join(REPO_ROOT, "streamlit_budget.py")
+PAGES = ["Budget Planning", "Debt Domination", "Budget Overview"]
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def time_call(fn, repeat, setup=None):
+    """
+    Run fn() `repeat` times (after optional setup()) and return the
+    per-call wall times in seconds together with the last return value.
+    """
+    timings, result = [], None
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return timings, result
+
+
+def _rows(result):
+    return len(result) if hasattr(result, "__len__") else None
+
+
+def run_data_benchmarks(warehouse, repeat):
+    today = date.today()
+    month_start = date(today.year, today.month, 1)
+    month_end = month_start + relativedelta(months=1) - relativedelta(days=1)
+    overview_end = month_start + relativedelta(months=12) - relativedelta(days=1)
+    month_rows = budget_data.load_fact_rows(month_start, month_end)
+    debt_name = warehouse.query(
+        f"SELECT debt_name FROM `{warehouse.table_id('fact_debt_items')}` LIMIT 1"
+    ).to_dataframe()["debt_name"].iloc[0]
+    payoff_date = today + relativedelta(months=24)
+    # render_budget_row reads this key, normally set by the app's session init
+    st.session_state["editing_budget_item"] = None
+
+    cases = {
+        "load_fact_data": lambda: budget_data.load_fact_data(),
+        "load_fact_rows_month": lambda: budget_data.load_fact_rows(month_start, month_end),
+        "load_dimension_rows": lambda: budget_data.load_dimension_rows("expense"),
+        "load_debt_items": lambda: budget_data.load_debt_items(),
+        "overview_rollups": lambda: (
+            budget_data.load_monthly_totals(month_start, overview_end),
+            budget_data.load_category_totals(month_start, overview_end),
+        )[1],
+        "calendar_grid": lambda: budget_views.build_calendar_html(month_rows, today.year, today.month),
+        "transaction_list_render": lambda: budget_views.render_transaction_list(month_rows),
+        "insert_monthly_payments_for_debt": lambda: budget_data.insert_monthly_payments_for_debt(
+            debt_name, 12000.0, "15th", payoff_date),
+    }
+    results = {}
+    for name, fn in cases.items():
+        timings, result = time_call(fn, repeat)
+        results[name] = (timings, _rows(result))
+    return results
+
+
+def run_page_benchmarks(repeat):
+    from streamlit.testing.v1 import AppTest
+
+    results = {}
+    for page in PAGES:
+        at = AppTest.from_file(APP_PATH, default_timeout=120)
+        at.run()
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            at.sidebar.radio[0].set_value(page).run()
+            timings.append(time.perf_counter() - start)
+            if at.exception:
+                raise RuntimeError(f"{page} raised: {at.exception[0].message}")
+        results[f"page:{page}"] = (timings, None)
+    return results
+
+
+def summarize(name, timings, rows, size, meta):
+    return dict(meta, **{
+        "benchmark": name,
+        "size": size,
+        "rows": rows,
+        "repeat": len(timings),
+        "min_s": min(timings),
+        "median_s": statistics.median(timings),
+        "mean_s": statistics.fmean(timings),
+        "max_s": max(timings),
+    })
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--years", type=int, nargs="+", default=[1, 5, 10],
+                        help="history lengths to benchmark (one run per value)")
+    parser.add_argument("--categories", type=int, default=20)
+    parser.add_argument("--items", type=int, default=4, help="budget items per category")
+    parser.add_argument("--debts", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--skip-pages", action="store_true", help="skip the AppTest page reruns")
+    parser.add_argument("--output", default="bench_results.jsonl", help="JSON-lines file to append to")
+    args = parser.parse_args(argv)
+    # The app's collapsed empty labels log a warning with a stack trace on every rerun
+    streamlit_logger.set_log_level("error")
+
+    meta = {
+        "run_at": datetime.now().isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+    }
+    records = []
+    for years in args.years:
+        data = generate_synthetic_data(years=years, categories=args.categories,
+                                       items_per_category=args.items, debts=args.debts, seed=args.seed)
+        size = {"years": years, "categories": args.categories, "items": args.items,
+                "debts": args.debts, "fact_rows": len(data["fact_budget_inputs"])}
+        warehouse = LocalWarehouse()
+        seed_warehouse(warehouse, data)
+        budget_data.use_client(warehouse, warehouse.project_id)
+        budget_data.ensure_schema()
+
+        results = run_data_benchmarks(warehouse, args.repeat)
+        if not args.skip_pages:
+            results.update(run_page_benchmarks(args.repeat))
+
+        for name, (timings, rows) in results.items():
+            record = summarize(name, timings, rows, size, meta)
+            records.append(record)
+            print(f"{years:>3}y {size['fact_rows']:>8} rows  {name:<36} median {record['median_s'] * 1000:9.2f} ms")
+
+    with open(args.output, "a") as fh:
+        for record in records:
+            fh.write(json.dumps(record) + "\n")
+    print(f"Wrote {len(records)} records to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
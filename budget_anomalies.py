@@ -0,0 +1,109 @@
+import numpy as np
+import pandas as pd
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Duplicate and anomaly detection
+#
+# Works on whole columns, never row pairs:
+# - exact duplicates: rows whose (date, type, amount, category, budget_item)
+#   hash the same; every copy after the first is reported.
+# - near duplicates: the same (type, amount, category, budget_item) a few
+#   days apart. Rows are sorted by that hash and then by day, so any such
+#   pair ends up next to each other and one comparison of neighbouring rows
+#   finds them all (a sorted-window join instead of n² comparisons).
+# - outliers: amounts far from the median of their category's budget item
+#   (items of one category differ too much in size to share one), measured
+#   in median absolute deviations: a robust z-score, not thrown off by the
+#   outliers themselves. Items with few rows are not judged.
+# Amounts are compared in whole cents.
+# ─────────────────────────────────────────────────────────────────────────────
+NEAR_DUPLICATE_DAYS = 3
+OUTLIER_Z = 3.5
+MIN_ITEM_ROWS = 8
+FINDING_COLUMNS = ["kind", "rowid", "duplicate_of", "date", "type", "category", "budget_item", "amount", "detail"]
+KINDS = ("duplicate", "near_duplicate", "outlier")
+
+
+def _keys(rows, days, cents, columns):
+    """uint64 hash per row of the columns (plus day number and/or cents)."""
+    keyed = rows[columns].copy()
+    if days is not None:
+        keyed["day"] = days
+    if cents is not None:
+        keyed["cents"] = cents
+    return pd.util.hash_pandas_object(keyed, index=False).to_numpy()
+
+
+def _findings(rows, positions, kind, duplicate_of, details):
+    found = rows.iloc[positions]
+    return pd.DataFrame({
+        "kind": kind,
+        "rowid": found["rowid"].to_numpy(),
+        "duplicate_of": duplicate_of,
+        "date": found["date"].to_numpy(),
+        "type": found["type"].to_numpy(),
+        "category": found["category"].to_numpy(),
+        "budget_item": found["budget_item"].to_numpy(),
+        "amount": found["amount"].to_numpy(),
+        "detail": details,
+    }, columns=FINDING_COLUMNS)
+
+
+def find_duplicates(rows, days, cents):
+    keys = _keys(rows, days, cents, ["type", "category", "budget_item"])
+    later = pd.Series(keys).duplicated(keep="first").to_numpy()
+    positions = np.flatnonzero(later)
+    first_rowid = pd.Series(rows["rowid"].to_numpy(), index=keys)
+    first_rowid = first_rowid[~first_rowid.index.duplicated(keep="first")]
+    duplicate_of = first_rowid.reindex(keys[positions]).to_numpy()
+    return _findings(rows, positions, "duplicate", duplicate_of, "same date, item and amount")
+
+
+def find_near_duplicates(rows, days, cents, window_days=NEAR_DUPLICATE_DAYS):
+    keys = _keys(rows, None, cents, ["type", "category", "budget_item"])
+    order = np.lexsort((days, keys))
+    sorted_keys, sorted_days = keys[order], days[order]
+    gaps = np.diff(sorted_days)
+    hit = (sorted_keys[1:] == sorted_keys[:-1]) & (gaps > 0) & (gaps <= window_days)
+    later, earlier = order[1:][hit], order[:-1][hit]
+    details = [f"same item and amount {gap} day{'s' if gap != 1 else ''} apart" for gap in gaps[hit]]
+    return _findings(rows, later, "near_duplicate", rows["rowid"].to_numpy()[earlier], details)
+
+
+def find_outliers(rows, threshold=OUTLIER_Z, min_rows=MIN_ITEM_ROWS):
+    amounts = rows["amount"].astype(float)
+    keys = [rows["type"], rows["category"], rows["budget_item"]]
+    groups = amounts.groupby(keys, sort=False)
+    median = groups.transform("median")
+    deviation = (amounts - median).abs()
+    mad = deviation.groupby(keys, sort=False).transform("median")
+    count = groups.transform("size")
+    # 1.4826 * MAD estimates the standard deviation of normal data
+    with np.errstate(divide="ignore", invalid="ignore"):
+        score = (deviation / (1.4826 * mad)).to_numpy()
+    flagged = (count.to_numpy() >= min_rows) & (mad.to_numpy() > 0) & (score > threshold)
+    positions = np.flatnonzero(flagged)
+    details = [f"{s:.1f}× the usual spread from the median ${m:,.2f}"
+               for s, m in zip(score[positions], median.to_numpy()[positions])]
+    return _findings(rows, positions, "outlier", None, details)
+
+
+def find_anomalies(fact_rows, window_days=NEAR_DUPLICATE_DAYS, outlier_z=OUTLIER_Z):
+    """Every finding over the fact rows, by kind (see KINDS) and then newest first."""
+    if fact_rows.empty:
+        return pd.DataFrame(columns=FINDING_COLUMNS)
+    rows = fact_rows.reset_index(drop=True)
+    days = pd.to_datetime(rows["date"]).to_numpy().astype("datetime64[D]").astype("int64")
+    cents = np.rint(rows["amount"].astype(float).to_numpy() * 100).astype("int64")
+    found = [
+        find_duplicates(rows, days, cents),
+        find_near_duplicates(rows, days, cents, window_days),
+        find_outliers(rows, outlier_z),
+    ]
+    found = [frame for frame in found if not frame.empty]
+    if not found:
+        return pd.DataFrame(columns=FINDING_COLUMNS)
+    found = pd.concat(found, ignore_index=True)
+    found["rank"] = found["kind"].map({kind: n for n, kind in enumerate(KINDS)})
+    found = found.sort_values(["rank", "date"], ascending=[True, False], kind="stable")
+    return found.drop(columns="rank").reset_index(drop=True)
@@ -0,0 +1,189 @@
+"""
+Batch jobs for the budget data, run outside Streamlit (e.g. nightly from cron).
+
+Runs one or more jobs, in the order given, for each tenant, against the
+warehouse configured in a Streamlit-style secrets file:
+
+    python budget_batch.py compact archive rebuild-aggregates recalc-payoffs --all-tenants
+    python budget_batch.py export --start 2020-01-01 --out exports/ --format parquet --tenant smith
+
+Progress goes to stderr (--quiet: errors only). Exit codes: 0 when every
+job succeeded, 75 (EX_TEMPFAIL) when one hit an unavailable warehouse or
+could not finish yet and should be run again later, 1 when one failed
+otherwise, 2 on bad arguments.
+"""
+import argparse
+import os
+import sys
+import time
+import tomllib
+from datetime import date
+
+import budget_data
+import budget_export
+from budget_resilience import WarehouseUnavailable, is_transient
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_TEMPFAIL = 75
+DEFAULT_SECRETS = os.path.join(".streamlit", "secrets.toml")
+
+
+class RetryLater(Exception):
+    """The job could not finish yet (e.g. unsettled journal events); running it again later will."""
+
+
+class Progress:
+    """Per-tenant, per-job progress lines on stderr."""
+    def __init__(self, quiet=False, stream=None):
+        self.quiet = quiet
+        self.stream = stream or sys.stderr
+        self.prefix = "budget_batch"
+
+    def start(self, tenant_id, job):
+        self.prefix = f"[{tenant_id}] {job}"
+        self.started = time.monotonic()
+        self.say("started")
+
+    def say(self, message):
+        if not self.quiet:
+            print(f"{self.prefix}: {message}", file=self.stream, flush=True)
+
+    def step(self, done, total, what):
+        self.say(f"{done}/{total} {what}")
+
+    def done(self, message):
+        self.say(f"{message} ({time.monotonic() - self.started:.1f}s)")
+
+    def error(self, message):
+        print(f"{self.prefix}: {message}", file=self.stream, flush=True)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Jobs: job(args, progress) runs for the current tenant and returns a
+# one-line summary; RetryLater makes the run exit with EXIT_TEMPFAIL.
+# ─────────────────────────────────────────────────────────────────────────────
+def compact_journals(args, progress):
+    total = len(budget_data.JOURNALED_COLUMNS) + 1
+    events = 0
+    for done, table_name in enumerate(budget_data.JOURNALED_COLUMNS, start=1):
+        events += budget_data.compact_journal(table_name)
+        progress.step(done, total, table_name)
+    rows = budget_data.compact_data_versions()
+    progress.step(total, total, budget_data.VERSIONS_TABLE_NAME)
+    return f"{events} settled events folded in, {rows} version rows merged"
+
+
+def archive_closed_years(args, progress):
+    moved = budget_data.archive_closed_years(args.through_year)
+    if moved is None:
+        raise RetryLater("closed years still have recent edits in the journal; compact first or retry later")
+    return f"{moved} rows archived"
+
+
+def rebuild_aggregates(args, progress):
+    rows = budget_data.rebuild_monthly_summaries()
+    progress.step(1, 2, f"{rows} monthly summary rows")
+    tables = budget_data.sync_snapshots()
+    progress.step(2, 2, f"{tables} snapshot tables synced" if tables else "snapshots not enabled")
+    return f"{rows} summary rows rebuilt"
+
+
+def recalculate_payoff_plans(args, progress):
+    payments = budget_data.recalculate_payoff_plans(progress=progress.step)
+    return f"{payments} planned payments written"
+
+
+def export_tables(args, progress):
+    directory = os.path.join(args.out, budget_data.current_tenant())
+    os.makedirs(directory, exist_ok=True)
+    tables = list(budget_data.EXPORT_COLUMNS)
+    for done, table_name in enumerate(tables, start=1):
+        dated = table_name == budget_data.FACT_TABLE_NAME
+        start_date, end_date = (args.start, args.end) if dated else (None, None)
+        path = os.path.join(directory, budget_export.file_name(table_name, args.format, start_date, end_date))
+        rows = budget_data.export_table(table_name, path, args.format, start_date, end_date,
+                                        progress=lambda rows: progress.say(f"{table_name}: {rows:,} rows"))
+        progress.step(done, len(tables), f"{rows:,} rows to {path}")
+    return f"written to {directory}"
+
+
+JOBS = {
+    "compact": compact_journals,
+    "archive": archive_closed_years,
+    "rebuild-aggregates": rebuild_aggregates,
+    "recalc-payoffs": recalculate_payoff_plans,
+    "export": export_tables,
+}
+
+
+def load_secrets(path):
+    with open(path, "rb") as fh:
+        return tomllib.load(fh)
+
+
+def _exit_code(exc):
+    if isinstance(exc, (RetryLater, WarehouseUnavailable)) or is_transient(exc):
+        return EXIT_TEMPFAIL
+    return EXIT_FAILED
+
+
+def run_jobs(jobs, tenants, args, progress):
+    """
+    Run every job for every tenant. A failing job skips the rest of its
+    tenant's jobs (they may depend on it) but not the other tenants.
+    Returns the exit code: EXIT_FAILED if any job failed, else
+    EXIT_TEMPFAIL if any should be retried, else EXIT_OK.
+    """
+    codes = {EXIT_OK}
+    for tenant_id in tenants:
+        budget_data.set_tenant(tenant_id)
+        for job in jobs:
+            progress.start(tenant_id, job)
+            try:
+                budget_data.check_data_versions()
+                progress.done(JOBS[job](args, progress))
+            except Exception as exc:
+                code = _exit_code(exc)
+                progress.error(f"{'retry later' if code == EXIT_TEMPFAIL else 'failed'}: {exc}")
+                codes.add(code)
+                break
+    return EXIT_FAILED if EXIT_FAILED in codes else max(codes)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("jobs", nargs="+", choices=list(JOBS), metavar="job",
+                        help=f"one or more of: {', '.join(JOBS)} (run in this order)")
+    parser.add_argument("--secrets", default=DEFAULT_SECRETS,
+                        help=f"secrets file with the warehouse settings (default: {DEFAULT_SECRETS})")
+    tenants = parser.add_mutually_exclusive_group()
+    tenants.add_argument("--tenant", action="append", dest="tenants",
+                         help="tenant to run for (repeatable; default: the configured default tenant)")
+    tenants.add_argument("--all-tenants", action="store_true", help="run for every tenant with data")
+    parser.add_argument("--through-year", type=int, help="archive: last year to archive (default: last year)")
+    parser.add_argument("--out", default="exports", help="export: directory, one subdirectory per tenant")
+    parser.add_argument("--format", choices=list(budget_export.FORMATS), default="csv", help="export: file format")
+    parser.add_argument("--start", type=date.fromisoformat, help="export: first date of fact rows (YYYY-MM-DD)")
+    parser.add_argument("--end", type=date.fromisoformat, help="export: last date of fact rows (YYYY-MM-DD)")
+    parser.add_argument("--quiet", action="store_true", help="only print errors")
+    args = parser.parse_args(argv)
+
+    progress = Progress(args.quiet)
+    try:
+        budget_data.connect(load_secrets(args.secrets))
+        if args.all_tenants:
+            tenant_ids = budget_data.known_tenants()
+        else:
+            tenant_ids = args.tenants or [budget_data.tenant_for_user() or budget_data.DEFAULT_TENANT]
+            for tenant_id in tenant_ids:
+                budget_data.set_tenant(tenant_id)   # validates the id
+    except Exception as exc:
+        code = _exit_code(exc)
+        progress.error(f"{'warehouse unavailable' if code == EXIT_TEMPFAIL else 'cannot start'}: {exc}")
+        return code
+    return run_jobs(args.jobs, tenant_ids, args, progress)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
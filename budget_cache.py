@@ -0,0 +1,98 @@
+import sys
+import threading
+from collections import OrderedDict
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Per-tenant result cache with memory limits
+#
+# Entries are grouped by tenant. Each tenant has its own LRU order and byte
+# budget, so one large household cannot evict everyone else's data. The
+# number of tenants kept is bounded too: the least recently used tenant's
+# entries go first.
+# ─────────────────────────────────────────────────────────────────────────────
+DEFAULT_TENANT_BYTES = 64 * 1024**2
+DEFAULT_MAX_TENANTS = 32
+
+
+def estimate_size(value):
+    """Bytes held by a DataFrame/Series (deep) or a tuple of them, else a shallow sys.getsizeof."""
+    if isinstance(value, tuple):
+        return sum(estimate_size(item) for item in value)
+    if hasattr(value, "memory_usage"):
+        usage = value.memory_usage(deep=True)
+        return int(usage.sum()) if hasattr(usage, "sum") else int(usage)
+    return sys.getsizeof(value)
+
+
+class TenantCache:
+    def __init__(self, max_bytes_per_tenant=DEFAULT_TENANT_BYTES, max_tenants=DEFAULT_MAX_TENANTS):
+        self.max_bytes_per_tenant = max_bytes_per_tenant
+        self.max_tenants = max_tenants
+        self._tenants = OrderedDict()   # tenant -> OrderedDict(key -> (value, size))
+        self._bytes = {}
+        self._lock = threading.Lock()
+
+    def configure(self, max_bytes_per_tenant=None, max_tenants=None):
+        with self._lock:
+            if max_bytes_per_tenant:
+                self.max_bytes_per_tenant = max_bytes_per_tenant
+            if max_tenants:
+                self.max_tenants = max_tenants
+            for tenant in list(self._tenants):
+                self._evict(tenant)
+            self._evict_tenants()
+
+    def get(self, tenant, key):
+        with self._lock:
+            entries = self._tenants.get(tenant)
+            if entries is None or key not in entries:
+                return None
+            self._tenants.move_to_end(tenant)
+            entries.move_to_end(key)
+            return entries[key][0]
+
+    def put(self, tenant, key, value):
+        """Store value; one larger than the tenant's whole budget is not kept."""
+        size = estimate_size(value)
+        if size > self.max_bytes_per_tenant:
+            return False
+        with self._lock:
+            entries = self._tenants.setdefault(tenant, OrderedDict())
+            self._tenants.move_to_end(tenant)
+            if key in entries:
+                self._bytes[tenant] -= entries.pop(key)[1]
+            entries[key] = (value, size)
+            self._bytes[tenant] = self._bytes.get(tenant, 0) + size
+            self._evict(tenant)
+            self._evict_tenants()
+        return True
+
+    def discard(self, tenant, predicate):
+        """Drop the tenant's entries whose key matches predicate(key)."""
+        with self._lock:
+            entries = self._tenants.get(tenant)
+            if entries is None:
+                return
+            for key in [k for k in entries if predicate(k)]:
+                self._bytes[tenant] -= entries.pop(key)[1]
+
+    def clear(self):
+        with self._lock:
+            self._tenants.clear()
+            self._bytes.clear()
+
+    def usage(self):
+        """{tenant: {"entries": n, "bytes": n}}, most recently used last."""
+        with self._lock:
+            return {tenant: {"entries": len(entries), "bytes": self._bytes.get(tenant, 0)}
+                    for tenant, entries in self._tenants.items()}
+
+    def _evict(self, tenant):
+        entries = self._tenants[tenant]
+        while entries and self._bytes[tenant] > self.max_bytes_per_tenant:
+            self._bytes[tenant] -= entries.popitem(last=False)[1][1]
+
+    def _evict_tenants(self):
+        while len(self._tenants) > self.max_tenants:
+            tenant, _ = self._tenants.popitem(last=False)
+            self._bytes.pop(tenant, None)
@@ -0,0 +1,51 @@
+import calendar
+from datetime import date, timedelta
+
+from budget_ledger import RunningTotals
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Credit card statement cycles
+#
+# A card is configured with the day of month its statement closes on (and
+# optionally the debt in fact_debt_items it is paid down as). A cycle runs
+# from the day after one closing date through the next, and is named by its
+# closing date; a closing day past the end of a short month closes on its
+# last day. CardCycleIndex keeps the charges (expense rows tagged with the
+# card) per card and cycle, moved by each write like the other ledgers
+# (see budget_ledger.py), so statement balances need no scan of the fact rows.
+# ─────────────────────────────────────────────────────────────────────────────
+def _closing_date(year, month, closing_day):
+    return date(year, month, min(closing_day, calendar.monthrange(year, month)[1]))
+
+
+def statement_close(day, closing_day):
+    """The closing date of the cycle that day falls in."""
+    close = _closing_date(day.year, day.month, closing_day)
+    if day <= close:
+        return close
+    year, month = (day.year + 1, 1) if day.month == 12 else (day.year, day.month + 1)
+    return _closing_date(year, month, closing_day)
+
+
+def cycle_start(close, closing_day):
+    """First day of the cycle that closes on close."""
+    previous = close.replace(day=1) - timedelta(days=1)
+    return _closing_date(previous.year, previous.month, closing_day) + timedelta(days=1)
+
+
+class CardCycleIndex(RunningTotals):
+    """Charges per card, then cycle closing date; closing_days is {card_name: closing_day}."""
+    def __init__(self, fact_rows=None, closing_days=None):
+        self.closing_days = dict(closing_days or {})
+        super().__init__(fact_rows)
+
+    def bucket(self, fields):
+        day, type_val = fields[0], fields[1]
+        card = fields[5]
+        if type_val != "expense" or card not in self.closing_days:
+            return None
+        return card, statement_close(day, self.closing_days[card])
+
+    def balance(self, card, close):
+        """Charges of the card's cycle that closes on close."""
+        return self.group(card).get(close, 0.0)
@@ -0,0 +1,2268 @@
+import pandas as pd
+from google.cloud import bigquery
+from google.oauth2 import service_account
+from datetime import datetime, date, timedelta, timezone
+import uuid
+import json
+import time
+import os
+import re
+import threading
+import functools
+import contextvars
+import bisect
+from collections import OrderedDict
+import budget_trace
+from budget_trace import traced
+from budget_snapshot import SnapshotStore, DEFAULT_MAX_AGE_SECONDS
+from budget_cache import TenantCache
+from budget_dataset import FactDataset
+from budget_search import SearchIndex, DEFAULT_LIMIT as SEARCH_LIMIT
+from budget_series import CADENCES, expand_series, last_occurrence, occurrence_rowid
+from budget_envelopes import EnvelopeLedger, envelope_report, envelope_rowid, year_month
+from budget_cards import CardCycleIndex, cycle_start, statement_close
+from budget_anomalies import find_anomalies
+from budget_payoff import PLAN_CATEGORY, PLAN_NOTE, payoff_plan
+import budget_export
+from budget_resilience import CircuitBreaker, WarehouseUnavailable, call_with_retries, is_transient
+
+# ─────────────────────────────────────────────────────────────────────────────
+# 3) Google Cloud & BigQuery Setup
+# ─────────────────────────────────────────────────────────────────────────────
+DATASET_ID = "budget_data"
+
+CATS_TABLE_NAME = "dimension_budget_categories"
+FACT_TABLE_NAME = "fact_budget_inputs"
+DEBT_TABLE_NAME = "fact_debt_items"
+SERIES_TABLE_NAME = "fact_recurring_series"
+SERIES_EXCEPTIONS_TABLE_NAME = "fact_recurring_exceptions"
+ENVELOPE_TABLE_NAME = "budget_envelopes"
+CARDS_TABLE_NAME = "fact_credit_cards"
+ARCHIVE_TABLE_NAME = "fact_budget_inputs_archive"
+SUMMARY_TABLE_NAME = "fact_monthly_summary"
+VERSIONS_TABLE_NAME = "data_versions"
+
+# Set by connect() / use_client(); shared by every session in the process.
+PROJECT_ID = None
+client = None
+
+def connect(secrets):
+    """
+    Point the data functions at a warehouse, once per process:
+    - If secrets has a "local_warehouse" section, use the SQLite stand-in
+      stored at its "path" (see local_warehouse.py).
+    - Else build a BigQuery client from the "bigquery" service account.
+    - If secrets has a "snapshot" section, serve reads from local Parquet
+      snapshots kept in its "dir" (see budget_snapshot.py).
+    - If secrets has a "tenancy" section, map signed-in users to tenants
+      (see configure_tenancy()).
+    - A "journal" section can turn off background compaction
+      (auto_compact = false), e.g. when a batch job runs it instead.
+    - A "resilience" section overrides timeouts, retries and the circuit
+      breaker (see configure_resilience()).
+    """
+    if client is not None:
+        return
+    if "query_limits" in secrets:
+        limits = secrets["query_limits"]
+        configure_scan_limits(limits.get("session_bytes", SESSION_SCAN_LIMIT_BYTES),
+                              limits.get("daily_bytes", DAILY_SCAN_LIMIT_BYTES))
+    if "tenancy" in secrets:
+        configure_tenancy(secrets["tenancy"])
+    if "resilience" in secrets:
+        configure_resilience(**dict(secrets["resilience"]))
+    if "local_warehouse" in secrets:
+        from local_warehouse import LocalWarehouse
+        local_secrets = secrets["local_warehouse"]
+        project_id = local_secrets.get("project_id", "local")
+        use_client(LocalWarehouse(local_secrets["path"], project_id, DATASET_ID), project_id)
+    else:
+        bigquery_secrets = secrets["bigquery"]
+        credentials = service_account.Credentials.from_service_account_info(bigquery_secrets)
+        project_id = bigquery_secrets["project_id"]
+        use_client(bigquery.Client(credentials=credentials, project=project_id), project_id)
+    ensure_schema()
+    configure_journal(**dict(secrets.get("journal", {})))
+    if "snapshot" in secrets:
+        snapshot_secrets = secrets["snapshot"]
+        enable_snapshots(snapshot_secrets["dir"],
+                         snapshot_secrets.get("max_age_seconds", DEFAULT_MAX_AGE_SECONDS))
+
+def use_client(new_client, project_id):
+    """
+    Swap in any object with the bigquery.Client query/load interface
+    (used by connect(), the benchmarks and the local stand-in).
+    """
+    global client, PROJECT_ID, _snapshot_dir
+    client = new_client
+    PROJECT_ID = project_id
+    _snapshot_dir = None
+    with _snapshot_lock:
+        _snapshots.clear()
+    # The breaker's failures were the old client's
+    _breaker.reset()
+
+def ensure_schema():
+    """
+    Create the data_versions, recurring series, envelope target, credit
+    card, archive, summary and journal tables, add the updated_at and
+    tenant_id columns, give rows from before tenancy to DEFAULT_TENANT and
+    cluster every table by tenant_id.
+    """
+    run_query(f"""
+    CREATE TABLE IF NOT EXISTS `{PROJECT_ID}.{DATASET_ID}.{VERSIONS_TABLE_NAME}`
+    (tenant_id STRING, table_name STRING, version INT64, updated_at TIMESTAMP, compacted_through TIMESTAMP,
+     archived_before DATE)
+    CLUSTER BY tenant_id
+    """)
+    for column, col_type in (("compacted_through", "TIMESTAMP"), ("archived_before", "DATE")):
+        run_query(f"""
+        ALTER TABLE `{PROJECT_ID}.{DATASET_ID}.{VERSIONS_TABLE_NAME}`
+        ADD COLUMN IF NOT EXISTS {column} {col_type}
+        """)
+    archive_sql = ", ".join(f"{name} {col_type}" for name, col_type in JOURNALED_COLUMNS[FACT_TABLE_NAME])
+    run_query(f"""
+    CREATE TABLE IF NOT EXISTS `{PROJECT_ID}.{DATASET_ID}.{ARCHIVE_TABLE_NAME}` ({archive_sql})
+    PARTITION BY DATE_TRUNC(date, YEAR)
+    CLUSTER BY tenant_id
+    """)
+    run_query(f"""
+    CREATE TABLE IF NOT EXISTS `{PROJECT_ID}.{DATASET_ID}.{SUMMARY_TABLE_NAME}`
+    (rowid STRING, year_month STRING, type STRING, category STRING, amount FLOAT64, row_count INT64,
+     updated_at TIMESTAMP, tenant_id STRING)
+    CLUSTER BY tenant_id
+    """)
+    for table_name in (SERIES_TABLE_NAME, SERIES_EXCEPTIONS_TABLE_NAME, ENVELOPE_TABLE_NAME, CARDS_TABLE_NAME):
+        column_sql = ", ".join(f"{name} {col_type}" for name, col_type in JOURNALED_COLUMNS[table_name])
+        run_query(f"""
+        CREATE TABLE IF NOT EXISTS `{PROJECT_ID}.{DATASET_ID}.{table_name}` ({column_sql})
+        CLUSTER BY tenant_id
+        """)
+    for table_name, columns in JOURNALED_COLUMNS.items():
+        column_sql = ", ".join(f"{name} {col_type}" for name, col_type in columns + JOURNAL_EVENT_COLUMNS)
+        run_query(f"""
+        CREATE TABLE IF NOT EXISTS `{_journal_id(table_name)}` ({column_sql})
+        PARTITION BY DATE(event_at)
+        CLUSTER BY tenant_id
+        """)
+    for table_id in (f"{PROJECT_ID}.{DATASET_ID}.{FACT_TABLE_NAME}", _journal_id(FACT_TABLE_NAME)):
+        run_query(f"""
+        ALTER TABLE `{table_id}`
+        ADD COLUMN IF NOT EXISTS series_id STRING
+        """)
+    tenanted = (CATS_TABLE_NAME, FACT_TABLE_NAME, DEBT_TABLE_NAME, VERSIONS_TABLE_NAME)
+    for table_name in tenanted:
+        for column, col_type in (("updated_at", "TIMESTAMP"), ("tenant_id", "STRING")):
+            run_query(f"""
+            ALTER TABLE `{PROJECT_ID}.{DATASET_ID}.{table_name}`
+            ADD COLUMN IF NOT EXISTS {column} {col_type}
+            """)
+    # The backfill is a DML job per table and DML jobs are quota-limited;
+    # one cheap read (the tenant_id column only) finds the tables that
+    # still have rows from before tenancy, which after the first run is none.
+    # data_versions is fed by streaming inserts, and DML cannot touch rows
+    # still in the streaming buffer, so it is left out: its reads count a
+    # NULL tenant_id as DEFAULT_TENANT (see _VERSION_ROWS).
+    backfilled = (CATS_TABLE_NAME, FACT_TABLE_NAME, DEBT_TABLE_NAME)
+    untenanted = run_query(" UNION ALL ".join(
+        f"SELECT '{table_name}' AS table_name, COUNT(*) AS row_count "
+        f"FROM `{PROJECT_ID}.{DATASET_ID}.{table_name}` WHERE tenant_id IS NULL"
+        for table_name in backfilled
+    )).to_dataframe()
+    for table_name in untenanted.loc[untenanted["row_count"] > 0, "table_name"]:
+        run_query(f"""
+        UPDATE `{PROJECT_ID}.{DATASET_ID}.{table_name}`
+        SET tenant_id = '{DEFAULT_TENANT}'
+        WHERE tenant_id IS NULL
+        """)
+    for table_name in tenanted:
+        table_id = f"{PROJECT_ID}.{DATASET_ID}.{table_name}"
+        table = client.get_table(table_id)
+        if list(table.clustering_fields or []) != ["tenant_id"]:
+            table.clustering_fields = ["tenant_id"]
+            client.update_table(table, ["clustering_fields"])
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Tenancy
+#
+# Every row carries a tenant_id (one household) and every query filters on
+# it. The tables are clustered by tenant_id, so a query only scans that
+# tenant's blocks. The current session's tenant is a context variable that
+# is set at the top of each rerun, like the scan counter. Process-wide
+# caches are partitioned by tenant, each partition with its own memory limit.
+# ─────────────────────────────────────────────────────────────────────────────
+DEFAULT_TENANT = "default"
+_TENANT_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+_tenant = contextvars.ContextVar("budget_tenant", default=DEFAULT_TENANT)
+_tenancy = None
+_results = TenantCache()
+
+def configure_tenancy(tenancy):
+    """
+    tenancy is the secrets section:
+      default_tenant = "smith"           # users not listed below (optional)
+      cache_bytes_per_tenant = 67108864  # optional
+      max_cached_tenants = 32            # optional
+      [tenancy.users]
+      "pat@example.com" = "smith"
+    """
+    global _tenancy
+    _tenancy = {
+        "users": {email.lower(): tenant for email, tenant in dict(tenancy.get("users", {})).items()},
+        "default_tenant": tenancy.get("default_tenant"),
+    }
+    _results.configure(tenancy.get("cache_bytes_per_tenant"), tenancy.get("max_cached_tenants"))
+
+def tenant_for_user(email=None):
+    """
+    The tenant of a signed-in user: DEFAULT_TENANT without a tenancy
+    config, else the user's mapped tenant or the configured default. None
+    means the user has no household.
+    """
+    if _tenancy is None:
+        return DEFAULT_TENANT
+    return _tenancy["users"].get((email or "").lower(), _tenancy["default_tenant"])
+
+def set_tenant(tenant_id):
+    if not _TENANT_RE.match(tenant_id or ""):
+        raise ValueError(f"Invalid tenant id: {tenant_id!r}")
+    _tenant.set(tenant_id)
+
+def current_tenant():
+    return _tenant.get()
+
+def known_tenants():
+    """Every tenant with data or a write on record, for batch jobs that run once per tenant."""
+    tables = (VERSIONS_TABLE_NAME, FACT_TABLE_NAME, DEBT_TABLE_NAME)
+    union = " UNION ALL ".join(f"SELECT tenant_id FROM `{PROJECT_ID}.{DATASET_ID}.{name}`" for name in tables)
+    query = f"SELECT DISTINCT tenant_id FROM ({union}) AS tenants WHERE tenant_id IS NOT NULL ORDER BY tenant_id"
+    return list(run_query(query, retry=True).to_dataframe()["tenant_id"])
+
+def cache_usage():
+    """Bytes and entries held in the result cache, by tenant."""
+    return _results.usage()
+
+def _tenant_config(*params):
+    """A QueryJobConfig with @tenant_id plus any extra parameters."""
+    return bigquery.QueryJobConfig(query_parameters=[
+        bigquery.ScalarQueryParameter("tenant_id", "STRING", current_tenant()),
+        *params,
+    ])
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Local snapshots
+#
+# When enabled, the load_* functions below read from process-wide Parquet
+# snapshots of the three tables instead of querying the warehouse on every
+# rerun. Writers mark the table they touched dirty so the next read syncs
+# its delta first; otherwise a table is re-synced once it is older than
+# max_age_seconds. Each tenant has its own snapshot in <dir>/<tenant>/; at
+# most MAX_SNAPSHOT_TENANTS are held in memory at once.
+# ─────────────────────────────────────────────────────────────────────────────
+MAX_SNAPSHOT_TENANTS = 8
+
+_snapshot_dir = None
+_snapshot_max_age = DEFAULT_MAX_AGE_SECONDS
+_snapshots = OrderedDict()
+_snapshot_lock = threading.Lock()
+
+def enable_snapshots(directory, max_age_seconds=DEFAULT_MAX_AGE_SECONDS):
+    global _snapshot_dir, _snapshot_max_age
+    _snapshot_dir = directory
+    _snapshot_max_age = max_age_seconds
+    with _snapshot_lock:
+        _snapshots.clear()
+
+def snapshots_enabled():
+    return _snapshot_dir is not None
+
+def snapshot_store(tenant_id=None):
+    """The tenant's SnapshotStore (default: current tenant), or None when disabled."""
+    if _snapshot_dir is None:
+        return None
+    tenant_id = tenant_id or current_tenant()
+    with _snapshot_lock:
+        store = _snapshots.get(tenant_id)
+        if store is None:
+            table_ids = {name: f"{PROJECT_ID}.{DATASET_ID}.{name}"
+                         for name in (CATS_TABLE_NAME, FACT_TABLE_NAME, DEBT_TABLE_NAME, SUMMARY_TABLE_NAME,
+                                      SERIES_TABLE_NAME, SERIES_EXCEPTIONS_TABLE_NAME, ENVELOPE_TABLE_NAME,
+                                      CARDS_TABLE_NAME)}
+            sources = {name: functools.partial(_journaled_source, name, tenant_id) for name in JOURNALED_COLUMNS}
+            store = SnapshotStore(os.path.join(_snapshot_dir, tenant_id), table_ids,
+                                  _snapshot_max_age, tenant_id=tenant_id, sources=sources)
+            _snapshots[tenant_id] = store
+            while len(_snapshots) > MAX_SNAPSHOT_TENANTS:
+                _snapshots.popitem(last=False)
+        _snapshots.move_to_end(tenant_id)
+        return store
+
+def refresh_snapshots():
+    """Force a delta sync of the current tenant's tables on their next read."""
+    store = snapshot_store()
+    if store is not None:
+        store.mark_dirty()
+
+def sync_snapshots():
+    """
+    Sync every snapshot table of the current tenant now (a batch job does
+    it so that no rerun has to). Returns the number of tables synced.
+    """
+    store = snapshot_store()
+    if store is None:
+        return 0
+    store.mark_dirty()
+    for table_name in store.tables:
+        store.frame(table_name, read_query)
+    return len(store.tables)
+
+def _snapshot_frame(table_name):
+    """The table's snapshot DataFrame (shared, do not mutate), or None when disabled."""
+    store = snapshot_store()
+    if store is None:
+        return None
+    budget_trace.annotate(cache="snapshot")
+    return store.frame(table_name, read_query)
+
+def _mark_snapshot_dirty(table_name):
+    with _snapshot_lock:
+        store = _snapshots.get(current_tenant())
+    if store is not None:
+        store.mark_dirty(table_name)
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Data versions
+#
+# Every write appends a (tenant, table, version) row to data_versions, the
+# version being a microsecond timestamp, so bumping is a streaming insert
+# rather than DML. check_data_versions() reads the tenant's newest versions
+# (and journal compaction and archive watermarks) with one tiny query per rerun; the
+# load_* results below are cached process-wide, per tenant, keyed by
+# (function, args, version), so every session of a household shares one
+# copy and only refetches after some session (in this process or another)
+# has written. Until the first check, or after a local
+# write until the next one, nothing is cached.
+#
+# compact_data_versions() folds each table's settled rows into one (run
+# with journal compaction), so the check reads about one row per table.
+# Rows younger than VERSION_ROWS_SETTLE may still be in BigQuery's
+# streaming buffer, which DML cannot touch; they are left for next time.
+# ─────────────────────────────────────────────────────────────────────────────
+VERSION_ROWS_SETTLE = timedelta(hours=2)
+# Rows written before tenancy have no tenant_id (ensure_schema does not
+# backfill this table) and belong to DEFAULT_TENANT.
+_VERSION_ROWS = f"IFNULL(tenant_id, '{DEFAULT_TENANT}') = @tenant_id"
+
+_versions = {}
+_versions_checked_at = {}
+_compacted = {}
+_archived = {}
+_version_lock = threading.Lock()
+
+@traced
+def check_data_versions():
+    """
+    Read the current tenant's version of every table. Tables changed since
+    the last check get their snapshot marked dirty. Returns
+    {table_name: version}. If the warehouse is failing, the versions from
+    the last good check are kept (so cached results are served, stale) and
+    returned.
+    """
+    tenant_id = current_tenant()
+    query = f"""
+    SELECT table_name, MAX(version) AS version, MAX(compacted_through) AS compacted_through,
+           MAX(archived_before) AS archived_before
+    FROM `{PROJECT_ID}.{DATASET_ID}.{VERSIONS_TABLE_NAME}`
+    WHERE {_VERSION_ROWS}
+    GROUP BY table_name
+    """
+    try:
+        df = run_query(query, job_config=_tenant_config(), retry=True).to_dataframe()
+    except Exception as exc:
+        if not (isinstance(exc, WarehouseUnavailable) or is_transient(exc)):
+            raise
+        with _version_lock:
+            known = dict(_versions.get(tenant_id) or {})
+            checked_at = _versions_checked_at.get(tenant_id)
+        budget_trace.annotate(cache="stale", stale_since=checked_at and checked_at.isoformat())
+        return known
+    current = {name: 0 for name in (CATS_TABLE_NAME, FACT_TABLE_NAME, DEBT_TABLE_NAME,
+                                    SERIES_TABLE_NAME, SERIES_EXCEPTIONS_TABLE_NAME, ENVELOPE_TABLE_NAME,
+                                    CARDS_TABLE_NAME)}
+    compacted = {}
+    archived = None
+    for name, version, compacted_through, archived_before in df.itertuples(index=False, name=None):
+        current[name] = int(version)
+        if compacted_through is not None and not pd.isna(compacted_through):
+            compacted[name] = _utc_timestamp(compacted_through)
+        if name == FACT_TABLE_NAME and archived_before is not None and not pd.isna(archived_before):
+            archived = pd.Timestamp(archived_before).date()
+    with _version_lock:
+        _versions_checked_at[tenant_id] = datetime.now(timezone.utc)
+        _compacted[tenant_id] = compacted
+        _archived[tenant_id] = archived
+        previous = _versions.get(tenant_id) or {}
+        changed = [name for name, version in current.items() if previous.get(name) != version]
+        _versions[tenant_id] = current
+    if changed:
+        _results.discard(tenant_id, lambda key: any(name in changed for name in key[0]))
+    if previous:
+        for name in changed:
+            _mark_snapshot_dirty(name)
+    return dict(current)
+
+def _current_version(table_name):
+    with _version_lock:
+        versions = _versions.get(current_tenant())
+        return None if versions is None else versions.get(table_name)
+
+def _current_versions(table_names):
+    """The tables' versions as a tuple, or None if any is unknown."""
+    versions = tuple(_current_version(name) for name in table_names)
+    return None if None in versions else versions
+
+def _versioned(*table_names):
+    """
+    Cache a load function's result under the current version of the
+    table(s) it reads. Callers get a shallow copy; copy-on-write (see
+    budget_dataset.py) means modifying it copies the touched columns and
+    never the cached frame.
+    """
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args):
+            tenant_id = current_tenant()
+            version = _current_versions(table_names)
+            key = (table_names, fn.__name__, args, version)
+            if version is not None:
+                cached = _results.get(tenant_id, key)
+                if cached is not None:
+                    budget_trace.annotate(cache="hit")
+                    return cached.copy(deep=False)
+            stale_reads = _stale_reads.get()
+            df = fn(*args)
+            # A write during the fetch dropped the version, or the data is
+            # a stale fallback: don't cache
+            if (version is not None and _current_versions(table_names) == version
+                    and _stale_reads.get() == stale_reads):
+                _results.put(tenant_id, key, df)
+                return df.copy(deep=False)
+            return df
+        return wrapper
+    return decorate
+
+def _bump_version(table_name, compacted_through=None, archived_before=None):
+    tenant_id = current_tenant()
+    with _version_lock:
+        versions = _versions.get(tenant_id)
+        known = versions.pop(table_name, None) if versions is not None else None
+    now = datetime.now(timezone.utc)
+    version = max(time.time_ns() // 1000, (known or 0) + 1)
+    run_append([{
+        "tenant_id": tenant_id,
+        "table_name": table_name,
+        "version": version,
+        "updated_at": now.isoformat(),
+        "compacted_through": compacted_through.isoformat() if compacted_through is not None else None,
+        "archived_before": archived_before.isoformat() if archived_before is not None else None,
+    }], f"{PROJECT_ID}.{DATASET_ID}.{VERSIONS_TABLE_NAME}")
+    if known is not None:
+        _advance_in_place_indexes(tenant_id, table_name, known, version)
+
+@traced
+def compact_data_versions():
+    """
+    Replace the current tenant's settled data_versions rows with one row
+    per table holding their newest version and watermarks; settled rows from
+    before tenancy are folded into DEFAULT_TENANT's. Returns the number of
+    rows removed.
+    """
+    versions_id = f"{PROJECT_ID}.{DATASET_ID}.{VERSIONS_TABLE_NAME}"
+    config = _tenant_config(bigquery.ScalarQueryParameter(
+        "settled", "TIMESTAMP", datetime.now(timezone.utc) - VERSION_ROWS_SETTLE))
+    settled = f"SELECT * FROM `{versions_id}` WHERE {_VERSION_ROWS} AND updated_at < @settled"
+    counted = run_query(f"""
+    SELECT COUNT(*) AS row_count, COUNT(DISTINCT table_name) AS tables FROM ({settled}) AS settled_rows
+    """, job_config=config).to_dataframe().iloc[0]
+    removed = int(counted["row_count"]) - int(counted["tables"])
+    if removed <= 0:
+        return 0
+    # the versions do not change, so nothing is bumped and no cache drops
+    run_query(f"""
+    BEGIN TRANSACTION;
+    CREATE TEMP TABLE latest_versions AS
+      SELECT table_name, MAX(version) AS version, MAX(updated_at) AS updated_at,
+             MAX(compacted_through) AS compacted_through, MAX(archived_before) AS archived_before
+      FROM ({settled}) AS settled_rows
+      GROUP BY table_name;
+    DELETE FROM `{versions_id}` WHERE {_VERSION_ROWS} AND updated_at < @settled;
+    INSERT INTO `{versions_id}`
+      (tenant_id, table_name, version, updated_at, compacted_through, archived_before)
+    SELECT @tenant_id, table_name, version, updated_at, compacted_through, archived_before FROM latest_versions;
+    DROP TABLE latest_versions;
+    COMMIT TRANSACTION;
+    """, job_config=config)
+    budget_trace.annotate(rows_removed=removed)
+    return removed
+
+def _advance_in_place_indexes(tenant_id, table_name, known, version):
+    """
+    Indexes this process updates in place on its own writes (dimension
+    index, search index) move from the version before the write to the one
+    the write produced, so the next check_data_versions() keeps them unless
+    another session wrote too.
+    """
+    for indexes, lock in _IN_PLACE_INDEXES.get(table_name, ()):
+        with lock:
+            cached = indexes.get(tenant_id)
+            if cached is not None and cached[0] == known:
+                cached[0] = version
+
+def _table_written(table_name):
+    """Called by every writer after its job finished."""
+    _mark_snapshot_dirty(table_name)
+    _bump_version(table_name)
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Query cost guardrails
+#
+# Reads are dry-run first to estimate bytes scanned (one extra, unbilled
+# job per read); a read with a last good result uses the bytes it scanned
+# then as its estimate instead, so repeated reads skip the dry run. Actual
+# bytes are added
+# to a per-session counter (kept in the session's st.session_state) and a
+# process-wide per-day counter. A read that would push either past its
+# limit is answered from the last good result of the same query instead;
+# with nothing cached, QueryBudgetExceeded is raised. Writes are always
+# allowed but still counted. Last good results are kept per tenant in the
+# result cache (_results), under its byte limit, and survive version
+# changes; they are handed out as shallow copy-on-write copies.
+#
+# Every warehouse call has a timeout and goes through one process-wide
+# circuit breaker (budget_resilience.py); reads are retried with jittered
+# backoff. When the warehouse keeps failing, reads are served stale from
+# the same last-good results (stale-while-revalidate): while the breaker
+# is open they are answered at once, and a background probe refreshes them
+# once it half-opens. Stale spans carry stale_since, which the app turns
+# into a banner. Writes are never served stale; only the idempotent ones
+# (run_merge) are retried.
+# ─────────────────────────────────────────────────────────────────────────────
+SESSION_SCAN_LIMIT_BYTES = 2 * 1024**3
+DAILY_SCAN_LIMIT_BYTES = 20 * 1024**3
+QUERY_TIMEOUT_S = 30
+LOAD_TIMEOUT_S = 120
+READ_ATTEMPTS = 3
+
+_scan_limits = {"session": SESSION_SCAN_LIMIT_BYTES, "daily": DAILY_SCAN_LIMIT_BYTES}
+_daily_scans = {}
+_scan_lock = threading.Lock()
+_session_counter = contextvars.ContextVar("budget_session_scans", default=None)
+_timeouts = {"query": QUERY_TIMEOUT_S, "load": LOAD_TIMEOUT_S}
+_read_attempts = READ_ATTEMPTS
+_breaker = CircuitBreaker()
+_revalidating = set()
+_stale_reads = contextvars.ContextVar("budget_stale_reads", default=0)
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+def configure_resilience(query_timeout_s=QUERY_TIMEOUT_S, load_timeout_s=LOAD_TIMEOUT_S,
+                         read_attempts=READ_ATTEMPTS, failure_threshold=None, reset_timeout_s=None):
+    global _read_attempts
+    _timeouts["query"] = query_timeout_s
+    _timeouts["load"] = load_timeout_s
+    _read_attempts = max(1, int(read_attempts))
+    if failure_threshold:
+        _breaker.failure_threshold = failure_threshold
+    if reset_timeout_s:
+        _breaker.reset_timeout_s = reset_timeout_s
+
+def warehouse_state():
+    """The circuit breaker's state: "closed", "open" or "half_open"."""
+    return _breaker.state
+
+class ScanCounter:
+    """Bytes scanned and queries run by one browser session."""
+    def __init__(self):
+        self.bytes = 0
+        self.queries = 0
+
+def configure_scan_limits(session_bytes=SESSION_SCAN_LIMIT_BYTES, daily_bytes=DAILY_SCAN_LIMIT_BYTES):
+    """A limit of None or 0 disables that check (and the dry run, if both are off)."""
+    _scan_limits["session"] = session_bytes or None
+    _scan_limits["daily"] = daily_bytes or None
+
+def set_session_counter(counter):
+    _session_counter.set(counter)
+
+def scan_usage():
+    counter = _session_counter.get()
+    with _scan_lock:
+        daily = _daily_scans.get(date.today(), 0)
+    return {
+        "session_bytes": counter.bytes if counter is not None else 0,
+        "session_queries": counter.queries if counter is not None else 0,
+        "session_limit": _scan_limits["session"],
+        "daily_bytes": daily,
+        "daily_limit": _scan_limits["daily"],
+    }
+
+def clear_caches():
+    """Drop every process-wide cached result (tests and benchmarks)."""
+    with _scan_lock:
+        _daily_scans.clear()
+        _revalidating.clear()
+    _breaker.reset()
+    with _dimension_lock:
+        _dimension_indexes.clear()
+    with _search_lock:
+        _search_indexes.clear()
+    with _fact_dataset_lock:
+        _fact_datasets.clear()
+    with _envelope_lock:
+        _envelope_ledgers.clear()
+    with _card_lock:
+        _card_indexes.clear()
+    with _anomaly_lock:
+        _anomaly_scans.clear()
+    with _version_lock:
+        _versions.clear()
+        _versions_checked_at.clear()
+        _compacted.clear()
+        _archived.clear()
+    with _compaction_lock:
+        _compaction_attempts.clear()
+    _results.clear()
+    with _snapshot_lock:
+        _snapshots.clear()
+
+def _record_scan(n_bytes):
+    counter = _session_counter.get()
+    if counter is not None:
+        counter.bytes += n_bytes
+        counter.queries += 1
+    today = date.today()
+    with _scan_lock:
+        for day in [d for d in _daily_scans if d != today]:
+            del _daily_scans[day]
+        _daily_scans[today] = _daily_scans.get(today, 0) + n_bytes
+
+def _check_scan_budget(estimate):
+    usage = scan_usage()
+    if usage["session_limit"] and usage["session_bytes"] + estimate > usage["session_limit"]:
+        raise QueryBudgetExceeded(
+            f"Session scan budget of {usage['session_limit']:,} bytes reached "
+            f"({usage['session_bytes']:,} used, query needs {estimate:,})"
+        )
+    if usage["daily_limit"] and usage["daily_bytes"] + estimate > usage["daily_limit"]:
+        raise QueryBudgetExceeded(
+            f"Daily scan budget of {usage['daily_limit']:,} bytes reached "
+            f"({usage['daily_bytes']:,} used, query needs {estimate:,})"
+        )
+
+def _query_key(query, job_config):
+    """Result cache key of a read's last good result: no tables, so version changes keep it."""
+    params = getattr(job_config, "query_parameters", None) or []
+    return ((), "last_good", query, tuple((p.name, str(p.value)) for p in params))
+
+def estimate_bytes(query, job_config=None):
+    """Dry-run a query and return the bytes it would scan (free in BigQuery)."""
+    params = getattr(job_config, "query_parameters", None) or []
+    dry_config = bigquery.QueryJobConfig(dry_run=True, use_query_cache=False,
+                                         query_parameters=list(params))
+    job = _warehouse_call(lambda: client.query(query, job_config=dry_config, timeout=_timeouts["query"]),
+                          retry=True)
+    return getattr(job, "total_bytes_processed", 0) or 0
+
+def _warehouse_call(call, retry=False):
+    """call() through the circuit breaker; retry=True only for idempotent reads."""
+    if retry:
+        return call_with_retries(lambda: _breaker.call(call), attempts=_read_attempts)
+    return _breaker.call(call)
+
+def _wait(job, timeout):
+    """job.result(timeout), cancelling the job if it does not finish in time."""
+    try:
+        job.result(timeout=timeout)
+    except TimeoutError:
+        job.cancel()
+        raise
+    return job
+
+def run_query(query, job_config=None, retry=False):
+    """
+    Run a query or DML statement to completion, count its bytes against
+    the scan budgets and record bytes processed and cache hit/miss on the
+    current trace span. Pass retry=True only for reads (SELECT) and
+    statements that are safe to repeat (run_merge).
+    """
+    job = _warehouse_call(lambda: _wait(client.query(query, job_config=job_config, timeout=_timeouts["query"]),
+                                        _timeouts["query"]), retry=retry)
+    bytes_processed = getattr(job, "total_bytes_processed", 0) or 0
+    cache_hit = getattr(job, "cache_hit", None)
+    _record_scan(bytes_processed)
+    budget_trace.annotate(
+        bytes_processed=bytes_processed, jobs=1,
+        cache=None if cache_hit is None else ("hit" if cache_hit else "miss"),
+    )
+    return job
+
+def read_query(query, job_config=None):
+    """
+    Run a SELECT under the scan budgets and return a DataFrame. Falls back
+    to the last good result of the same query when over budget, and when
+    the warehouse is failing (marking the span stale).
+    """
+    tenant_id = current_tenant()
+    key = _query_key(query, job_config)
+    cached = _results.get(tenant_id, key)
+    if cached is not None and _breaker.state != "closed":
+        # Don't wait on a failing warehouse; one probe revalidates in the background
+        if _breaker.probe_due():
+            _revalidate(query, job_config, tenant_id, key)
+        return _serve_stale(cached)
+    try:
+        df, scanned = _fresh_read(query, job_config, None if cached is None else cached[2])
+    except QueryBudgetExceeded:
+        if cached is None:
+            raise
+        budget_trace.annotate(cache="fallback")
+        return cached[0].copy(deep=False)
+    except Exception as exc:
+        if cached is None or not (isinstance(exc, WarehouseUnavailable) or is_transient(exc)):
+            raise
+        return _serve_stale(cached)
+    _remember_result(tenant_id, key, df, scanned)
+    return df.copy(deep=False)
+
+def _fresh_read(query, job_config, known_bytes=None):
+    """
+    (DataFrame, bytes scanned) of a read under the scan budgets.
+    known_bytes, what the same read scanned last time, replaces the dry run.
+    """
+    if _scan_limits["session"] or _scan_limits["daily"]:
+        estimate = estimate_bytes(query, job_config) if known_bytes is None else known_bytes
+        budget_trace.annotate(estimated_bytes=estimate)
+        _check_scan_budget(estimate)
+    job = run_query(query, job_config, retry=True)
+    return job.to_dataframe(), getattr(job, "total_bytes_processed", 0) or 0
+
+def _remember_result(tenant_id, key, df, scanned):
+    _results.put(tenant_id, key, (df, datetime.now(timezone.utc), scanned))
+
+def _serve_stale(cached):
+    df, fetched_at, _ = cached
+    budget_trace.annotate(cache="stale", stale_since=fetched_at.isoformat())
+    _stale_reads.set(_stale_reads.get() + 1)
+    return df.copy(deep=False)
+
+def _revalidate(query, job_config, tenant_id, key):
+    """Refresh a last-good result on a background thread (one per query at a time)."""
+    with _scan_lock:
+        if key in _revalidating:
+            return
+        _revalidating.add(key)
+
+    def refresh():
+        try:
+            _remember_result(tenant_id, key, *_fresh_read(query, job_config))
+        except Exception:
+            pass  # still failing: the breaker has recorded it
+        finally:
+            with _scan_lock:
+                _revalidating.discard(key)
+    threading.Thread(target=contextvars.Context().run, args=(refresh,), daemon=True,
+                     name="read-revalidation").start()
+
+def run_load(df, table_id):
+    """
+    Append a DataFrame to a table with a load job and wait for it. Rows
+    are stamped with the current tenant and updated_at here so every
+    writer gets them.
+    """
+    df = df.assign(tenant_id=current_tenant(), updated_at=pd.Timestamp.now(tz="UTC"))
+    job = _warehouse_call(lambda: _wait(client.load_table_from_dataframe(df, table_id,
+        job_config=bigquery.LoadJobConfig(write_disposition="WRITE_APPEND")), _timeouts["load"]))
+    budget_trace.annotate(jobs=1, rows_written=len(df))
+    _table_written(table_id.rsplit(".", 1)[-1])
+    return job
+
+def run_append(rows, table_id):
+    """
+    Stream JSON-ready row dicts into a table (insertAll): no load job and
+    no DML, so it is the cheapest and fastest way to add a few rows.
+    """
+    errors = _warehouse_call(lambda: client.insert_rows_json(table_id, rows, timeout=_timeouts["query"]))
+    if errors:
+        raise RuntimeError(f"Streaming insert into {table_id} failed: {errors}")
+    budget_trace.annotate(jobs=1, rows_written=len(rows))
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Idempotent writes
+#
+# New rows are written with MERGE ... WHEN NOT MATCHED THEN INSERT on
+# (tenant_id, rowid), so writing the same rows twice inserts them once. A
+# write is made repeatable by giving its rows ids derived from an
+# idempotency key: idempotency_key() hashes whatever identifies the logical
+# write (the app uses a form's submission token plus its values), so a
+# retried call, a rerun that replays a submit, or a double-click that
+# interrupts the first run all produce the same rowids. That makes these
+# writes safe to retry like reads. Rows are passed as query parameters,
+# MERGE_CHUNK_ROWS per statement; each chunk is idempotent on its own, so a
+# batch that failed half-way is simply written again. Edits and deletes
+# stay journaled (see below); MERGE only ever inserts. A row the journal
+# has an event for was written before, even if compaction has since
+# deleted it from the base table, so journaled tables also skip those
+# rowids (the journal is never trimmed) and a replay cannot bring a
+# deleted row back. The table's version is bumped once per batch.
+# ─────────────────────────────────────────────────────────────────────────────
+IDEMPOTENCY_NAMESPACE = uuid.UUID("6f1c5a0e-3f0b-4c8e-9a55-2d7b1e4c9b10")
+MERGE_CHUNK_ROWS = 200
+
+def idempotency_key(*parts):
+    """A stable id for one logical write: the same parts always give the same key."""
+    return str(uuid.uuid5(IDEMPOTENCY_NAMESPACE, json.dumps([str(part) for part in parts])))
+
+def derived_rowid(key, n):
+    """The rowid of the n-th row written under an idempotency key."""
+    return str(uuid.uuid5(IDEMPOTENCY_NAMESPACE, f"{key}/{n}"))
+
+def _param_value(value, col_type):
+    if value is None or (not isinstance(value, (list, dict)) and pd.isna(value)):
+        return None
+    if col_type == "DATE":
+        return pd.Timestamp(value).date()
+    if col_type == "TIMESTAMP":
+        return pd.Timestamp(value).to_pydatetime()
+    if col_type == "INT64":
+        return int(value)
+    if col_type == "FLOAT64":
+        return float(value)
+    return str(value)
+
+def run_merge(df, table_name):
+    """
+    Insert the DataFrame's rows whose rowid the table (or, for a journaled
+    table, its journal) does not have yet, stamped with the current tenant
+    and updated_at. Returns the number of rows inserted (0 when they were
+    all written before).
+
+    The table's version is bumped even when nothing was inserted: a MERGE
+    that reports 0 rows may be the replay of one that committed but whose
+    reply was lost (a retried chunk, or a caller retrying after an error),
+    and nothing else would tell the caches about those rows.
+    """
+    if df.empty:
+        return 0
+    table_id = f"{PROJECT_ID}.{DATASET_ID}.{table_name}"
+    df = df.assign(tenant_id=current_tenant(), updated_at=pd.Timestamp.now(tz="UTC"))
+    columns = [(name, col_type) for name, col_type in MERGE_COLUMNS[table_name] if name in df.columns]
+    names = ", ".join(name for name, _ in columns)
+    written_before = ""
+    if table_name in JOURNALED_COLUMNS:
+        written_before = (f"WHERE rowid NOT IN (SELECT rowid FROM `{_journal_id(table_name)}` "
+                          f"WHERE tenant_id = @tenant_id)")
+    inserted = 0
+    for start in range(0, len(df), MERGE_CHUNK_ROWS):
+        params, selects = [bigquery.ScalarQueryParameter("tenant_id", "STRING", current_tenant())], []
+        for n, record in enumerate(df.iloc[start:start + MERGE_CHUNK_ROWS].to_dict("records")):
+            fields = []
+            for name, col_type in columns:
+                params.append(bigquery.ScalarQueryParameter(f"r{n}_{name}", col_type,
+                                                            _param_value(record[name], col_type)))
+                fields.append(f"@r{n}_{name} AS {name}")
+            selects.append(f"SELECT {', '.join(fields)}")
+        union_sql = "\n      UNION ALL ".join(selects)
+        job = run_query(f"""
+        MERGE `{table_id}` AS target
+        USING (
+          SELECT * FROM (
+            {union_sql}
+          ) AS batch
+          {written_before}
+        ) AS source
+        ON target.tenant_id = source.tenant_id AND target.rowid = source.rowid
+        WHEN NOT MATCHED THEN
+          INSERT ({names}) VALUES ({", ".join(f"source.{name}" for name, _ in columns)})
+        """, job_config=bigquery.QueryJobConfig(query_parameters=params), retry=True)
+        inserted += job.num_dml_affected_rows or 0
+    budget_trace.annotate(rows_written=inserted)
+    _table_written(table_name)
+    return inserted
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Change journal
+#
+# Edits and deletes of fact and debt rows are not UPDATE/DELETE DML. Each
+# one is streamed into <table>_journal as events holding every changed
+# row's new image (op "upsert") or a tombstone (op "delete"), plus its
+# before-image as JSON for undo. Reads go through current_rows_sql(): base
+# rows without a newer event, plus the latest upsert image per row among
+# the events after the table's compacted_through watermark.
+# compact_journal() folds settled events into the base table and moves the
+# watermark; the journal itself is never trimmed, so it is the full change
+# history. Re-applying an event gives the same row, so a reader holding an
+# older watermark still sees the right state.
+# ─────────────────────────────────────────────────────────────────────────────
+JOURNAL_SUFFIX = "_journal"
+# Events newer than this are left in the journal by compaction, so a late
+# streaming insert stamped a little earlier is never skipped
+JOURNAL_SETTLE = timedelta(minutes=5)
+JOURNAL_COMPACT_INTERVAL = timedelta(hours=1)
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+JOURNALED_COLUMNS = {
+    # series_id links the rows written together as one series (a payoff plan)
+    FACT_TABLE_NAME: [
+        ("rowid", "STRING"), ("date", "DATE"), ("type", "STRING"), ("amount", "FLOAT64"),
+        ("category", "STRING"), ("budget_item", "STRING"), ("credit_card", "STRING"), ("note", "STRING"),
+        ("series_id", "STRING"), ("updated_at", "TIMESTAMP"), ("tenant_id", "STRING"),
+    ],
+    DEBT_TABLE_NAME: [
+        ("rowid", "STRING"), ("debt_name", "STRING"), ("current_balance", "FLOAT64"), ("due_date", "STRING"),
+        ("minimum_payment", "FLOAT64"), ("payoff_plan_date", "DATE"),
+        ("updated_at", "TIMESTAMP"), ("tenant_id", "STRING"),
+    ],
+    # rowid is the series id
+    SERIES_TABLE_NAME: [
+        ("rowid", "STRING"), ("start_date", "DATE"), ("cadence", "STRING"), ("occurrences", "INT64"),
+        ("end_date", "DATE"), ("type", "STRING"), ("amount", "FLOAT64"), ("category", "STRING"),
+        ("budget_item", "STRING"), ("credit_card", "STRING"), ("note", "STRING"),
+        ("updated_at", "TIMESTAMP"), ("tenant_id", "STRING"),
+    ],
+    # rowid is occurrence_rowid(series_id, occurrence); action is "override" or "skip"
+    SERIES_EXCEPTIONS_TABLE_NAME: [
+        ("rowid", "STRING"), ("series_id", "STRING"), ("occurrence", "INT64"), ("action", "STRING"),
+        ("date", "DATE"), ("amount", "FLOAT64"), ("note", "STRING"),
+        ("updated_at", "TIMESTAMP"), ("tenant_id", "STRING"),
+    ],
+    # rowid is envelope_rowid(category, year_month), year_month "YYYY-MM"
+    ENVELOPE_TABLE_NAME: [
+        ("rowid", "STRING"), ("year_month", "STRING"), ("category", "STRING"), ("target", "FLOAT64"),
+        ("updated_at", "TIMESTAMP"), ("tenant_id", "STRING"),
+    ],
+    # rowid is the card name; debt_name links the card to its fact_debt_items row
+    CARDS_TABLE_NAME: [
+        ("rowid", "STRING"), ("card_name", "STRING"), ("closing_day", "INT64"), ("debt_name", "STRING"),
+        ("updated_at", "TIMESTAMP"), ("tenant_id", "STRING"),
+    ],
+}
+# Columns run_merge() writes: the journaled tables' plus the dimension table's
+MERGE_COLUMNS = dict(JOURNALED_COLUMNS, **{
+    CATS_TABLE_NAME: [
+        ("rowid", "STRING"), ("type", "STRING"), ("category", "STRING"), ("budget_item", "STRING"),
+        ("updated_at", "TIMESTAMP"), ("tenant_id", "STRING"),
+    ],
+})
+JOURNAL_EVENT_COLUMNS = [
+    ("event_id", "STRING"), ("change_id", "STRING"), ("op", "STRING"),
+    ("event_at", "TIMESTAMP"), ("before_json", "STRING"),
+]
+
+_auto_compact = False
+_compaction_attempts = {}
+_compaction_lock = threading.Lock()
+_session_changes = contextvars.ContextVar("budget_session_changes", default=None)
+
+def configure_journal(auto_compact=True):
+    global _auto_compact
+    _auto_compact = auto_compact
+
+def set_session_changes(changes):
+    """
+    changes is a list kept in the session's st.session_state; every
+    journaled change the session makes is appended to it for undo.
+    """
+    _session_changes.set(changes)
+
+def _journal_id(table_name):
+    return f"{PROJECT_ID}.{DATASET_ID}.{table_name}{JOURNAL_SUFFIX}"
+
+def _utc_timestamp(value):
+    value = pd.Timestamp(value)
+    return value.tz_localize("UTC") if value.tzinfo is None else value.tz_convert("UTC")
+
+def _compacted_through(table_name, tenant_id=None):
+    """The watermark from the last version check, or EPOCH (replay the whole journal)."""
+    with _version_lock:
+        return _compacted.get(tenant_id or current_tenant(), {}).get(table_name, EPOCH)
+
+def _state_config(table_name, *params):
+    """Parameters for current_rows_sql(table_name), plus any extra ones."""
+    return _tenant_config(
+        bigquery.ScalarQueryParameter("compacted_through", "TIMESTAMP", _compacted_through(table_name)),
+        *params,
+    )
+
+def _journaled_source(table_name, tenant_id):
+    """Snapshot source (see budget_snapshot.py) for a journaled table."""
+    return current_rows_sql(table_name), [
+        bigquery.ScalarQueryParameter("tenant_id", "STRING", tenant_id),
+        bigquery.ScalarQueryParameter("compacted_through", "TIMESTAMP", _compacted_through(table_name, tenant_id)),
+    ]
+
+def current_rows_sql(table_name):
+    """
+    SELECT of the table's current rows for @tenant_id, given
+    @compacted_through (see _state_config()).
+    """
+    cols = ", ".join(name for name, _ in JOURNALED_COLUMNS[table_name])
+    return f"""
+    SELECT {cols} FROM `{PROJECT_ID}.{DATASET_ID}.{table_name}`
+    WHERE tenant_id = @tenant_id
+      AND rowid NOT IN (
+        SELECT rowid FROM `{_journal_id(table_name)}`
+        WHERE tenant_id = @tenant_id AND event_at > @compacted_through)
+    UNION ALL
+    SELECT {cols} FROM (
+      SELECT *, ROW_NUMBER() OVER (PARTITION BY rowid ORDER BY event_at DESC, event_id DESC) AS event_rank
+      FROM `{_journal_id(table_name)}`
+      WHERE tenant_id = @tenant_id AND event_at > @compacted_through
+    ) AS latest_events
+    WHERE event_rank = 1 AND op = 'upsert'
+    """
+
+def _json_value(value, col_type):
+    if value is None or value is pd.NaT or (isinstance(value, float) and value != value):
+        return None
+    if col_type == "DATE":
+        return pd.Timestamp(value).date().isoformat()
+    if col_type == "TIMESTAMP":
+        return _utc_timestamp(value).isoformat()
+    if col_type == "FLOAT64":
+        return float(value)
+    if col_type == "INT64":
+        return int(value)
+    return value
+
+def _current_rows(table_name, where, *params):
+    """Current rows matching a WHERE clause, as dicts (read fresh, for writers)."""
+    query = f"""
+    SELECT * FROM ({current_rows_sql(table_name)}) AS current_rows
+    WHERE {where}
+    """
+    job = run_query(query, job_config=_state_config(table_name, *params), retry=True)
+    return job.to_dataframe().to_dict("records")
+
+def _row_param(row_id):
+    return bigquery.ScalarQueryParameter("rowid", "STRING", row_id)
+
+def _append_changes(table_name, befores, afters, label, record=True):
+    """
+    Journal one change: for each before-image, the matching after-image
+    (None deletes the row). Returns the change_id, or None when there was
+    nothing to change.
+    """
+    if not befores:
+        return None
+    columns = JOURNALED_COLUMNS[table_name]
+    now = datetime.now(timezone.utc)
+    change_id = str(uuid.uuid4())
+    events = []
+    for before, after in zip(befores, afters):
+        image = dict(after if after is not None else before)
+        image.update(tenant_id=current_tenant(), updated_at=now)
+        event = {name: _json_value(image.get(name), col_type) for name, col_type in columns}
+        event.update({
+            "event_id": str(uuid.uuid4()),
+            "change_id": change_id,
+            "op": "upsert" if after is not None else "delete",
+            "event_at": now.isoformat(),
+            "before_json": json.dumps(
+                None if before is None else {name: _json_value(before.get(name), col_type)
+                                             for name, col_type in columns}),
+        })
+        events.append(event)
+    run_append(events, _journal_id(table_name))
+    _table_written(table_name)
+    changes = _session_changes.get()
+    if record and changes is not None:
+        changes.append({"change_id": change_id, "table_name": table_name, "label": label,
+                        "rows": len(events), "at": now.isoformat()})
+    return change_id
+
+@traced
+def undo_change(table_name, change_id, label="change"):
+    """Journal the before-images of a change's events, restoring those rows."""
+    query = f"""
+    SELECT * FROM `{_journal_id(table_name)}`
+    WHERE tenant_id = @tenant_id AND change_id = @change_id
+    """
+    events = run_query(query, job_config=_tenant_config(
+        bigquery.ScalarQueryParameter("change_id", "STRING", change_id))).to_dataframe()
+    columns = [name for name, _ in JOURNALED_COLUMNS[table_name]]
+    records = events.to_dict("records")
+    befores = [{name: event[name] for name in columns} for event in records]
+    afters = [json.loads(event["before_json"]) if event["before_json"] else None for event in records]
+    _append_changes(table_name, befores, afters, f"Undo: {label}", record=False)
+    if table_name == FACT_TABLE_NAME:
+        restored = pd.DataFrame([after for after in afters if after is not None])
+        _update_fact_indexes("remove_rows", [before["rowid"] for before in befores])
+        if not restored.empty:
+            _update_fact_indexes("add_rows", restored.drop(columns=["updated_at", "tenant_id"]))
+
+def undo_last_change():
+    """Undo the session's most recent journaled change; returns its label or None."""
+    changes = _session_changes.get()
+    if not changes:
+        return None
+    change = changes.pop()
+    undo_change(change["table_name"], change["change_id"], change["label"])
+    return change["label"]
+
+@traced
+def load_change_history(table_name, limit=50):
+    """The tenant's newest journal events for a table, newest first."""
+    query = f"""
+    SELECT event_at, op, change_id, rowid, before_json
+    FROM `{_journal_id(table_name)}`
+    WHERE tenant_id = @tenant_id
+    ORDER BY event_at DESC, event_id DESC
+    LIMIT {int(limit)}
+    """
+    return read_query(query, job_config=_tenant_config())
+
+@traced
+def compact_journal(table_name):
+    """
+    Fold the current tenant's settled events (older than JOURNAL_SETTLE)
+    into the base table, then move the watermark past them. Returns the
+    number of settled events. Two compactions racing are harmless: the
+    insert skips rows that are already back in the base table.
+    """
+    check_data_versions()
+    since = _compacted_through(table_name)
+    upto = datetime.now(timezone.utc) - JOURNAL_SETTLE
+    if upto <= since:
+        return 0
+    base_id = f"{PROJECT_ID}.{DATASET_ID}.{table_name}"
+    cols = ", ".join(name for name, _ in JOURNALED_COLUMNS[table_name])
+    config = _tenant_config(bigquery.ScalarQueryParameter("compacted_through", "TIMESTAMP", since),
+                            bigquery.ScalarQueryParameter("upto", "TIMESTAMP", upto))
+    settled = f"""
+      SELECT * FROM `{_journal_id(table_name)}`
+      WHERE tenant_id = @tenant_id AND event_at > @compacted_through AND event_at <= @upto
+    """
+    count = run_query(f"SELECT COUNT(*) AS events FROM ({settled}) AS settled",
+                      job_config=config).to_dataframe()["events"].iloc[0]
+    if not count:
+        return 0
+    run_query(f"""
+    DELETE FROM `{base_id}`
+    WHERE tenant_id = @tenant_id AND rowid IN (SELECT rowid FROM ({settled}) AS settled)
+    """, job_config=config)
+    run_query(f"""
+    INSERT INTO `{base_id}` ({cols})
+    SELECT {cols} FROM (
+      SELECT *, ROW_NUMBER() OVER (PARTITION BY rowid ORDER BY event_at DESC, event_id DESC) AS event_rank
+      FROM ({settled}) AS settled
+    ) AS latest_events
+    WHERE event_rank = 1 AND op = 'upsert'
+      AND rowid NOT IN (SELECT rowid FROM `{base_id}` WHERE tenant_id = @tenant_id)
+    """, job_config=config)
+    _mark_snapshot_dirty(table_name)
+    _bump_version(table_name, compacted_through=upto)
+    return int(count)
+
+def maybe_compact_journals():
+    """
+    Compact the current tenant's journals on a background thread, at most
+    once per JOURNAL_COMPACT_INTERVAL per process (and only when
+    configure_journal() enabled it).
+    """
+    if not _auto_compact:
+        return
+    tenant_id = current_tenant()
+    now = time.monotonic()
+    with _compaction_lock:
+        last = _compaction_attempts.get(tenant_id)
+        if last is not None and now - last < JOURNAL_COMPACT_INTERVAL.total_seconds():
+            return
+        _compaction_attempts[tenant_id] = now
+
+    def compact():
+        # A fresh context: no session counter and no rerun trace
+        set_tenant(tenant_id)
+        for table_name in JOURNALED_COLUMNS:
+            compact_journal(table_name)
+        compact_data_versions()
+    threading.Thread(target=contextvars.Context().run, args=(compact,), daemon=True,
+                     name=f"journal-compaction-{tenant_id}").start()
+
+# ─────────────────────────────────────────────────────────────────────────────
+# 4) Dimension Table Functions (Categories/Items)
+# ─────────────────────────────────────────────────────────────────────────────
+@traced
+@_versioned(CATS_TABLE_NAME)
+def load_dimension_rows(type_val):
+    frame = _snapshot_frame(CATS_TABLE_NAME)
+    if frame is not None:
+        rows = frame[frame["type"].str.lower() == type_val.lower()]
+        return rows[["rowid", "type", "category", "budget_item"]].reset_index(drop=True)
+    query = f"""
+    SELECT rowid, type, category, budget_item
+    FROM `{PROJECT_ID}.{DATASET_ID}.{CATS_TABLE_NAME}`
+    WHERE tenant_id = @tenant_id AND LOWER(type) = LOWER(@type_val)
+    """
+    return read_query(query, job_config=_tenant_config(
+        bigquery.ScalarQueryParameter("type_val", "STRING", type_val)))
+
+# Process-wide index of each tenant's dimension table:
+#   {"income": {"Category": ["Item A", "Item B"], ...}, "expense": {...}}
+# Categories are kept in sorted key order and items in sorted lists, so the
+# transaction form pickers need no query and no DataFrame work. An index is
+# rebuilt when check_data_versions() sees a new dimension table version.
+# _dimension_indexes maps tenant -> [version, index], least recently used
+# first, and holds as many tenants as the result cache.
+_dimension_indexes = OrderedDict()
+_dimension_lock = threading.Lock()
+
+def _index_dimension_row(index, type_val, category_val, budget_item_val, keep_sorted=True):
+    type_key = type_val.lower()
+    categories = index.setdefault(type_key, {})
+    if category_val not in categories:
+        categories[category_val] = []
+        if keep_sorted:
+            index[type_key] = dict(sorted(categories.items()))
+            categories = index[type_key]
+    items = categories[category_val]
+    if budget_item_val and budget_item_val not in items:
+        bisect.insort(items, budget_item_val)
+
+@traced
+def load_dimension_index():
+    tenant_id = current_tenant()
+    version = _current_version(CATS_TABLE_NAME)
+    with _dimension_lock:
+        cached = _dimension_indexes.get(tenant_id)
+        if cached is not None and version in (None, cached[0]):
+            _dimension_indexes.move_to_end(tenant_id)
+            budget_trace.annotate(cache="hit")
+            return cached[1]
+    df = _snapshot_frame(CATS_TABLE_NAME)
+    if df is None:
+        query = f"""
+        SELECT type, category, budget_item
+        FROM `{PROJECT_ID}.{DATASET_ID}.{CATS_TABLE_NAME}`
+        WHERE tenant_id = @tenant_id
+        """
+        df = read_query(query, job_config=_tenant_config())
+    df = df[["type", "category", "budget_item"]]
+    index = {}
+    for type_val, category_val, budget_item_val in df.itertuples(index=False, name=None):
+        _index_dimension_row(index, type_val, category_val, budget_item_val, keep_sorted=False)
+    index = {type_key: dict(sorted(categories.items())) for type_key, categories in index.items()}
+    with _dimension_lock:
+        _dimension_indexes[tenant_id] = [version, index]
+        _dimension_indexes.move_to_end(tenant_id)
+        while len(_dimension_indexes) > _results.max_tenants:
+            _dimension_indexes.popitem(last=False)
+    budget_trace.annotate(cache="miss")
+    return index
+
+@traced
+def add_dimension_row(type_val, category_val, budget_item_val, key=None):
+    """key: idempotency key of the submission (see idempotency_key()); None writes a new row."""
+    capital_type = type_val.capitalize()
+    df = pd.DataFrame([{
+        "rowid": key or str(uuid.uuid4()),
+        "type": capital_type,
+        "category": category_val,
+        "budget_item": budget_item_val
+    }])
+    # indexed even when the row was written before (a replay): the
+    # index may not have it yet, and indexing it twice is harmless
+    run_merge(df, CATS_TABLE_NAME)
+    with _dimension_lock:
+        cached = _dimension_indexes.get(current_tenant())
+        if cached is not None:
+            _index_dimension_row(cached[1], type_val, category_val, budget_item_val)
+
+# ─────────────────────────────────────────────────────────────────────────────
+# 5) Fact Table Functions (Budget Planning)
+# ─────────────────────────────────────────────────────────────────────────────
+@traced
+def load_fact_data():
+    """Every current fact row, sorted by date (a view of the shared dataset)."""
+    return fact_dataset().frame.copy(deep=False)
+
+def _read_fact_table():
+    query = f"SELECT * FROM ({current_rows_sql(FACT_TABLE_NAME)}) AS fact_rows"
+    df = read_query(query, job_config=_state_config(FACT_TABLE_NAME))
+    df['date'] = pd.to_datetime(df['date'])
+    return df
+
+def _date_range_config(start_date, end_date):
+    return _state_config(
+        FACT_TABLE_NAME,
+        bigquery.ScalarQueryParameter("start_date", "DATE", start_date),
+        bigquery.ScalarQueryParameter("end_date", "DATE", end_date),
+    )
+
+@traced
+def load_fact_rows(start_date, end_date):
+    """
+    Raw fact rows with start_date <= date <= end_date (both datetime.date),
+    sorted by date, including recurring series occurrences and archived
+    rows (read-only, marked by the archived column). With neither in the
+    range it is a zero-copy view of the shared dataset. Only the
+    transaction list and calendar need individual rows.
+    """
+    rows = fact_dataset().rows(start_date, end_date)
+    extra = [load_series_rows(start_date, end_date)]
+    archived_before = _archived_before()
+    if archived_before is not None and start_date < archived_before:
+        extra.append(load_archived_rows(start_date, end_date))
+    extra = [df for df in extra if not df.empty]
+    if not extra:
+        return rows
+    rows = pd.concat([rows] + extra, ignore_index=True)
+    return rows.sort_values("date", kind="stable", ignore_index=True)
+
+def _rollup(rows, keys):
+    rows = rows.assign(year_month=rows["date"].dt.to_period("M"))
+    df = rows.groupby(["year_month"] + keys, as_index=False)["amount"].sum()
+    return df.sort_values(["year_month"] + keys).reset_index(drop=True)
+
+def _with_series_totals(df, start_date, end_date, keys):
+    """A rollup plus the recurring series occurrences in the range."""
+    occurrences = load_series_rows(start_date, end_date)
+    if occurrences.empty:
+        return df
+    return _rollup(pd.concat([df.assign(date=df["year_month"].dt.to_timestamp()), occurrences]), keys)
+
+def _fact_rollup(start_date, end_date, keys):
+    """
+    SUM(amount) per year_month and keys over the hot rows in the range and
+    the archive summaries of its months (see archive_closed_years()), plus
+    recurring series occurrences. year_month comes back as a monthly
+    pandas Period.
+    """
+    frame = _snapshot_frame(FACT_TABLE_NAME)
+    if frame is not None:
+        rows = pd.concat([_snapshot_dataset(frame).rows(start_date, end_date),
+                          _snapshot_summary_rows(start_date, end_date)], ignore_index=True)
+        df = _rollup(rows, keys)
+        return _with_series_totals(df, start_date, end_date, keys)
+    key_sql = ", ".join(keys)
+    query = f"""
+    SELECT year_month, {key_sql}, SUM(amount) AS amount FROM (
+      SELECT FORMAT_DATE('%Y-%m', date) AS year_month, {key_sql}, amount
+      FROM ({current_rows_sql(FACT_TABLE_NAME)}) AS fact_rows
+      WHERE date BETWEEN @start_date AND @end_date
+      UNION ALL
+      SELECT year_month, {key_sql}, amount
+      FROM `{PROJECT_ID}.{DATASET_ID}.{SUMMARY_TABLE_NAME}`
+      WHERE tenant_id = @tenant_id
+        AND year_month BETWEEN FORMAT_DATE('%Y-%m', @start_date) AND FORMAT_DATE('%Y-%m', @end_date)
+    ) AS monthly_rows
+    GROUP BY year_month, {key_sql}
+    ORDER BY year_month, {key_sql}
+    """
+    df = read_query(query, job_config=_date_range_config(start_date, end_date))
+    df["year_month"] = pd.to_datetime(df["year_month"]).dt.to_period("M")
+    return _with_series_totals(df, start_date, end_date, keys)
+
+@traced
+@_versioned(FACT_TABLE_NAME, SERIES_TABLE_NAME, SERIES_EXCEPTIONS_TABLE_NAME)
+def load_monthly_totals(start_date, end_date):
+    """SUM(amount) per (year_month, type); see _fact_rollup()."""
+    return _fact_rollup(start_date, end_date, ["type"])
+
+@traced
+@_versioned(FACT_TABLE_NAME, SERIES_TABLE_NAME, SERIES_EXCEPTIONS_TABLE_NAME)
+def load_category_totals(start_date, end_date):
+    """SUM(amount) per (year_month, type, category); see _fact_rollup()."""
+    return _fact_rollup(start_date, end_date, ["type", "category"])
+
+@traced
+def save_fact_data(rows_df):
+    """
+    Insert fact rows; rows whose rowid is already stored are skipped, so
+    rowids from an idempotency key make saving the same rows again a no-op.
+    """
+    inserted = run_merge(rows_df, FACT_TABLE_NAME)
+    if rows_df.empty:
+        return inserted
+    if inserted < len(rows_df):
+        # some were written before, maybe by an attempt whose reply was
+        # lost (the indexes never saw them) or since edited or deleted (the
+        # rows passed in are out of date): rebuild from the warehouse
+        _drop_fact_indexes(current_tenant())
+        return inserted
+    _update_fact_indexes("add_rows", rows_df)
+    return inserted
+
+@traced
+def remove_fact_row(row_id):
+    befores = _current_rows(FACT_TABLE_NAME, "rowid = @rowid", _row_param(row_id))
+    _append_changes(FACT_TABLE_NAME, befores, [None] * len(befores), "Delete transaction")
+    _update_fact_indexes("remove_rows", [row_id])
+
+@traced
+def update_fact_row(row_id, new_date, new_amount):
+    befores = _current_rows(FACT_TABLE_NAME, "rowid = @rowid", _row_param(row_id))
+    afters = [dict(before, date=new_date, amount=new_amount) for before in befores]
+    _append_changes(FACT_TABLE_NAME, befores, afters, "Edit transaction")
+    _update_fact_indexes("update_row", row_id, date=pd.Timestamp(new_date), amount=new_amount)
+
+@traced
+def remove_old_payoff_lines_for_debt(debt_name):
+    where = f"type='expense' AND category='{PLAN_CATEGORY}' AND budget_item=@debt_name AND note='{PLAN_NOTE}'"
+    befores = _current_rows(FACT_TABLE_NAME, where, bigquery.ScalarQueryParameter("debt_name", "STRING", debt_name))
+    # part of regenerating a payoff plan, which is not undoable on its own
+    _append_changes(FACT_TABLE_NAME, befores, [None] * len(befores), "Replace payoff plan", record=False)
+    _update_fact_indexes("remove_where", type="expense", category=PLAN_CATEGORY, budget_item=debt_name,
+                         note=PLAN_NOTE)
+
+# Process-wide search index of each tenant's fact table (see budget_search.py),
+# tenant -> [version, SearchIndex]. Built from load_fact_data() on the first
+# search and then kept up to date by the writers above.
+_search_indexes = OrderedDict()
+_search_lock = threading.Lock()
+
+# Process-wide fact dataset of each tenant (see budget_dataset.py), tenant ->
+# [version, FactDataset, snapshot frame or None]: one date-sorted copy of the
+# fact rows that every session slices without copying, so memory stays flat
+# as sessions are added. The writers above replace it with a changed copy
+# rather than mutating it, so views already handed out stay consistent.
+_fact_datasets = OrderedDict()
+_fact_dataset_lock = threading.Lock()
+
+# Process-wide envelope ledger of each tenant (see budget_envelopes.py),
+# tenant -> [version, EnvelopeLedger]: expense actuals per (month, category),
+# moved in place by the writers above.
+_envelope_ledgers = OrderedDict()
+_envelope_lock = threading.Lock()
+
+# Process-wide card cycle index of each tenant (see budget_cards.py), tenant
+# -> [version, CardCycleIndex]: charges per card and statement cycle, moved
+# in place by the writers above and rebuilt when the card settings change.
+_card_indexes = OrderedDict()
+_card_lock = threading.Lock()
+
+_IN_PLACE_INDEXES = {
+    CATS_TABLE_NAME: [(_dimension_indexes, _dimension_lock)],
+    FACT_TABLE_NAME: [(_search_indexes, _search_lock), (_fact_datasets, _fact_dataset_lock),
+                      (_envelope_ledgers, _envelope_lock), (_card_indexes, _card_lock)],
+}
+
+def _update_fact_indexes(change, *args, **kwargs):
+    """
+    Apply one change (a method shared by SearchIndex, the running totals of
+    budget_ledger.py and FactDataset) to the tenant's search index, envelope
+    ledger and card cycle index, in place, and to its fact dataset.
+    """
+    tenant_id = current_tenant()
+    for indexes, lock in ((_search_indexes, _search_lock), (_envelope_ledgers, _envelope_lock),
+                          (_card_indexes, _card_lock)):
+        with lock:
+            cached = indexes.get(tenant_id)
+        if cached is not None:
+            getattr(cached[1], change)(*args, **kwargs)
+    with _fact_dataset_lock:
+        cached = _fact_datasets.get(tenant_id)
+        if cached is not None:
+            cached[1] = getattr(cached[1], change)(*args, **kwargs)
+
+def fact_dataset():
+    """
+    The current tenant's shared FactDataset: built from the snapshot when
+    snapshots are on (and rebuilt when a sync replaced the frame), otherwise
+    from one read of the fact table per data version.
+    """
+    frame = _snapshot_frame(FACT_TABLE_NAME)
+    if frame is not None:
+        return _snapshot_dataset(frame)
+    tenant_id = current_tenant()
+    version = _current_version(FACT_TABLE_NAME)
+    with _fact_dataset_lock:
+        cached = _fact_datasets.get(tenant_id)
+        if cached is not None and cached[2] is None and version in (None, cached[0]):
+            _fact_datasets.move_to_end(tenant_id)
+            budget_trace.annotate(cache="hit")
+            return cached[1]
+    stale_reads = _stale_reads.get()
+    dataset = FactDataset(_read_fact_table())
+    budget_trace.annotate(cache="miss")
+    # as in _versioned: keep neither a stale fallback nor a read that raced a write
+    if version is not None and _current_version(FACT_TABLE_NAME) == version and _stale_reads.get() == stale_reads:
+        _keep_fact_dataset(tenant_id, [version, dataset, None])
+    return dataset
+
+def _snapshot_dataset(frame):
+    tenant_id = current_tenant()
+    with _fact_dataset_lock:
+        cached = _fact_datasets.get(tenant_id)
+        if cached is not None and cached[2] is frame:
+            _fact_datasets.move_to_end(tenant_id)
+            return cached[1]
+    dataset = FactDataset(frame)
+    _keep_fact_dataset(tenant_id, [None, dataset, frame])
+    return dataset
+
+def _keep_fact_dataset(tenant_id, entry):
+    with _fact_dataset_lock:
+        _fact_datasets[tenant_id] = entry
+        _fact_datasets.move_to_end(tenant_id)
+        while len(_fact_datasets) > _results.max_tenants:
+            _fact_datasets.popitem(last=False)
+
+@traced
+def search_transactions(text="", min_amount=None, max_amount=None, start_date=None, end_date=None,
+                        limit=SEARCH_LIMIT):
+    """
+    Fact rows and recurring series occurrences whose note, budget_item,
+    category or credit_card contain every word of text as a word prefix,
+    within the optional amount and date bounds (inclusive), newest first.
+    """
+    tenant_id = current_tenant()
+    version = _current_version(FACT_TABLE_NAME)
+    with _search_lock:
+        cached = _search_indexes.get(tenant_id)
+        if cached is not None and version in (None, cached[0]):
+            _search_indexes.move_to_end(tenant_id)
+            index = cached[1]
+        else:
+            index = None
+    if index is None:
+        index = SearchIndex(load_fact_data())
+        with _search_lock:
+            _search_indexes[tenant_id] = [version, index]
+            _search_indexes.move_to_end(tenant_id)
+            while len(_search_indexes) > _results.max_tenants:
+                _search_indexes.popitem(last=False)
+        budget_trace.annotate(cache="miss")
+    else:
+        budget_trace.annotate(cache="hit")
+    results = index.search(text, min_amount, max_amount, start_date, end_date, limit)
+    occurrences = load_series_rows(start_date or SERIES_SEARCH_START, end_date or SERIES_SEARCH_END)
+    if occurrences.empty:
+        return results
+    # Series are few, so their occurrences get a throwaway index of their own
+    matches = SearchIndex(occurrences).search(text, min_amount, max_amount, start_date, end_date, limit)
+    results = pd.concat([results, matches], ignore_index=True)
+    return results.sort_values("date", ascending=False, kind="stable", ignore_index=True).head(limit)
+
+# ─────────────────────────────────────────────────────────────────────────────
+# 5b) Recurring Series
+#
+# A repeating transaction is one rule row in fact_recurring_series, and a
+# changed or skipped occurrence one row in fact_recurring_exceptions (see
+# budget_series.py). Both are journaled like the fact table, so edits are
+# appended events and undoable. Occurrences are generated for the window
+# being read and merged into load_fact_rows(), the rollups and search.
+#
+# Payoff plans are still written as fact rows, linked by their series_id.
+# "Edit this and following" and "delete series" work on either kind as one
+# change: a set-based read of the series' current rows and one journal
+# append, whatever the number of rows (one event for a rule).
+# ─────────────────────────────────────────────────────────────────────────────
+# Date bounds of a search without dates (every series has an end)
+SERIES_SEARCH_START = date(1900, 1, 1)
+SERIES_SEARCH_END = date(2199, 12, 31)
+
+@traced
+@_versioned(SERIES_TABLE_NAME)
+def load_recurring_series():
+    frame = _snapshot_frame(SERIES_TABLE_NAME)
+    if frame is not None:
+        return frame
+    query = f"SELECT * FROM ({current_rows_sql(SERIES_TABLE_NAME)}) AS series_rows"
+    return read_query(query, job_config=_state_config(SERIES_TABLE_NAME))
+
+@traced
+@_versioned(SERIES_EXCEPTIONS_TABLE_NAME)
+def load_series_exceptions():
+    frame = _snapshot_frame(SERIES_EXCEPTIONS_TABLE_NAME)
+    if frame is not None:
+        return frame
+    query = f"SELECT * FROM ({current_rows_sql(SERIES_EXCEPTIONS_TABLE_NAME)}) AS exception_rows"
+    return read_query(query, job_config=_state_config(SERIES_EXCEPTIONS_TABLE_NAME))
+
+def load_series_rows(start_date, end_date):
+    """Occurrences of every series dated start_date..end_date, fact-shaped plus series_id/occurrence."""
+    rules = load_recurring_series()
+    # exceptions are only read once there is a series
+    exceptions = load_series_exceptions() if not rules.empty else None
+    return expand_series(rules, exceptions, start_date, end_date)
+
+@traced
+def add_recurring_series(start_date, cadence, fields, occurrences=None, end_date=None, key=None):
+    """
+    Store one rule row for a repeating transaction; fields holds type,
+    amount, category, budget_item, credit_card and note. The series ends
+    after occurrences occurrences and/or on end_date. key, an idempotency
+    key, becomes the series id. Returns the id.
+    """
+    if cadence not in CADENCES:
+        raise ValueError(f"Unknown cadence {cadence!r}; expected one of {sorted(CADENCES)}")
+    if occurrences is None and end_date is None:
+        raise ValueError("A recurring series needs a number of occurrences or an end date")
+    series_id = key or str(uuid.uuid4())
+    rule = dict(fields, rowid=series_id, start_date=start_date, cadence=cadence,
+                occurrences=occurrences, end_date=end_date)
+    columns = [name for name, _ in JOURNALED_COLUMNS[SERIES_TABLE_NAME] if name not in ("updated_at", "tenant_id")]
+    run_merge(pd.DataFrame([rule], columns=columns), SERIES_TABLE_NAME)
+    return series_id
+
+@traced
+def update_series(series_id, **changes):
+    """Change the rule itself (e.g. amount): every occurrence without an exception follows."""
+    befores = _current_rows(SERIES_TABLE_NAME, "rowid = @rowid", _row_param(series_id))
+    _append_changes(SERIES_TABLE_NAME, befores, [dict(before, **changes) for before in befores], "Edit series")
+
+@traced
+def remove_series(series_id):
+    befores = _current_rows(SERIES_TABLE_NAME, "rowid = @rowid", _row_param(series_id))
+    _append_changes(SERIES_TABLE_NAME, befores, [None] * len(befores), "Delete series")
+
+def _series_param(series_id):
+    return bigquery.ScalarQueryParameter("series_id", "STRING", series_id)
+
+def fact_series_rowids(series_id):
+    """Rowids of a series of fact rows, by date (from the shared dataset's series index)."""
+    return fact_dataset().series_rowids(series_id)
+
+def series_size(series_id):
+    """Number of rows (fact series) or occurrences (rule) in a series, or 0."""
+    rowids = fact_series_rowids(series_id)
+    if rowids:
+        return len(rowids)
+    rules = load_recurring_series()
+    rule = rules[rules["rowid"] == series_id]
+    return 0 if rule.empty else last_occurrence(rule.iloc[0].to_dict()) or 0
+
+@traced
+def update_fact_series_from(series_id, from_date, new_date, new_amount):
+    """
+    "Edit this and following" for a series of fact rows: the row on
+    from_date and every later one get new_amount and move by
+    new_date - from_date, as one journaled change.
+    """
+    befores = _current_rows(FACT_TABLE_NAME, "series_id = @series_id AND date >= @from_date",
+                            _series_param(series_id), bigquery.ScalarQueryParameter("from_date", "DATE", from_date))
+    shift = pd.Timestamp(new_date) - pd.Timestamp(from_date)
+    afters = [dict(before, date=(pd.Timestamp(before["date"]) + shift).date(), amount=new_amount)
+              for before in befores]
+    _append_changes(FACT_TABLE_NAME, befores, afters, "Edit series")
+    if afters:
+        _update_fact_indexes("remove_rows", [before["rowid"] for before in befores])
+        _update_fact_indexes("add_rows", pd.DataFrame(afters).drop(columns=["updated_at", "tenant_id"]))
+
+@traced
+def remove_fact_series(series_id):
+    """Delete every row of a series of fact rows as one journaled change."""
+    befores = _current_rows(FACT_TABLE_NAME, "series_id = @series_id", _series_param(series_id))
+    _append_changes(FACT_TABLE_NAME, befores, [None] * len(befores), "Delete series")
+    _update_fact_indexes("remove_rows", [before["rowid"] for before in befores])
+
+@traced
+def update_series_from(series_id, occurrence, new_date, new_amount):
+    """
+    "Edit this and following" for a rule: it now ends before occurrence, and
+    a new rule starting on new_date with new_amount takes over the remaining
+    occurrences. Both rule events are one change, so one undo.
+    """
+    occurrence = int(occurrence)
+    befores = _current_rows(SERIES_TABLE_NAME, "rowid = @rowid", _row_param(series_id))
+    if not befores:
+        return None
+    rule = befores[0]
+    if occurrence <= 1:
+        _append_changes(SERIES_TABLE_NAME, befores, [dict(rule, start_date=new_date, amount=new_amount)],
+                        "Edit series")
+        return series_id
+    remaining = last_occurrence(rule)
+    if remaining is not None:
+        remaining -= occurrence - 1
+    continued = dict(rule, rowid=str(uuid.uuid4()), start_date=new_date, amount=new_amount, occurrences=remaining)
+    ended = dict(rule, occurrences=occurrence - 1)
+    _append_changes(SERIES_TABLE_NAME, [rule, None], [ended, continued], "Edit series")
+    return continued["rowid"]
+
+def _set_series_exception(series_id, occurrence, label, **values):
+    row_id = occurrence_rowid(series_id, occurrence)
+    befores = _current_rows(SERIES_EXCEPTIONS_TABLE_NAME, "rowid = @rowid", _row_param(row_id)) or [None]
+    after = dict(befores[0] or {}, rowid=row_id, series_id=series_id, occurrence=int(occurrence), **values)
+    _append_changes(SERIES_EXCEPTIONS_TABLE_NAME, befores, [after], label)
+
+@traced
+def update_series_occurrence(series_id, occurrence, new_date, new_amount):
+    """Move or re-price one occurrence (an "override" exception)."""
+    _set_series_exception(series_id, occurrence, "Edit transaction",
+                          action="override", date=new_date, amount=new_amount)
+
+@traced
+def skip_series_occurrence(series_id, occurrence):
+    """Delete one occurrence (a "skip" exception)."""
+    _set_series_exception(series_id, occurrence, "Delete transaction", action="skip")
+
+# ─────────────────────────────────────────────────────────────────────────────
+# 5c) Archive
+#
+# archive_closed_years() moves a tenant's fact rows of closed years from the
+# hot table to fact_budget_inputs_archive and adds their totals per
+# (month, type, category) to fact_monthly_summary. Every row is in exactly
+# one of the two, so the rollups simply add the hot rows and the summaries
+# of the requested months, and the fact dataset, search index and table
+# scans only cover the hot rows. The boundary ("archived_before") is
+# published with the fact table's version, so load_fact_rows() knows when
+# to read archived rows (only ever for a closed month someone browses to).
+# ─────────────────────────────────────────────────────────────────────────────
+def _archived_before():
+    """Rows dated before this are archived; None while nothing is (or before the first version check)."""
+    with _version_lock:
+        return _archived.get(current_tenant())
+
+@traced
+@_versioned(FACT_TABLE_NAME)
+def load_archived_rows(start_date, end_date):
+    query = f"""
+    SELECT * FROM `{PROJECT_ID}.{DATASET_ID}.{ARCHIVE_TABLE_NAME}`
+    WHERE tenant_id = @tenant_id AND date BETWEEN @start_date AND @end_date
+    """
+    df = read_query(query, job_config=_date_range_config(start_date, end_date))
+    df["date"] = pd.to_datetime(df["date"])
+    df["archived"] = True
+    return df
+
+def _snapshot_summary_rows(start_date, end_date):
+    """Summary rows of the range's months, with date set to the month start (snapshot reads)."""
+    frame = _snapshot_frame(SUMMARY_TABLE_NAME)
+    months = frame["year_month"]
+    rows = frame[(months >= f"{start_date:%Y-%m}") & (months <= f"{end_date:%Y-%m}")]
+    return rows.assign(date=pd.to_datetime(rows["year_month"]))
+
+def _drop_fact_indexes(tenant_id):
+    """Forget the tenant's in-process fact indexes (rebuilt on next use)."""
+    with _search_lock:
+        _search_indexes.pop(tenant_id, None)
+    with _fact_dataset_lock:
+        _fact_datasets.pop(tenant_id, None)
+    with _envelope_lock:
+        _envelope_ledgers.pop(tenant_id, None)
+    with _card_lock:
+        _card_indexes.pop(tenant_id, None)
+
+@traced
+def archive_closed_years(through_year=None):
+    """
+    Archive the current tenant's fact rows dated up to the end of
+    through_year (default: last year). Returns the number of rows moved, or
+    None when some of them still have journal events that compaction has
+    not folded in yet (recent edits); run it again later.
+    """
+    if through_year is None:
+        through_year = date.today().year - 1
+    cutoff = date(through_year + 1, 1, 1)
+    compact_journal(FACT_TABLE_NAME)
+    check_data_versions()
+    tenant_id = current_tenant()
+    base_id = f"{PROJECT_ID}.{DATASET_ID}.{FACT_TABLE_NAME}"
+    config = _state_config(FACT_TABLE_NAME, bigquery.ScalarQueryParameter("cutoff", "DATE", cutoff))
+    closed = f"SELECT * FROM `{base_id}` WHERE tenant_id = @tenant_id AND date < @cutoff"
+    pending = run_query(f"""
+    SELECT COUNT(*) AS events FROM `{_journal_id(FACT_TABLE_NAME)}`
+    WHERE tenant_id = @tenant_id AND event_at > @compacted_through
+      AND (date < @cutoff OR rowid IN (SELECT rowid FROM ({closed}) AS closed_rows))
+    """, job_config=config).to_dataframe()["events"].iloc[0]
+    if pending:
+        budget_trace.annotate(pending_events=int(pending))
+        return None
+    counted = run_query(f"SELECT COUNT(*) AS row_count, MAX(updated_at) AS newest FROM ({closed}) AS closed_rows",
+                        job_config=config).to_dataframe().iloc[0]
+    moved = int(counted["row_count"])
+    if not moved:
+        return 0
+    # the same rows give the same batch, so a rerun after a lost reply
+    # cannot add a second set of summary rows for them
+    batch = idempotency_key("archive", tenant_id, cutoff, moved, counted["newest"])
+    config = _state_config(FACT_TABLE_NAME, bigquery.ScalarQueryParameter("cutoff", "DATE", cutoff),
+                           bigquery.ScalarQueryParameter("batch", "STRING", batch))
+    archive_id = f"{PROJECT_ID}.{DATASET_ID}.{ARCHIVE_TABLE_NAME}"
+    cols = ", ".join(name for name, _ in JOURNALED_COLUMNS[FACT_TABLE_NAME])
+    # One transaction: the closed rows are snapshotted by rowid, summarized
+    # and copied (skipping any the archive already has) and deleted by that
+    # rowid set, so a failure leaves nothing half moved and a back-dated row
+    # written meanwhile stays in the hot table for the next run.
+    run_query(f"""
+    BEGIN TRANSACTION;
+    CREATE TEMP TABLE closed_rows AS {closed};
+    CREATE TEMP TABLE new_rows AS
+      SELECT * FROM closed_rows
+      WHERE rowid NOT IN (SELECT rowid FROM `{archive_id}` WHERE tenant_id = @tenant_id);
+    INSERT INTO `{PROJECT_ID}.{DATASET_ID}.{SUMMARY_TABLE_NAME}`
+      (rowid, year_month, type, category, amount, row_count, updated_at, tenant_id)
+    SELECT @batch || '/' || year_month || '/' || type || '/' || COALESCE(category, ''),
+           year_month, type, category, SUM(amount), COUNT(*), CURRENT_TIMESTAMP(), @tenant_id
+    FROM (SELECT FORMAT_DATE('%Y-%m', date) AS year_month, type, category, amount FROM new_rows) AS closed_months
+    GROUP BY year_month, type, category;
+    INSERT INTO `{archive_id}` ({cols}) SELECT {cols} FROM new_rows;
+    DELETE FROM `{base_id}` WHERE tenant_id = @tenant_id AND rowid IN (SELECT rowid FROM closed_rows);
+    DROP TABLE new_rows;
+    DROP TABLE closed_rows;
+    COMMIT TRANSACTION;
+    """, job_config=config)
+    budget_trace.annotate(rows_archived=moved)
+    _drop_fact_indexes(tenant_id)
+    _mark_snapshot_dirty(FACT_TABLE_NAME)
+    _mark_snapshot_dirty(SUMMARY_TABLE_NAME)
+    known = _archived_before()
+    _bump_version(FACT_TABLE_NAME, archived_before=max(cutoff, known) if known else cutoff)
+    return moved
+
+@traced
+def rebuild_monthly_summaries():
+    """
+    Recompute the current tenant's fact_monthly_summary from the archive
+    table, one row per (month, type, category) instead of one per archive
+    run. Returns the number of summary rows.
+    """
+    check_data_versions()
+    summary_id = f"{PROJECT_ID}.{DATASET_ID}.{SUMMARY_TABLE_NAME}"
+    config = _tenant_config(bigquery.ScalarQueryParameter("batch", "STRING", str(uuid.uuid4())))
+    run_query(f"""
+    INSERT INTO `{summary_id}` (rowid, year_month, type, category, amount, row_count, updated_at, tenant_id)
+    SELECT @batch || '/' || year_month || '/' || type || '/' || COALESCE(category, ''),
+           year_month, type, category, SUM(amount), COUNT(*), CURRENT_TIMESTAMP(), @tenant_id
+    FROM (
+      SELECT FORMAT_DATE('%Y-%m', date) AS year_month, type, category, amount
+      FROM `{PROJECT_ID}.{DATASET_ID}.{ARCHIVE_TABLE_NAME}`
+      WHERE tenant_id = @tenant_id
+    ) AS archived_months
+    GROUP BY year_month, type, category
+    """, job_config=config)
+    # the new rows are in before the old ones go, so a read in between
+    # double counts rather than missing months; it is cached under the
+    # old version and dropped by the bump below
+    run_query(f"""
+    DELETE FROM `{summary_id}`
+    WHERE tenant_id = @tenant_id AND rowid NOT LIKE @batch || '/%'
+    """, job_config=config)
+    rows = int(run_query(f"SELECT COUNT(*) AS row_count FROM `{summary_id}` WHERE tenant_id = @tenant_id",
+                         job_config=config).to_dataframe()["row_count"].iloc[0])
+    _mark_snapshot_dirty(SUMMARY_TABLE_NAME)
+    # summaries are read under the fact table's version
+    _bump_version(FACT_TABLE_NAME)
+    return rows
+
+# ─────────────────────────────────────────────────────────────────────────────
+# 5d) Envelope Budgets
+#
+# Targets live in budget_envelopes, one journaled row per (category, month),
+# so setting one is an appended event and undoable. Actuals come from the
+# tenant's EnvelopeLedger (see budget_envelopes.py), built from the fact
+# dataset once per data version and then moved in place by every fact
+# writer through _update_fact_indexes(), like the search index. Series
+# occurrences are added for the month being shown, and archived months use
+# their summaries, which the ledger does not hold.
+# ─────────────────────────────────────────────────────────────────────────────
+@traced
+@_versioned(ENVELOPE_TABLE_NAME)
+def load_envelope_targets():
+    frame = _snapshot_frame(ENVELOPE_TABLE_NAME)
+    if frame is not None:
+        return frame
+    query = f"SELECT * FROM ({current_rows_sql(ENVELOPE_TABLE_NAME)}) AS envelope_rows"
+    return read_query(query, job_config=_state_config(ENVELOPE_TABLE_NAME))
+
+@traced
+def set_envelope_target(category, month, target, months=1):
+    """
+    Set category's target for the month of the date month and the
+    months - 1 months after it, as one change. A target of 0 removes it.
+    """
+    first = pd.Period(month, freq="M")
+    year_months = [str(first + n) for n in range(months)]
+    params = (
+        bigquery.ScalarQueryParameter("category", "STRING", category),
+        bigquery.ScalarQueryParameter("first_month", "STRING", year_months[0]),
+        bigquery.ScalarQueryParameter("last_month", "STRING", year_months[-1]),
+    )
+    where = "category = @category AND year_month BETWEEN @first_month AND @last_month"
+    current = {row["rowid"]: row for row in _current_rows(ENVELOPE_TABLE_NAME, where, *params)}
+    befores, afters = [], []
+    for ym in year_months:
+        rowid = envelope_rowid(category, ym)
+        if target > 0:
+            befores.append(current.get(rowid))
+            afters.append({"rowid": rowid, "year_month": ym, "category": category, "target": float(target)})
+        elif rowid in current:
+            befores.append(current[rowid])
+            afters.append(None)
+    return _append_changes(ENVELOPE_TABLE_NAME, befores, afters, "Set budget target")
+
+def envelope_ledger():
+    """The current tenant's EnvelopeLedger, built on first use per data version."""
+    tenant_id = current_tenant()
+    version = _current_version(FACT_TABLE_NAME)
+    with _envelope_lock:
+        cached = _envelope_ledgers.get(tenant_id)
+        if cached is not None and version in (None, cached[0]):
+            _envelope_ledgers.move_to_end(tenant_id)
+            budget_trace.annotate(cache="hit")
+            return cached[1]
+    ledger = EnvelopeLedger(fact_dataset().frame)
+    with _envelope_lock:
+        _envelope_ledgers[tenant_id] = [version, ledger]
+        _envelope_ledgers.move_to_end(tenant_id)
+        while len(_envelope_ledgers) > _results.max_tenants:
+            _envelope_ledgers.popitem(last=False)
+    budget_trace.annotate(cache="miss")
+    return ledger
+
+@traced
+def load_envelopes(month_start, month_end):
+    """
+    Actual vs target per category with a target in the month (see
+    envelope_report()); empty when the month has none, without reading the
+    fact rows.
+    """
+    month = year_month(month_start)
+    targets = load_envelope_targets()
+    targets = targets[targets["year_month"] == month]
+    if targets.empty:
+        return envelope_report({}, {})
+    archived_before = _archived_before()
+    if archived_before is not None and month_start < archived_before:
+        totals = load_category_totals(month_start, month_end)
+        expenses = totals[totals["type"] == "expense"]
+        actuals = dict(zip(expenses["category"], expenses["amount"]))
+    else:
+        actuals = envelope_ledger().month_actuals(month)
+        occurrences = load_series_rows(month_start, month_end)
+        spent = occurrences[occurrences["type"] == "expense"].groupby("category")["amount"].sum()
+        for category, amount in spent.items():
+            actuals[category] = actuals.get(category, 0.0) + amount
+    return envelope_report(dict(zip(targets["category"], targets["target"])), actuals)
+
+# ─────────────────────────────────────────────────────────────────────────────
+# 5e) Credit Card Cycles
+#
+# Cards live in fact_credit_cards (journaled): the statement closing day
+# and the debt the card is paid down as. Expenses are tagged with the card
+# in credit_card. Statement balances come from the tenant's CardCycleIndex
+# (see budget_cards.py), built from the fact dataset and then moved in
+# place by every fact writer; series occurrences tagged with a card are
+# added for the two cycles shown.
+# ─────────────────────────────────────────────────────────────────────────────
+CARD_STATEMENT_COLUMNS = ["card_name", "debt_name", "closing_day", "statement_close", "statement_balance",
+                          "next_close", "next_balance"]
+
+@traced
+@_versioned(CARDS_TABLE_NAME)
+def load_credit_cards():
+    frame = _snapshot_frame(CARDS_TABLE_NAME)
+    if frame is not None:
+        return frame
+    query = f"SELECT * FROM ({current_rows_sql(CARDS_TABLE_NAME)}) AS card_rows ORDER BY card_name"
+    return read_query(query, job_config=_state_config(CARDS_TABLE_NAME))
+
+@traced
+def save_credit_card(card_name, closing_day, debt_name=None):
+    """Add a card or change its closing day / linked debt."""
+    if not 1 <= int(closing_day) <= 31:
+        raise ValueError(f"closing_day must be a day of the month (1-31), got {closing_day!r}")
+    befores = _current_rows(CARDS_TABLE_NAME, "rowid = @rowid", _row_param(card_name)) or [None]
+    after = {"rowid": card_name, "card_name": card_name, "closing_day": int(closing_day), "debt_name": debt_name}
+    return _append_changes(CARDS_TABLE_NAME, befores, [after], "Save card")
+
+@traced
+def remove_credit_card(card_name):
+    """Forget the card's settings; transactions keep their credit_card tag."""
+    befores = _current_rows(CARDS_TABLE_NAME, "rowid = @rowid", _row_param(card_name))
+    return _append_changes(CARDS_TABLE_NAME, befores, [None] * len(befores), "Remove card")
+
+def card_cycle_index():
+    """The current tenant's CardCycleIndex for the current card settings."""
+    tenant_id = current_tenant()
+    version = _current_version(FACT_TABLE_NAME)
+    cards = load_credit_cards()
+    closing_days = dict(zip(cards["card_name"], (int(day) for day in cards["closing_day"])))
+    with _card_lock:
+        cached = _card_indexes.get(tenant_id)
+        if cached is not None and version in (None, cached[0]) and cached[1].closing_days == closing_days:
+            _card_indexes.move_to_end(tenant_id)
+            budget_trace.annotate(cache="hit")
+            return cached[1]
+    index = CardCycleIndex(fact_dataset().frame, closing_days)
+    with _card_lock:
+        _card_indexes[tenant_id] = [version, index]
+        _card_indexes.move_to_end(tenant_id)
+        while len(_card_indexes) > _results.max_tenants:
+            _card_indexes.popitem(last=False)
+    budget_trace.annotate(cache="miss")
+    return index
+
+@traced
+def load_card_statements(on=None):
+    """
+    One row per configured card: the cycle open on the date on (default
+    today) with its charges so far including planned ones
+    (statement_balance), and the cycle after it (next_balance).
+    """
+    on = on or date.today()
+    cards = load_credit_cards()
+    if cards.empty:
+        return pd.DataFrame(columns=CARD_STATEMENT_COLUMNS)
+    index = card_cycle_index()
+    rows = {}
+    for card in cards.to_dict("records"):
+        closing_day = int(card["closing_day"])
+        close = statement_close(on, closing_day)
+        next_close = statement_close(close + timedelta(days=1), closing_day)
+        rows[card["card_name"]] = {
+            "card_name": card["card_name"], "debt_name": card["debt_name"], "closing_day": closing_day,
+            "statement_close": close, "statement_balance": index.balance(card["card_name"], close),
+            "next_close": next_close, "next_balance": index.balance(card["card_name"], next_close),
+        }
+    first = min(cycle_start(row["statement_close"], row["closing_day"]) for row in rows.values())
+    last = max(row["next_close"] for row in rows.values())
+    occurrences = load_series_rows(first, last)
+    charges = occurrences[(occurrences["type"] == "expense") & occurrences["credit_card"].isin(list(rows))]
+    for card_name, day, amount in zip(charges["credit_card"], charges["date"], charges["amount"]):
+        row = rows[card_name]
+        close = statement_close(day.date(), row["closing_day"])
+        if close == row["statement_close"]:
+            row["statement_balance"] += amount
+        elif close == row["next_close"]:
+            row["next_balance"] += amount
+    return pd.DataFrame(list(rows.values()), columns=CARD_STATEMENT_COLUMNS)
+
+# ─────────────────────────────────────────────────────────────────────────────
+# 5f) Duplicate and Anomaly Scan
+#
+# find_anomalies() (see budget_anomalies.py) runs on a background thread
+# over the tenant's shared fact dataset, so no rerun waits for it. Each
+# write replaces the dataset, which is what tells a later call that the
+# findings are out of date and starts a new scan; until it finishes the
+# previous findings are shown.
+# ─────────────────────────────────────────────────────────────────────────────
+# tenant -> {"scanned": FactDataset of the findings, "findings": DataFrame or
+# None, "running": FactDataset being scanned or None}
+_anomaly_scans = OrderedDict()
+_anomaly_lock = threading.Lock()
+
+def anomaly_scan():
+    """
+    The latest findings for the current tenant, as {"findings": DataFrame
+    or None before the first scan finished, "current": True when they
+    cover the rows as they are now, "running": True while a scan runs}.
+    Starts a scan when the rows changed since the last one.
+    """
+    tenant_id = current_tenant()
+    dataset = fact_dataset()
+    with _anomaly_lock:
+        scan = _anomaly_scans.get(tenant_id)
+        if scan is None:
+            scan = _anomaly_scans[tenant_id] = {"scanned": None, "findings": None, "running": None}
+        _anomaly_scans.move_to_end(tenant_id)
+        while len(_anomaly_scans) > _results.max_tenants:
+            _anomaly_scans.popitem(last=False)
+        current = scan["scanned"] is dataset
+        start = not current and scan["running"] is not dataset
+        if start:
+            scan["running"] = dataset
+        result = {"findings": scan["findings"], "current": current, "running": scan["running"] is not None}
+
+    def run():
+        findings = None
+        try:
+            findings = find_anomalies(dataset.frame)
+        finally:
+            with _anomaly_lock:
+                latest = scan["running"] is dataset
+                if latest:
+                    scan["running"] = None
+                # a scan overtaken by a newer one only fills in for nothing
+                if findings is not None and (latest or scan["findings"] is None):
+                    scan.update(scanned=dataset, findings=findings)
+    if start:
+        threading.Thread(target=contextvars.Context().run, args=(run,), daemon=True,
+                         name=f"anomaly-scan-{tenant_id}").start()
+    return result
+
+# ─────────────────────────────────────────────────────────────────────────────
+# 6) Debt Domination Table Functions
+# ─────────────────────────────────────────────────────────────────────────────
+@traced
+@_versioned(DEBT_TABLE_NAME)
+def load_debt_items():
+    df = _snapshot_frame(DEBT_TABLE_NAME)
+    if df is not None:
+        df = df.copy()
+    else:
+        query = f"SELECT * FROM ({current_rows_sql(DEBT_TABLE_NAME)}) AS debt_rows"
+        df = read_query(query, job_config=_state_config(DEBT_TABLE_NAME))
+    if "payoff_plan_date" in df.columns:
+        df["payoff_plan_date"] = pd.to_datetime(df["payoff_plan_date"]).dt.date
+    return df
+
+@traced
+def add_debt_item(debt_name, current_balance, due_date, min_payment, key=None):
+    """key: idempotency key of the submission (see idempotency_key()); None writes a new row."""
+    if due_date == "(None)":
+        due_date = None
+
+    min_payment_val = None
+    if min_payment.strip():
+        try:
+            min_payment_val = float(min_payment)
+        except:
+            min_payment_val = None
+
+    df = pd.DataFrame([{
+        "rowid": key or str(uuid.uuid4()),
+        "debt_name": debt_name,
+        "current_balance": current_balance,
+        "due_date": due_date,
+        "minimum_payment": min_payment_val,
+        "payoff_plan_date": None
+    }])
+    run_merge(df, DEBT_TABLE_NAME)
+
+@traced
+def remove_debt_item(row_id):
+    befores = _current_rows(DEBT_TABLE_NAME, "rowid = @rowid", _row_param(row_id))
+    _append_changes(DEBT_TABLE_NAME, befores, [None] * len(befores), "Delete debt")
+
+@traced
+def update_debt_item(row_id, new_balance):
+    befores = _current_rows(DEBT_TABLE_NAME, "rowid = @rowid", _row_param(row_id))
+    afters = [dict(before, current_balance=new_balance) for before in befores]
+    _append_changes(DEBT_TABLE_NAME, befores, afters, "Update debt balance")
+
+@traced
+def update_debt_payoff_plan_date(row_id, new_date):
+    befores = _current_rows(DEBT_TABLE_NAME, "rowid = @rowid", _row_param(row_id))
+    afters = [dict(before, payoff_plan_date=new_date) for before in befores]
+    _append_changes(DEBT_TABLE_NAME, befores, afters, "Set payoff plan date")
+
+def _plan_rows(plan, series_id):
+    """A payoff_plan() frame with rowids derived from series_id (the n-th payment's is the same on every retry)."""
+    return plan.assign(rowid=[derived_rowid(series_id, n) for n in range(len(plan))], series_id=series_id)
+
+@traced
+def insert_monthly_payments_for_debt(debt_name, total_balance, debt_due_date_str, payoff_date, key=None):
+    """
+    Replace the debt's payoff plan with equal monthly payments through
+    payoff_date (see budget_payoff.py). key, an idempotency key, becomes
+    the plan's series id; a plan already written under it is left alone.
+    """
+    if key is not None and fact_series_rowids(key):
+        return
+    remove_old_payoff_lines_for_debt(debt_name)
+    plan = payoff_plan(debt_name, total_balance, debt_due_date_str, payoff_date)
+    if not plan.empty:
+        save_fact_data(_plan_rows(plan, key or str(uuid.uuid4())))
+
+def payoff_plan_key(debt):
+    """Idempotency key of re-planning a debt row today: its balance, due date and payoff date, and the day."""
+    return idempotency_key("recalculate_payoff_plan", debt["rowid"], debt["current_balance"], debt["due_date"],
+                           debt["payoff_plan_date"], date.today())
+
+@traced
+def recalculate_payoff_plans(row_ids=None, progress=None):
+    """
+    Re-plan the payoff of the debts in row_ids (default: every debt with a
+    payoff date) from their current balances, in bulk: one read and one
+    journaled delete of all their old plan lines, then one chunked MERGE of
+    all the new ones. Each plan's series id is payoff_plan_key() of its
+    debt, so a run that was cut short, or a second run the same day, only
+    writes what is missing. progress(done, total, debt_name) is called as
+    each debt is planned. Returns the number of payments in the new plans.
+    """
+    debts = load_debt_items()
+    if row_ids is None:
+        debts = debts[debts["payoff_plan_date"].notna()]
+    else:
+        debts = debts[debts["rowid"].isin(list(row_ids))]
+    debts = debts.to_dict("records")
+    where = f"type='expense' AND category='{PLAN_CATEGORY}' AND note='{PLAN_NOTE}'"
+    old_lines = _current_rows(FACT_TABLE_NAME, where) if debts else []
+    befores, plans = [], []
+    for done, debt in enumerate(debts, start=1):
+        key = payoff_plan_key(debt)
+        # lines of today's plan (a retry) stay; MERGE skips them
+        befores += [row for row in old_lines
+                    if row["budget_item"] == debt["debt_name"] and row.get("series_id") != key]
+        due = debt["due_date"] if isinstance(debt["due_date"], str) else ""
+        payoff = debt["payoff_plan_date"] if pd.notna(debt["payoff_plan_date"]) else date.today()
+        plan = payoff_plan(debt["debt_name"], debt["current_balance"], due, payoff)
+        if not plan.empty:
+            plans.append(_plan_rows(plan, key))
+        if progress is not None:
+            progress(done, len(debts), debt["debt_name"])
+    if befores:
+        _append_changes(FACT_TABLE_NAME, befores, [None] * len(befores), "Recalculate payoff plans", record=False)
+        _update_fact_indexes("remove_rows", [row["rowid"] for row in befores])
+    if not plans:
+        return 0
+    rows = pd.concat(plans, ignore_index=True)
+    save_fact_data(rows)
+    return len(rows)
+
+# ─────────────────────────────────────────────────────────────────────────────
+# 6b) Export
+#
+# export_table() streams a table's current rows out through one query whose
+# result is read page by page (see budget_export.py): the fact rows of a
+# date range, hot and archived, by date, or every debt item. Pages are not
+# cached or kept, so a multi-year export runs in the memory of one page.
+# ─────────────────────────────────────────────────────────────────────────────
+EXPORT_CHUNK_ROWS = 50000
+EXPORT_COLUMNS = {
+    FACT_TABLE_NAME: ["rowid", "date", "type", "amount", "category", "budget_item", "credit_card", "note",
+                      "series_id"],
+    DEBT_TABLE_NAME: ["rowid", "debt_name", "current_balance", "due_date", "minimum_payment", "payoff_plan_date"],
+}
+
+def export_schema(table_name):
+    types = dict(JOURNALED_COLUMNS[table_name])
+    return budget_export.arrow_schema([(name, types[name]) for name in EXPORT_COLUMNS[table_name]])
+
+def _export_query(table_name, start_date, end_date):
+    cols = ", ".join(EXPORT_COLUMNS[table_name])
+    if table_name == DEBT_TABLE_NAME:
+        return f"SELECT {cols} FROM ({current_rows_sql(DEBT_TABLE_NAME)}) AS debt_rows ORDER BY debt_name, rowid"
+    in_range = " AND ".join(condition for condition, bound in (("date >= @start_date", start_date),
+                                                              ("date <= @end_date", end_date))
+                            if bound is not None) or "TRUE"
+    return f"""
+    SELECT {cols} FROM (
+      SELECT {cols} FROM ({current_rows_sql(FACT_TABLE_NAME)}) AS fact_rows WHERE {in_range}
+      UNION ALL
+      SELECT {cols} FROM `{PROJECT_ID}.{DATASET_ID}.{ARCHIVE_TABLE_NAME}`
+      WHERE tenant_id = @tenant_id AND {in_range}
+    ) AS export_rows
+    ORDER BY date, rowid
+    """
+
+def export_batches(table_name, start_date=None, end_date=None, chunk_rows=EXPORT_CHUNK_ROWS):
+    """
+    The current tenant's rows of table_name (see EXPORT_COLUMNS) as Arrow
+    record batches of at most chunk_rows; start_date and end_date bound
+    the fact rows' dates (debt items are not dated). Runs under the scan
+    budgets like any read.
+    """
+    params = [bigquery.ScalarQueryParameter(name, "DATE", bound)
+              for name, bound in (("start_date", start_date), ("end_date", end_date)) if bound is not None]
+    config = _state_config(table_name, *params)
+    query = _export_query(table_name, start_date, end_date)
+    if _scan_limits["session"] or _scan_limits["daily"]:
+        _check_scan_budget(estimate_bytes(query, config))
+    job = run_query(query, job_config=config, retry=True)
+    yield from job.result(page_size=chunk_rows).to_arrow_iterable()
+
+@traced
+def export_table(table_name, sink, fmt, start_date=None, end_date=None, progress=None,
+                 chunk_rows=EXPORT_CHUNK_ROWS):
+    """
+    Stream export_batches() to sink (a path or binary file object) as fmt
+    ("csv" or "parquet"). progress(rows) follows each batch. Returns the
+    number of rows written.
+    """
+    batches = export_batches(table_name, start_date, end_date, chunk_rows)
+    return budget_export.write_batches(batches, export_schema(table_name), fmt, sink, progress)
@@ -0,0 +1,161 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Shared fact dataset
+#
+# One immutable copy of a tenant's fact rows per process, sorted by date,
+# shared by every session. A date range is located with two binary
+# searches on an int64 day-number array and returned as an iloc slice: a
+# view, not a boolean mask over the whole table and not a copy. Pandas 3
+# copy-on-write makes those views safe to hand out: a caller that modifies
+# one gets its own copy at that point and the shared rows never change.
+# Pandas 2 without copy-on-write gets a copy of the slice instead; the
+# global option is left alone.
+#
+# Writes build a new dataset (add_rows, update_row, ... return one);
+# sessions still holding views of the old one keep a consistent picture.
+# They do not rebuild it: added rows are appended and sorted on the next
+# read, an update replaces only the changed columns (and moves one row when
+# its date changes), and removals keep the order.
+# ─────────────────────────────────────────────────────────────────────────────
+_VIEWS_ARE_SAFE = int(pd.__version__.split(".")[0]) >= 3
+
+
+def _day_numbers(dates):
+    """Days since epoch as a read-only int64 array (any datetime64 resolution)."""
+    days = dates.to_numpy().astype("datetime64[D]").astype("int64")
+    days.flags.writeable = False
+    return days
+
+
+def _day_number(value):
+    return int(pd.Timestamp(value).normalize().value // 86_400_000_000_000)
+
+
+def _is_sorted(days):
+    return bool((days[1:] >= days[:-1]).all())
+
+
+class FactDataset:
+    def __init__(self, fact_rows):
+        frame = fact_rows.assign(date=pd.to_datetime(fact_rows["date"]))
+        self._set(frame.reset_index(drop=True), _day_numbers(frame["date"]))
+        self._lock = threading.Lock()
+        self._series = None
+
+    def _set(self, frame, days):
+        if not _is_sorted(days):
+            order = np.argsort(days, kind="stable")
+            frame = frame.take(order).reset_index(drop=True)
+            days = days[order]
+            days.flags.writeable = False
+        self._frame, self._days = frame, days
+        self._unsorted = False
+
+    @classmethod
+    def _derived(cls, frame, days, unsorted=False):
+        dataset = cls.__new__(cls)
+        dataset._frame, dataset._days, dataset._unsorted = frame, days, unsorted
+        dataset._lock = threading.Lock()
+        dataset._series = None
+        return dataset
+
+    def _sorted(self):
+        """(frame, days), sorting rows appended since the last read first."""
+        with self._lock:
+            if self._unsorted:
+                self._set(self._frame, self._days)
+            return self._frame, self._days
+
+    @property
+    def frame(self):
+        return self._sorted()[0]
+
+    @property
+    def days(self):
+        return self._sorted()[1]
+
+    def __len__(self):
+        return len(self._frame)
+
+    def rows(self, start_date, end_date):
+        """Rows with start_date <= date <= end_date (inclusive), as a view."""
+        frame, days = self._sorted()
+        lo = int(np.searchsorted(days, _day_number(start_date), side="left"))
+        hi = int(np.searchsorted(days, _day_number(end_date), side="right"))
+        rows = frame.iloc[lo:hi].reset_index(drop=True)
+        return rows if _VIEWS_ARE_SAFE else rows.copy()
+
+    def series_rowids(self, series_id):
+        """Rowids of the rows with this series_id, by date (indexed on first use)."""
+        if self._series is None:
+            frame = self.frame
+            if "series_id" in frame:
+                linked = frame[frame["series_id"].notna()]
+                self._series = {key: list(rowids) for key, rowids in linked.groupby("series_id")["rowid"]}
+            else:
+                self._series = {}
+        return self._series.get(series_id, [])
+
+    # The changes mirror SearchIndex's, so writers can apply one change to
+    # both; each returns a new dataset.
+    def add_rows(self, fact_rows):
+        frame, days = self._frame, self._days
+        added = fact_rows.reindex(columns=frame.columns)
+        added = added.assign(date=pd.to_datetime(added["date"]))
+        if frame.empty:
+            return FactDataset(added)
+        added_days = _day_numbers(added["date"])
+        days = np.concatenate([days, added_days])
+        days.flags.writeable = False
+        frame = pd.concat([frame, added], ignore_index=True)
+        in_order = not self._unsorted and (len(added_days) == 0 or (
+            added_days[0] >= self._days[-1] and _is_sorted(added_days)))
+        return FactDataset._derived(frame, days, unsorted=not in_order)
+
+    def remove_rows(self, rowids):
+        frame, days = self._frame, self._days
+        return self._kept(frame, days, ~frame["rowid"].isin(list(rowids)).to_numpy())
+
+    def update_row(self, rowid, **changes):
+        frame, days = self._sorted()
+        positions = np.flatnonzero((frame["rowid"] == rowid).to_numpy())
+        if len(positions) == 0:
+            return self
+        frame = frame.copy(deep=False)
+        for column, value in changes.items():
+            # only the changed columns are copied; the rest stay shared
+            values = frame[column].copy()
+            values.iloc[positions] = pd.Timestamp(value) if column == "date" else value
+            frame[column] = values
+        if "date" not in changes:
+            return FactDataset._derived(frame, days)
+
+        # move the row to its new date, where a stable sort would put it
+        order = np.delete(np.arange(len(frame)), positions)
+        day = _day_number(changes["date"])
+        lo = int(np.searchsorted(days[order], day, side="left"))
+        hi = int(np.searchsorted(days[order], day, side="right"))
+        at = min(max(lo, int(np.searchsorted(order, positions[0]))), hi)
+        order = np.insert(order, at, positions)
+        days = days.copy()
+        days[positions] = day
+        days = days[order]
+        days.flags.writeable = False
+        return FactDataset._derived(frame.take(order).reset_index(drop=True), days)
+
+    def remove_where(self, **equals):
+        frame, days = self._frame, self._days
+        match = np.ones(len(frame), dtype=bool)
+        for column, value in equals.items():
+            match &= (frame[column] == value).to_numpy()
+        return self._kept(frame, days, ~match)
+
+    def _kept(self, frame, days, keep):
+        """A dataset of the kept rows, in their current order."""
+        kept_days = days[keep]
+        kept_days.flags.writeable = False
+        return FactDataset._derived(frame[keep].reset_index(drop=True), kept_days, unsorted=self._unsorted)
@@ -0,0 +1,46 @@
+import pandas as pd
+
+from budget_ledger import RunningTotals
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Envelope budgets
+#
+# A target is a spending limit for one expense category in one month
+# ("YYYY-MM"). EnvelopeLedger keeps the running actual per (month,
+# category): built once from the tenant's fact rows, then moved by each
+# write instead of being re-summed on every render (see budget_ledger.py).
+# ─────────────────────────────────────────────────────────────────────────────
+REPORT_COLUMNS = ["category", "target", "actual", "remaining", "used"]
+
+
+def year_month(value):
+    return f"{pd.Timestamp(value):%Y-%m}"
+
+
+def envelope_rowid(category, month):
+    """The rowid of a target: one per (month, category)."""
+    return f"{month}/{category}"
+
+
+class EnvelopeLedger(RunningTotals):
+    """Expense totals per month, then category (see budget_ledger.py)."""
+    def bucket(self, fields):
+        date, type_val, _, category = fields[:4]
+        return (f"{date:%Y-%m}", category) if type_val == "expense" else None
+
+    def month_actuals(self, month):
+        """{category: actual} of one month."""
+        return self.group(month)
+
+
+def envelope_report(targets, actuals):
+    """
+    Actual vs target per targeted category: targets is {category: target},
+    actuals {category: spent}. used is actual / target (0 when the target is 0).
+    """
+    rows = []
+    for category, target in sorted(targets.items()):
+        actual = actuals.get(category, 0.0)
+        rows.append({"category": category, "target": target, "actual": actual,
+                     "remaining": target - actual, "used": actual / target if target else 0.0})
+    return pd.DataFrame(rows, columns=REPORT_COLUMNS)
@@ -0,0 +1,64 @@
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Streaming export
+#
+# An export is a stream of Arrow record batches (one warehouse result page
+# each, see budget_data.export_batches()) written as they arrive: every
+# batch becomes one Parquet row group, or the next rows of a CSV file, and
+# is then dropped. Memory holds one page whatever the date range, and
+# the file grows on disk as fast as the warehouse sends pages. The
+# schema is fixed up front from the table's column types, so every batch
+# (and an empty export) has the same columns and types.
+# ─────────────────────────────────────────────────────────────────────────────
+FORMATS = {"csv": "text/csv", "parquet": "application/vnd.apache.parquet"}
+ARROW_TYPES = {
+    "STRING": pa.string(),
+    "DATE": pa.date32(),
+    "FLOAT64": pa.float64(),
+    "INT64": pa.int64(),
+    "TIMESTAMP": pa.timestamp("us", tz="UTC"),
+}
+
+
+def arrow_schema(columns):
+    """Schema of [(name, warehouse type)] columns."""
+    return pa.schema([(name, ARROW_TYPES[col_type]) for name, col_type in columns])
+
+
+def conform(batch, schema):
+    """The batch's columns in schema order, cast to the schema's types."""
+    arrays = [pc.cast(batch.column(field.name), field.type) for field in schema]
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def file_name(table_name, fmt, start_date=None, end_date=None):
+    span = "".join(f"_{day:%Y-%m-%d}" for day in (start_date, end_date) if day is not None)
+    return f"{table_name}{span}.{fmt}"
+
+
+def write_batches(batches, schema, fmt, sink, progress=None):
+    """
+    Write the batches to sink (a path or binary file object) as fmt, one
+    batch at a time. progress(rows) is called with the running row count
+    after each batch. Returns the number of rows written.
+    """
+    if fmt == "parquet":
+        writer = pq.ParquetWriter(sink, schema)
+    elif fmt == "csv":
+        writer = pa_csv.CSVWriter(sink, schema)
+    else:
+        raise ValueError(f"Unknown export format: {fmt!r} (expected one of {', '.join(FORMATS)})")
+    rows = 0
+    with writer:
+        for batch in batches:
+            if not batch.num_rows:
+                continue
+            writer.write_batch(conform(batch, schema))
+            rows += batch.num_rows
+            if progress is not None:
+                progress(rows)
+    return rows
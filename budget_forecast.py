@@ -0,0 +1,138 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Monte Carlo forecast of monthly leftover and total debt
+#
+# The Budget Overview sums planned rows per (month, type, category). Here each
+# planned category amount is multiplied by a random factor whose spread comes
+# from that category's historical month-to-month variation, and the result is
+# simulated tens of thousands of times to get percentile bands.
+#
+# Chunks run on one thread pool shared by the whole process. numpy's random
+# generators and array ops release the GIL, so threads use every core without
+# worker processes (a spawned worker would re-run the Streamlit page as its
+# __main__) and without starting a pool on every click.
+# ─────────────────────────────────────────────────────────────────────────────
+DEFAULT_PERCENTILES = (5, 25, 50, 75, 95)
+CHUNK_SIZE = 5000
+DEBT_CATEGORY = "Debt Payment"
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def category_volatility(history_cat, min_months=3):
+    """
+    Coefficient of variation (std / mean) of each category's monthly total.
+
+    history_cat has the same shape as the Budget Overview `monthly_cat`
+    groupby: year_month, type, category, amount. Categories seen in fewer
+    than `min_months` months get a volatility of 0 (treated as fixed).
+    """
+    if history_cat.empty:
+        return pd.DataFrame(columns=["type", "category", "cv"])
+    stats = history_cat.groupby(["type", "category"])["amount"].agg(["mean", "std", "count"]).reset_index()
+    stats["cv"] = (stats["std"] / stats["mean"].abs()).where(stats["count"] >= min_months, 0.0)
+    stats["cv"] = stats["cv"].replace([np.inf, -np.inf], 0.0).fillna(0.0)
+    return stats[["type", "category", "cv"]]
+
+
+def build_plan_matrix(monthly_cat, volatility):
+    """
+    Pivot the grouped forward plan into a (months x categories) matrix.
+
+    Returns (months, columns, planned, cv, sign, debt_mask) where sign is +1
+    for income and -1 for expense columns and debt_mask marks the
+    "Debt Payment" expense column(s).
+    """
+    plan = monthly_cat.pivot_table(index="year_month", columns=["type", "category"],
+                                   values="amount", aggfunc="sum", fill_value=0.0)
+    plan.sort_index(inplace=True)
+    columns = list(plan.columns)
+    cv_lookup = {(r["type"], r["category"]): r["cv"] for _, r in volatility.iterrows()}
+    cv = np.array([cv_lookup.get(col, 0.0) for col in columns], dtype=float)
+    sign = np.array([1.0 if t == "income" else -1.0 for t, _ in columns])
+    debt_mask = np.array([t == "expense" and c == DEBT_CATEGORY for t, c in columns])
+    return list(plan.index), columns, plan.to_numpy(dtype=float), cv, sign, debt_mask
+
+
+def _simulate_chunk(planned, cv, sign, debt_mask, debt_start, n_sims, seed_seq):
+    rng = np.random.default_rng(seed_seq)
+    n_months, n_cats = planned.shape
+    noise = rng.standard_normal(size=(n_sims, n_months, n_cats))
+    factors = np.clip(1.0 + noise * cv, 0.0, None)
+    flows = planned * factors
+    leftover = (flows * sign).sum(axis=2)
+    payments = flows[:, :, debt_mask].sum(axis=2)
+
+    # Debt is paid down by the (simulated) Debt Payment lines; any month that
+    # ends negative is assumed to be covered by borrowing.
+    debt = np.empty((n_sims, n_months))
+    balance = np.full(n_sims, float(debt_start))
+    for m in range(n_months):
+        balance = np.maximum(balance - payments[:, m], 0.0) + np.maximum(-leftover[:, m], 0.0)
+        debt[:, m] = balance
+    return leftover, debt
+
+
+def _simulate_chunk_args(args):
+    return _simulate_chunk(*args)
+
+
+def _shared_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix="forecast")
+        return _pool
+
+
+def simulate_forecast(monthly_cat, history_cat, debt_start=0.0, n_sims=20000, seed=0,
+                      workers=None, percentiles=DEFAULT_PERCENTILES):
+    """
+    Run the Monte Carlo forecast and return percentile bands.
+
+    - monthly_cat: forward plan grouped by year_month, type, category.
+    - history_cat: past months grouped the same way (drives the variance).
+    - Work is split into fixed-size chunks, each with its own child seed
+      spawned from `seed`, so results are identical for any `workers` value.
+    - workers=1 runs on the calling thread; otherwise chunks go to the shared
+      pool, at most `workers` at a time.
+
+    Returns a dict with "leftover" and "debt" DataFrames (one row per month,
+    one column per percentile) plus the number of simulations run.
+    """
+    if monthly_cat.empty:
+        empty = pd.DataFrame(columns=[f"p{p}" for p in percentiles])
+        return {"leftover": empty, "debt": empty.copy(), "n_sims": 0}
+
+    volatility = category_volatility(history_cat)
+    months, _, planned, cv, sign, debt_mask = build_plan_matrix(monthly_cat, volatility)
+
+    chunk_sizes = [CHUNK_SIZE] * (n_sims // CHUNK_SIZE)
+    if n_sims % CHUNK_SIZE:
+        chunk_sizes.append(n_sims % CHUNK_SIZE)
+    seeds = np.random.SeedSequence(seed).spawn(len(chunk_sizes))
+    jobs = [(planned, cv, sign, debt_mask, debt_start, size, s) for size, s in zip(chunk_sizes, seeds)]
+
+    if workers is None:
+        workers = min(len(jobs), os.cpu_count() or 1)
+    if workers <= 1 or len(jobs) == 1:
+        results = [_simulate_chunk_args(job) for job in jobs]
+    else:
+        pool = _shared_pool()
+        results = []
+        for start in range(0, len(jobs), workers):
+            results += pool.map(_simulate_chunk_args, jobs[start:start + workers])
+
+    leftover = np.concatenate([r[0] for r in results])
+    debt = np.concatenate([r[1] for r in results])
+    index = [str(m) for m in months]
+    cols = [f"p{p}" for p in percentiles]
+    leftover_bands = pd.DataFrame(np.percentile(leftover, percentiles, axis=0).T, index=index, columns=cols)
+    debt_bands = pd.DataFrame(np.percentile(debt, percentiles, axis=0).T, index=index, columns=cols)
+    return {"leftover": leftover_bands, "debt": debt_bands, "n_sims": int(n_sims)}
@@ -0,0 +1,105 @@
+import threading
+
+import pandas as pd
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Running totals over fact rows
+#
+# Base of the per-tenant ledgers that keep sums of amount current as rows
+# are written (envelope actuals, credit card statement balances). A
+# subclass maps a row to a (group, key) bucket, or None to leave it out;
+# the ledger remembers every row's fields and bucket, so each change
+# (add_rows, remove_rows, update_row, remove_where, the same changes
+# SearchIndex takes) takes the old amount out of its bucket and puts the
+# new one in instead of re-summing the table.
+# ─────────────────────────────────────────────────────────────────────────────
+FIELDS = ("date", "type", "amount", "category", "budget_item", "credit_card", "note")
+_POSITION = {name: i for i, name in enumerate(FIELDS)}
+
+
+def _field(fields, name):
+    return fields[_POSITION[name]]
+
+
+class RunningTotals:
+    def __init__(self, fact_rows=None):
+        self.totals = {}    # group -> {key: total}
+        self.rows = {}      # rowid -> (bucket, fields)
+        self._lock = threading.Lock()
+        if fact_rows is not None:
+            self.add_rows(fact_rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def bucket(self, fields):
+        """(group, key) the row's amount counts towards, or None."""
+        raise NotImplementedError
+
+    def group(self, group):
+        """{key: total} of one group (a copy)."""
+        with self._lock:
+            return dict(self.totals.get(group, {}))
+
+    def _add(self, rowid, fields):
+        bucket = self.bucket(fields)
+        self.rows[rowid] = (bucket, fields)
+        if bucket is not None:
+            group = self.totals.setdefault(bucket[0], {})
+            group[bucket[1]] = group.get(bucket[1], 0.0) + _field(fields, "amount")
+
+    def _remove(self, rowid):
+        entry = self.rows.pop(rowid, None)
+        if entry is None:
+            return None
+        bucket, fields = entry
+        if bucket is not None:
+            group = self.totals.get(bucket[0], {})
+            remaining = group.get(bucket[1], 0.0) - _field(fields, "amount")
+            if abs(remaining) < 0.005:
+                group.pop(bucket[1], None)
+            else:
+                group[bucket[1]] = remaining
+        return fields
+
+    def add_rows(self, fact_rows):
+        if fact_rows.empty:
+            return
+        columns = []
+        for name in FIELDS:
+            if name == "date":
+                columns.append(pd.to_datetime(fact_rows["date"]).dt.date)
+            elif name == "amount":
+                columns.append(pd.to_numeric(fact_rows["amount"]).fillna(0.0).astype(float))
+            else:
+                columns.append(fact_rows[name] if name in fact_rows else [None] * len(fact_rows))
+        with self._lock:
+            for rowid, *fields in zip(fact_rows["rowid"], *columns):
+                self._remove(rowid)
+                self._add(rowid, tuple(fields))
+
+    def remove_rows(self, rowids):
+        with self._lock:
+            for rowid in rowids:
+                self._remove(rowid)
+
+    def update_row(self, rowid, **changes):
+        with self._lock:
+            fields = self._remove(rowid)
+            if fields is None:
+                return
+            fields = list(fields)
+            for name, value in changes.items():
+                if name == "date":
+                    value = pd.Timestamp(value).date()
+                elif name == "amount":
+                    value = float(value)
+                fields[_POSITION[name]] = value
+            self._add(rowid, tuple(fields))
+
+    def remove_where(self, **equals):
+        with self._lock:
+            matching = [rowid for rowid, (_, fields) in self.rows.items()
+                        if all(_field(fields, name) == value for name, value in equals.items())]
+            for rowid in matching:
+                self._remove(rowid)
@@ -0,0 +1,57 @@
+import calendar
+from datetime import date
+
+import pandas as pd
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Debt payoff plans
+#
+# A payoff plan pays a debt's balance off in equal monthly payments, on
+# the debt's due day (clamped to shorter months), from this month through
+# the payoff date's month; payments that would fall before today are left
+# out. The plan is plain fact rows (category "Debt Payment", note "Auto
+# Payoff Plan"), so the data layer only adds rowids and a series id and
+# writes them (see budget_data.insert_monthly_payments_for_debt() and
+# recalculate_payoff_plans()).
+# ─────────────────────────────────────────────────────────────────────────────
+PLAN_CATEGORY = "Debt Payment"
+PLAN_NOTE = "Auto Payoff Plan"
+PLAN_COLUMNS = ["date", "type", "amount", "category", "budget_item", "credit_card", "note"]
+
+
+def due_day(due_date_str):
+    """Day of month a debt's payments fall on: the digits of its due date text, else the 1st."""
+    digits = "".join(ch for ch in (due_date_str or "") if ch.isdigit())
+    return max(1, int(digits)) if digits else 1
+
+
+def payment_dates(due_date_str, payoff_date, today=None):
+    """Monthly payment dates from today through payoff_date's month ([] when payoff_date has passed)."""
+    today = today or date.today()
+    if payoff_date <= today:
+        return []
+    day_of_month = due_day(due_date_str)
+    dates = []
+    y, m = today.year, today.month
+    while (y, m) <= (payoff_date.year, payoff_date.month):
+        candidate = date(y, m, min(day_of_month, calendar.monthrange(y, m)[1]))
+        if candidate >= today:
+            dates.append(candidate)
+        y, m = (y + 1, 1) if m == 12 else (y, m + 1)
+    return dates
+
+
+def payoff_plan(debt_name, total_balance, due_date_str, payoff_date, today=None):
+    """The plan's payments as fact rows (PLAN_COLUMNS, no rowid), earliest first."""
+    dates = payment_dates(due_date_str, payoff_date, today)
+    if not dates:
+        return pd.DataFrame(columns=PLAN_COLUMNS)
+    return pd.DataFrame({
+        "date": dates,
+        "type": "expense",
+        "amount": round(total_balance / len(dates), 2),
+        "category": PLAN_CATEGORY,
+        "budget_item": debt_name,
+        "credit_card": None,
+        "note": PLAN_NOTE,
+    }, columns=PLAN_COLUMNS)
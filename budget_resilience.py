@@ -0,0 +1,133 @@
+import random
+import threading
+import time
+
+from google.api_core import exceptions as api_exceptions
+from google.api_core.retry import if_transient_error
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Warehouse failure handling
+#
+# A circuit breaker counts consecutive transient failures (5xx, rate limits,
+# timeouts, dropped connections). After failure_threshold of them it opens
+# and every call fails fast with WarehouseUnavailable instead of waiting on
+# a warehouse that is down. After reset_timeout_s it lets a single probe
+# through (half-open): success closes it, failure opens it again. Errors
+# that are the caller's fault (bad SQL, missing table) do not count.
+# call_with_retries() retries idempotent calls with jittered exponential
+# backoff ("full jitter": a random wait up to base * 2**attempt).
+# ─────────────────────────────────────────────────────────────────────────────
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RESET_TIMEOUT_S = 30.0
+DEFAULT_ATTEMPTS = 3
+DEFAULT_BASE_DELAY_S = 0.2
+DEFAULT_MAX_DELAY_S = 2.0
+
+_TRANSIENT_ERRORS = (
+    api_exceptions.DeadlineExceeded,
+    api_exceptions.GatewayTimeout,
+    api_exceptions.BadGateway,
+    ConnectionError,
+    TimeoutError,  # also concurrent.futures.TimeoutError from job.result(timeout=...)
+)
+
+
+class WarehouseUnavailable(Exception):
+    """The circuit breaker is open: the warehouse was not called."""
+
+
+def is_transient(exc):
+    """Errors worth retrying, and that say the warehouse (not the query) is failing."""
+    return isinstance(exc, _TRANSIENT_ERRORS) or if_transient_error(exc)
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=DEFAULT_FAILURE_THRESHOLD, reset_timeout_s=DEFAULT_RESET_TIMEOUT_S,
+                 clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout_s = reset_timeout_s
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self.opened_at is None:
+                return "closed"
+            return "half_open" if self.probing or self._probe_due() else "open"
+
+    def probe_due(self):
+        """True when open, past reset_timeout_s and no probe is running."""
+        with self._lock:
+            return self.opened_at is not None and not self.probing and self._probe_due()
+
+    def allow(self):
+        """
+        Whether a call may go to the warehouse now. When it is the half-open
+        probe, the caller must report the outcome (record_success/failure).
+        """
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if self.probing or not self._probe_due():
+                return False
+            self.probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.probing or self.failures >= self.failure_threshold:
+                self.opened_at = self.clock()
+            self.probing = False
+
+    def release(self):
+        """End a probe whose call failed for a reason that says nothing about the warehouse."""
+        with self._lock:
+            self.probing = False
+
+    def call(self, fn):
+        if not self.allow():
+            raise WarehouseUnavailable(
+                f"Warehouse circuit open after {self.failures} consecutive failures; "
+                f"retrying in up to {self.reset_timeout_s:.0f}s")
+        try:
+            result = fn()
+        except Exception as exc:
+            if is_transient(exc):
+                self.record_failure()
+            else:
+                self.release()
+            raise
+        self.record_success()
+        return result
+
+    def reset(self):
+        self.record_success()
+
+    def _probe_due(self):
+        return self.clock() - self.opened_at >= self.reset_timeout_s
+
+
+def call_with_retries(fn, attempts=DEFAULT_ATTEMPTS, base_delay_s=DEFAULT_BASE_DELAY_S,
+                      max_delay_s=DEFAULT_MAX_DELAY_S, sleep=time.sleep):
+    """
+    fn() retried on transient errors, at most attempts times in all.
+    WarehouseUnavailable is not retried: the breaker already gave up.
+    """
+    for attempt in range(attempts):
+        try:
+            return fn()
+        except Exception as exc:
+            if attempt == attempts - 1 or not is_transient(exc):
+                raise
+            sleep(random.uniform(0, min(max_delay_s, base_delay_s * 2 ** attempt)))
@@ -0,0 +1,176 @@
+import bisect
+import re
+import threading
+
+import numpy as np
+import pandas as pd
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Transaction search
+#
+# An inverted index over the words in note, budget_item, category and
+# credit_card: token -> set of doc ids, plus a sorted token list so a prefix
+# ("groc") is a bisect range instead of a scan. Amount and date live in
+# numpy arrays indexed by doc id, so range filters are one vectorized mask
+# over the candidates. Rows are added, updated and removed in place as the
+# app writes, so the index is built from the fact table only once.
+# ─────────────────────────────────────────────────────────────────────────────
+SEARCH_FIELDS = ("note", "budget_item", "category", "credit_card")
+DEFAULT_LIMIT = 200
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    if text is None or (isinstance(text, float) and np.isnan(text)):
+        return []
+    return _TOKEN_RE.findall(str(text).lower())
+
+
+class SearchIndex:
+    def __init__(self, fact_rows=None):
+        self.postings = {}          # token -> set(doc id)
+        self.tokens = []            # sorted keys of postings
+        self.rows = []              # doc id -> row dict (None once removed)
+        self.doc_by_rowid = {}
+        self.amounts = np.zeros(0)
+        self.days = np.zeros(0, dtype="int64")   # date as days since epoch
+        self.alive = np.zeros(0, dtype=bool)
+        self.lock = threading.RLock()
+        if fact_rows is not None:
+            self.add_rows(fact_rows)
+
+    def __len__(self):
+        return len(self.doc_by_rowid)
+
+    def add_rows(self, fact_rows):
+        """Index new fact rows (a DataFrame shaped like fact_budget_inputs)."""
+        records = fact_rows.to_dict("records")
+        with self.lock:
+            start = len(self.rows)
+            self._grow(start + len(records))
+            new_tokens = set()
+            for doc, row in enumerate(records, start):
+                row["date"] = pd.Timestamp(row["date"])
+                if row["rowid"] in self.doc_by_rowid:
+                    self._remove_doc(self.doc_by_rowid[row["rowid"]])
+                self.rows.append(row)
+                self.doc_by_rowid[row["rowid"]] = doc
+                self.amounts[doc] = row["amount"] or 0.0
+                self.days[doc] = _day_number(row["date"])
+                self.alive[doc] = True
+                for token in self._row_tokens(row):
+                    docs = self.postings.get(token)
+                    if docs is None:
+                        self.postings[token] = docs = set()
+                        new_tokens.add(token)
+                    docs.add(doc)
+            if len(new_tokens) > 16:
+                self.tokens = sorted(self.postings)
+            else:
+                for token in new_tokens:
+                    bisect.insort(self.tokens, token)
+
+    def update_row(self, rowid, **changes):
+        """Change indexed fields of one row in place (e.g. date, amount)."""
+        with self.lock:
+            doc = self.doc_by_rowid.get(rowid)
+            if doc is None:
+                return
+            row = dict(self.rows[doc], **changes)
+            self._remove_doc(doc)
+            self.add_rows(pd.DataFrame([row]))
+
+    def remove_rows(self, rowids):
+        with self.lock:
+            for rowid in rowids:
+                doc = self.doc_by_rowid.get(rowid)
+                if doc is not None:
+                    self._remove_doc(doc)
+
+    def remove_where(self, **equals):
+        """Remove every row whose fields equal all the given values."""
+        with self.lock:
+            matches = [row["rowid"] for row in self.rows
+                       if row is not None and all(row.get(k) == v for k, v in equals.items())]
+            self.remove_rows(matches)
+
+    def search(self, text="", min_amount=None, max_amount=None, start_date=None, end_date=None,
+               limit=DEFAULT_LIMIT):
+        """
+        Rows matching every word of text (each word as a prefix) and the
+        optional amount/date bounds (inclusive), newest first. An empty text
+        matches every row, so the filters can be used alone.
+        """
+        with self.lock:
+            candidates = None
+            for term in tokenize(text):
+                docs = self._prefix_docs(term)
+                candidates = docs if candidates is None else candidates & docs
+                if not candidates:
+                    return self._frame([])
+            if candidates is None:
+                docs = np.flatnonzero(self.alive)
+            else:
+                docs = np.fromiter(candidates, dtype="int64", count=len(candidates))
+            mask = self.alive[docs]
+            if min_amount is not None:
+                mask &= self.amounts[docs] >= min_amount
+            if max_amount is not None:
+                mask &= self.amounts[docs] <= max_amount
+            if start_date is not None:
+                mask &= self.days[docs] >= _day_number(start_date)
+            if end_date is not None:
+                mask &= self.days[docs] <= _day_number(end_date)
+            docs = docs[mask]
+            # newest first; doc id breaks ties so results are stable
+            order = np.lexsort((-docs, -self.days[docs]))[:limit]
+            return self._frame([self.rows[d] for d in docs[order]])
+
+    def _prefix_docs(self, prefix):
+        docs = set()
+        i = bisect.bisect_left(self.tokens, prefix)
+        while i < len(self.tokens) and self.tokens[i].startswith(prefix):
+            docs |= self.postings[self.tokens[i]]
+            i += 1
+        return docs
+
+    def _row_tokens(self, row):
+        return {token for field in SEARCH_FIELDS for token in tokenize(row.get(field))}
+
+    def _remove_doc(self, doc):
+        row = self.rows[doc]
+        if row is None:
+            return
+        for token in self._row_tokens(row):
+            docs = self.postings.get(token)
+            if docs is not None:
+                docs.discard(doc)
+                if not docs:
+                    del self.postings[token]
+                    i = bisect.bisect_left(self.tokens, token)
+                    if i < len(self.tokens) and self.tokens[i] == token:
+                        del self.tokens[i]
+        self.rows[doc] = None
+        self.alive[doc] = False
+        if self.doc_by_rowid.get(row["rowid"]) == doc:
+            del self.doc_by_rowid[row["rowid"]]
+
+    def _grow(self, size):
+        if size <= len(self.alive):
+            return
+        capacity = max(size, 2 * len(self.alive), 1024)
+        self.amounts = np.resize(self.amounts, capacity)
+        self.days = np.resize(self.days, capacity)
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:len(self.alive)] = self.alive
+        self.alive = alive
+
+    def _frame(self, rows):
+        columns = list(rows[0]) if rows else ["rowid", "date", "type", "amount", "category",
+                                              "budget_item", "credit_card", "note"]
+        return pd.DataFrame(rows, columns=columns)
+
+
+def _day_number(value):
+    return int(pd.Timestamp(value).normalize().value // 86_400_000_000_000)
@@ -0,0 +1,146 @@
+import pandas as pd
+from dateutil.relativedelta import relativedelta
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Recurring series
+#
+# A repeating transaction is stored as one rule row (start date, cadence,
+# a number of occurrences and/or an end date, and the transaction fields)
+# instead of one fact row per occurrence. Occurrences are generated only
+# for the date window being read, starting from the first one that can
+# fall in it, so a 30-year plan costs the same as a 3-month one.
+# Changing a single occurrence stores an exception keyed by
+# (series, occurrence number): a new date/amount/note, or a skip.
+# Occurrence n (1-based) of a monthly series falls on the start date's day
+# of month n - 1 months later, clamped to shorter months (the 31st is
+# Feb 28/29, then back to the 31st).
+# ─────────────────────────────────────────────────────────────────────────────
+CADENCES = {
+    "weekly": relativedelta(weeks=1),
+    "biweekly": relativedelta(weeks=2),
+    "monthly": relativedelta(months=1),
+    "quarterly": relativedelta(months=3),
+    "yearly": relativedelta(years=1),
+}
+FACT_COLUMNS = ["rowid", "date", "type", "amount", "category", "budget_item", "credit_card", "note"]
+OCCURRENCE_COLUMNS = FACT_COLUMNS + ["series_id", "occurrence"]
+
+
+def occurrence_rowid(series_id, occurrence):
+    """The rowid of a generated occurrence, also the rowid of its exception."""
+    return f"{series_id}:{occurrence}"
+
+
+def _as_date(value):
+    return pd.Timestamp(value).date()
+
+
+def _missing(value):
+    return value is None or value is pd.NaT or (isinstance(value, float) and value != value)
+
+
+def occurrence_date(rule, occurrence):
+    """Scheduled date of occurrence n (1-based), always computed from the start."""
+    return _as_date(rule["start_date"]) + CADENCES[rule["cadence"]] * (occurrence - 1)
+
+
+def _first_candidate(rule, start):
+    """An occurrence number no later than the first one on or after start."""
+    first = _as_date(rule["start_date"])
+    if start <= first:
+        return 1
+    step = CADENCES[rule["cadence"]]
+    if step.months or step.years:
+        months = 12 * step.years + step.months
+        elapsed = (start.year - first.year) * 12 + start.month - first.month
+        return max(1, elapsed // months)
+    return max(1, (start - first).days // (7 * step.weeks))
+
+
+def last_occurrence(rule):
+    """Number of the final occurrence, from the count and/or the end date."""
+    count = None if _missing(rule.get("occurrences")) else int(rule["occurrences"])
+    if _missing(rule.get("end_date")):
+        return count
+    end = _as_date(rule["end_date"])
+    n = _first_candidate(rule, end)
+    while occurrence_date(rule, n + 1) <= end:
+        n += 1
+    if occurrence_date(rule, n) > end:
+        n -= 1
+    return n if count is None else min(n, count)
+
+
+def scheduled_occurrences(rule, start_date, end_date):
+    """[(n, date)] of the rule's occurrences with start_date <= date <= end_date."""
+    start, end = _as_date(start_date), _as_date(end_date)
+    last = last_occurrence(rule)
+    found = []
+    n = _first_candidate(rule, start)
+    while last is None or n <= last:
+        when = occurrence_date(rule, n)
+        if when > end:
+            break
+        if when >= start:
+            found.append((n, when))
+        n += 1
+    return found
+
+
+def _occurrence_note(rule, occurrence, last):
+    note = None if _missing(rule.get("note")) else rule["note"]
+    tag = f"Recurring {occurrence}/{last}" if last is not None else f"Recurring {occurrence}"
+    return f"{note} ({tag})" if note else tag
+
+
+def expand_series(rules, exceptions, start_date, end_date):
+    """
+    Fact-shaped rows (plus series_id and occurrence) for every occurrence
+    dated start_date..end_date after exceptions: skipped ones are dropped,
+    overridden ones carry the new values, and an occurrence moved into the
+    window from outside it is included. exceptions may be None.
+    """
+    start, end = _as_date(start_date), _as_date(end_date)
+    by_occurrence = {}
+    moved_in = []
+    for exception in [] if exceptions is None else exceptions.to_dict("records"):
+        key = (exception["series_id"], int(exception["occurrence"]))
+        by_occurrence[key] = exception
+        if exception["action"] == "override" and not _missing(exception.get("date")):
+            if start <= _as_date(exception["date"]) <= end:
+                moved_in.append(key)
+
+    rows = []
+    for rule in rules.to_dict("records"):
+        series_id = rule["rowid"]
+        last = last_occurrence(rule)
+        occurrences = dict(scheduled_occurrences(rule, start, end))
+        for key in moved_in:
+            if key[0] == series_id and key[1] not in occurrences and (last is None or key[1] <= last):
+                occurrences[key[1]] = occurrence_date(rule, key[1])
+        for n, when in sorted(occurrences.items()):
+            row = {
+                "rowid": occurrence_rowid(series_id, n),
+                "date": when,
+                "type": rule["type"],
+                "amount": rule["amount"],
+                "category": rule["category"],
+                "budget_item": rule["budget_item"],
+                "credit_card": rule.get("credit_card"),
+                "note": _occurrence_note(rule, n, last),
+                "series_id": series_id,
+                "occurrence": n,
+            }
+            exception = by_occurrence.get((series_id, n))
+            if exception is not None:
+                if exception["action"] == "skip":
+                    continue
+                for field in ("date", "amount", "note"):
+                    if not _missing(exception.get(field)):
+                        row[field] = _as_date(exception[field]) if field == "date" else exception[field]
+            if start <= row["date"] <= end:
+                rows.append(row)
+    frame = pd.DataFrame(rows, columns=OCCURRENCE_COLUMNS)
+    frame["date"] = pd.to_datetime(frame["date"])
+    return frame
+
@@ -0,0 +1,147 @@
+import json
+import os
+import threading
+import time
+from datetime import timedelta
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from google.cloud import bigquery
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Local Parquet snapshots with incremental delta sync
+#
+# Each table is kept as <dir>/<table>.parquet plus a small JSON file holding
+# the sync watermark (the newest updated_at seen). Snapshots are
+# memory-mapped at startup. A sync then fetches only rows with
+# updated_at > watermark, plus the list of live rowids so rows deleted in the
+# warehouse are dropped too. With a tenant_id, a snapshot holds only that
+# tenant's rows and every sync query is filtered by it. A table whose rows
+# are not simply the stored ones (see the change journal in budget_data.py)
+# passes a source: a callable returning the SELECT of its current rows and
+# that query's parameters.
+# ─────────────────────────────────────────────────────────────────────────────
+# Re-read a few minutes before the watermark so a write that committed late
+# with an earlier timestamp is not missed; duplicates are dropped by rowid.
+SYNC_OVERLAP = timedelta(minutes=5)
+DEFAULT_MAX_AGE_SECONDS = 60
+
+
+class TableSnapshot:
+    def __init__(self, directory, table_name, table_id, tenant_id=None, source=None):
+        self.table_name = table_name
+        self.table_id = table_id
+        self.tenant_id = tenant_id
+        self.source = source or self._table_source
+        self.path = os.path.join(directory, f"{table_name}.parquet")
+        self.meta_path = os.path.join(directory, f"{table_name}.json")
+        self.frame = None
+        self.watermark = None
+        self.synced_at = None
+        self.dirty = True
+        self.lock = threading.Lock()
+
+    def open(self):
+        """Memory-map the snapshot left by a previous process, if any."""
+        if not (os.path.exists(self.path) and os.path.exists(self.meta_path)):
+            return False
+        with open(self.meta_path) as fh:
+            meta = json.load(fh)
+        if meta.get("table_id") != self.table_id or meta.get("tenant_id") != self.tenant_id:
+            return False
+        self.frame = _normalize(pq.read_table(self.path, memory_map=True).to_pandas())
+        self.watermark = pd.Timestamp(meta["watermark"]) if meta.get("watermark") else None
+        return True
+
+    def sync(self, read_query):
+        """
+        Bring the snapshot up to date. The first sync (or one without a
+        watermark) reads the whole table; later ones read only the delta.
+        Returns the number of changed rows fetched.
+        """
+        started = pd.Timestamp.now(tz="UTC")
+        source, params = self.source()
+        if self.frame is None or self.watermark is None:
+            changed = _normalize(read_query(f"SELECT * FROM ({source}) AS source_rows",
+                                            job_config=bigquery.QueryJobConfig(query_parameters=params)))
+            frame = changed
+        else:
+            job_config = bigquery.QueryJobConfig(query_parameters=params + [
+                bigquery.ScalarQueryParameter("since", "TIMESTAMP", (self.watermark - SYNC_OVERLAP).to_pydatetime()),
+            ])
+            changed = _normalize(read_query(
+                f"SELECT * FROM ({source}) AS source_rows WHERE updated_at > @since", job_config=job_config))
+            live_ids = read_query(f"SELECT rowid FROM ({source}) AS source_rows",
+                                  job_config=bigquery.QueryJobConfig(query_parameters=params))["rowid"]
+            keep = self.frame[~self.frame["rowid"].isin(changed["rowid"]) & self.frame["rowid"].isin(live_ids)]
+            frame = changed if keep.empty else keep if changed.empty else pd.concat([keep, changed], ignore_index=True)
+
+        newest = changed["updated_at"].max() if "updated_at" in changed and not changed.empty else None
+        if newest is not None and not pd.isna(newest):
+            self.watermark = newest if self.watermark is None else max(self.watermark, newest)
+        elif self.watermark is None:
+            # Only rows from before updated_at existed: anything written from
+            # now on is stamped later than this
+            self.watermark = started
+        self.frame = frame.reset_index(drop=True)
+        self._write()
+        self.synced_at = time.monotonic()
+        self.dirty = False
+        return len(changed)
+
+    def _table_source(self):
+        if self.tenant_id is None:
+            return f"SELECT * FROM `{self.table_id}`", []
+        return (f"SELECT * FROM `{self.table_id}` WHERE tenant_id = @tenant_id",
+                [bigquery.ScalarQueryParameter("tenant_id", "STRING", self.tenant_id)])
+
+    def _write(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        pq.write_table(pa.Table.from_pandas(self.frame, preserve_index=False), tmp_path)
+        os.replace(tmp_path, self.path)
+        meta = {"table_id": self.table_id, "tenant_id": self.tenant_id,
+                "watermark": self.watermark.isoformat() if self.watermark is not None else None}
+        with open(self.meta_path + ".tmp", "w") as fh:
+            json.dump(meta, fh)
+        os.replace(self.meta_path + ".tmp", self.meta_path)
+
+
+def _normalize(df):
+    df = df.copy()
+    if "updated_at" in df:
+        df["updated_at"] = pd.to_datetime(df["updated_at"], utc=True, format="ISO8601")
+    if "date" in df:
+        df["date"] = pd.to_datetime(df["date"])
+    return df
+
+
+class SnapshotStore:
+    """
+    Process-wide set of table snapshots. frame(name, read_query) returns the
+    current DataFrame (shared; callers must not mutate it), syncing first when
+    it is marked dirty or older than max_age_seconds.
+    """
+    def __init__(self, directory, table_ids, max_age_seconds=DEFAULT_MAX_AGE_SECONDS, tenant_id=None,
+                 sources=None):
+        self.max_age_seconds = max_age_seconds
+        sources = sources or {}
+        self.tables = {name: TableSnapshot(directory, name, table_id, tenant_id, sources.get(name))
+                       for name, table_id in table_ids.items()}
+        for snapshot in self.tables.values():
+            snapshot.open()
+
+    def frame(self, table_name, read_query):
+        snapshot = self.tables[table_name]
+        with snapshot.lock:
+            stale = (snapshot.synced_at is None
+                     or time.monotonic() - snapshot.synced_at > self.max_age_seconds)
+            if snapshot.dirty or stale or snapshot.frame is None:
+                snapshot.sync(read_query)
+            return snapshot.frame
+
+    def mark_dirty(self, table_name=None):
+        for name, snapshot in self.tables.items():
+            if table_name is None or name == table_name:
+                snapshot.dirty = True
@@ -0,0 +1,180 @@
+import contextvars
+import functools
+import json
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Per-rerun span tracing
+#
+# Each Streamlit rerun is one trace. Data functions (via @traced), the page
+# (open_span() ... close_span(), so the page script is not nested in a
+# block) and fragments (`with span(...)`) append spans recording wall time,
+# rows returned, bytes processed, warehouse jobs and cache hit/miss.
+# Finished traces are kept in memory for the sidebar panel and, when a log
+# path is configured, appended to a JSON-lines file.
+# ─────────────────────────────────────────────────────────────────────────────
+_current_trace = contextvars.ContextVar("budget_current_trace", default=None)
+_log_lock = threading.Lock()
+_log_path = None
+
+
+def configure(log_path=None):
+    global _log_path
+    _log_path = log_path or None
+
+
+def start_rerun(previous=None, page=None):
+    """
+    Begin a new trace for this rerun. Streamlit may run each rerun on a new
+    thread, so the caller passes the session's previous trace; if it never
+    reached finish_rerun() (e.g. cut short by st.rerun()) it is closed as
+    interrupted.
+    """
+    if previous is not None and previous.get("wall_ms") is None:
+        _close(previous, interrupted=True)
+    trace = {
+        "trace_id": uuid.uuid4().hex,
+        "page": page,
+        "started_at": datetime.now().isoformat(timespec="milliseconds"),
+        "wall_ms": None,
+        "interrupted": False,
+        "spans": [],
+        "_t0": time.perf_counter(),
+        "_stack": [],
+    }
+    _current_trace.set(trace)
+    return trace
+
+
+def set_page(page):
+    trace = _current_trace.get()
+    if trace is not None:
+        trace["page"] = page
+
+
+def finish_rerun():
+    trace = _current_trace.get()
+    if trace is not None and trace.get("wall_ms") is None:
+        while trace["_stack"]:
+            close_span(trace["_stack"][-1])
+        _close(trace, interrupted=False)
+    return trace
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+def _close(trace, interrupted):
+    trace["wall_ms"] = (time.perf_counter() - trace["_t0"]) * 1000
+    trace["interrupted"] = interrupted
+    if _log_path:
+        record = {k: v for k, v in trace.items() if not k.startswith("_")}
+        with _log_lock, open(_log_path, "a") as fh:
+            fh.write(json.dumps(record, default=str) + "\n")
+
+
+def open_span(name, kind="render"):
+    """
+    Start a span of the current trace that stays open until close_span()
+    (or finish_rerun()), for a phase that is not one block. Outside a trace
+    (CLI, benchmarks) this returns a span dict but records nothing.
+    """
+    trace = _current_trace.get()
+    record = {"name": name, "kind": kind, "parent": None, "depth": 0, "start_ms": 0.0, "wall_ms": None,
+              "rows": None, "bytes_processed": 0, "jobs": 0, "cache": None, "error": None,
+              "nested_data": False}
+    if trace is None:
+        return record
+    stack = trace["_stack"]
+    record["parent"] = stack[-1]["name"] if stack else None
+    record["depth"] = len(stack)
+    # Data spans inside another data span are not counted twice in totals
+    record["nested_data"] = kind == "data" and any(s["kind"] == "data" for s in stack)
+    record["start_ms"] = (time.perf_counter() - trace["_t0"]) * 1000
+    trace["spans"].append(record)
+    stack.append(record)
+    return record
+
+
+def close_span(record):
+    """End a span from open_span() and any still open inside it."""
+    trace = _current_trace.get()
+    if trace is None or not any(open_record is record for open_record in trace["_stack"]):
+        return
+    now_ms = (time.perf_counter() - trace["_t0"]) * 1000
+    while trace["_stack"]:
+        inner = trace["_stack"].pop()
+        inner["wall_ms"] = now_ms - inner["start_ms"]
+        if inner is record:
+            break
+
+
+@contextmanager
+def span(name, kind="render"):
+    """Time a block as a span of the current trace (see open_span())."""
+    record = open_span(name, kind)
+    try:
+        yield record
+    except Exception as exc:
+        # st.rerun() and st.stop() are control flow, not failures
+        if type(exc).__name__ not in ("RerunException", "StopException"):
+            record["error"] = f"{type(exc).__name__}: {exc}"
+        raise
+    finally:
+        close_span(record)
+
+
+def annotate(bytes_processed=0, jobs=0, cache=None, **extra):
+    """
+    Add warehouse stats to the innermost open span. Bytes and jobs are
+    summed; cache is "hit" / "miss" (a miss wins if several jobs ran).
+    """
+    trace = _current_trace.get()
+    if trace is None or not trace["_stack"]:
+        return
+    record = trace["_stack"][-1]
+    record["bytes_processed"] += bytes_processed or 0
+    record["jobs"] += jobs
+    if cache is not None and record["cache"] != "miss":
+        record["cache"] = cache
+    record.update(extra)
+
+
+def traced(fn):
+    """
+    Decorator for data functions: one "data" span per call, with the
+    number of rows returned when the result has a length.
+    """
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with span(fn.__name__, kind="data") as record:
+            result = fn(*args, **kwargs)
+            if hasattr(result, "__len__") and not isinstance(result, str):
+                record["rows"] = len(result)
+            return result
+    return wrapper
+
+
+def summarize(trace):
+    """
+    Totals for a trace: wall time, time spent in (outermost) data
+    functions, and warehouse bytes and jobs. The rest of the wall time
+    is pandas and Streamlit rendering.
+    """
+    data_ms = sum(r["wall_ms"] or 0.0 for r in trace["spans"]
+                  if r["kind"] == "data" and not r.get("nested_data"))
+    wall_ms = trace["wall_ms"]
+    if wall_ms is None:
+        wall_ms = (time.perf_counter() - trace["_t0"]) * 1000
+    return {
+        "wall_ms": wall_ms,
+        "data_ms": data_ms,
+        "render_ms": max(wall_ms - data_ms, 0.0),
+        "bytes": sum(r["bytes_processed"] for r in trace["spans"]),
+        "jobs": sum(r["jobs"] for r in trace["spans"]),
+    }
@@ -0,0 +1,462 @@
+import streamlit as st
+import pandas as pd
+import calendar
+import uuid
+
+import budget_trace
+from budget_data import (
+    update_fact_row, remove_fact_row, update_series_occurrence, skip_series_occurrence, update_debt_item,
+    update_series_from, update_fact_series_from, remove_series, remove_fact_series, series_size,
+    recalculate_payoff_plans, idempotency_key,
+)
+
+# ─────────────────────────────────────────────────────────────────────────────
+# 0) Query Parameter and Rerun Fallback Functions
+# ─────────────────────────────────────────────────────────────────────────────
+def get_query_params_fallback():
+    """
+    Safely read query params:
+    - If st.query_params exists (newer Streamlit), use it.
+    - Else fallback to st.experimental_get_query_params (older Streamlit).
+    
+    Returns a dict-like object that can be accessed with standard
+    dictionary syntax.
+    """
+    if hasattr(st, "query_params"):
+        # Convert to dict to ensure consistent behavior
+        return dict(st.query_params)
+    else:
+        return st.experimental_get_query_params()
+
+def set_query_params_fallback(**kwargs):
+    """
+    Safely set query params:
+    - If st.query_params.update exists (newest Streamlit), use it.
+    - Else if st.query_params exists (newer Streamlit), manually set.
+    - Else fallback to st.experimental_set_query_params (older Streamlit).
+    """
+    if hasattr(st, "query_params") and hasattr(st.query_params, "update"):
+        # Newest API (Streamlit 1.32+)
+        st.query_params.update(**kwargs)
+    elif hasattr(st, "query_params"):
+        # Newer API but without update method
+        # Clear existing params then set new ones
+        current_params = dict(st.query_params)
+        for key in list(current_params.keys()):
+            del st.query_params[key]
+        for key, value in kwargs.items():
+            st.query_params[key] = value
+    else:
+        # Legacy API
+        st.experimental_set_query_params(**kwargs)
+
+def rerun_fallback():
+    """
+    Safely rerun the app:
+    - If st.rerun exists (newer Streamlit), use it.
+    - Else fallback to st.experimental_rerun (older Streamlit).
+    """
+    if hasattr(st, "rerun"):
+        st.rerun()
+    else:
+        st.experimental_rerun()
+
+def set_state(key, value):
+    """
+    Widget callback that sets st.session_state[key]. Callbacks run before
+    the rerun, so a click inside a fragment can change what that fragment
+    shows without a second, full rerun.
+    """
+    st.session_state[key] = value
+
+def submission_key(form, *values):
+    """
+    Idempotency key of a form's submission (see budget_data.idempotency_key()):
+    the form's submission token plus the submitted values. The token only
+    changes in new_submission(), called on runs where the form was not
+    submitted, so a rerun that replays a submit, or a second click landing
+    before the app reran, writes nothing twice.
+    """
+    token = st.session_state.setdefault(f"{form}_submission", str(uuid.uuid4()))
+    return idempotency_key(form, token, *values)
+
+def new_submission(form):
+    st.session_state[f"{form}_submission"] = str(uuid.uuid4())
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Helper functions to render transaction and debt rows using inline HTML
+# ─────────────────────────────────────────────────────────────────────────────
+def render_transaction_row(row, color_class):
+    row_id = row["rowid"]
+    date_str = row["date"].strftime("%Y-%m-%d")
+    item_str = row["budget_item"]
+    amount_str = f"${row['amount']:,.2f}"
+    html = f"""
+    <div class="line-item-container">
+      <span style="color:#fff; font-weight:bold;">{date_str}</span>
+      <span style="color:#fff;">{item_str}</span>
+      <span style="color:{color_class};">{amount_str}</span>
+      <button class="line-item-button" onclick="window.location.href='?action=edit&rowid={row_id}'">Edit</button>
+      <button class="line-item-button remove" onclick="window.location.href='?action=remove&rowid={row_id}'">❌</button>
+    </div>
+    """
+    st.markdown(html, unsafe_allow_html=True)
+
+def render_transaction_edit(row, color_class):
+    row_id = row["rowid"]
+    st.markdown(f"<div class='line-item-container' style='background-color:#444; color:#fff; font-weight:bold;'>Editing: {row['budget_item']} (${row['amount']:,.2f})</div>", unsafe_allow_html=True)
+    st.session_state["temp_budget_edit_date"] = st.date_input("Date", value=row["date"], key=f"edit_date_{row_id}")
+    st.session_state["temp_budget_edit_amount"] = st.number_input("Amount", min_value=0.0, format="%.2f",
+                                                                  value=float(row["amount"]), key=f"edit_amount_{row_id}")
+    col1, col2 = st.columns(2)
+    if col1.button("Save", key=f"save_{row_id}"):
+        update_fact_row(row_id, st.session_state["temp_budget_edit_date"],
+                        st.session_state["temp_budget_edit_amount"])
+        st.session_state["editing_budget_item"] = None
+        rerun_fallback()
+    if col2.button("Cancel", key=f"cancel_{row_id}"):
+        st.session_state["editing_budget_item"] = None
+        rerun_fallback()
+
+def render_debt_transaction_row(row):
+    row_id = row["rowid"]
+    name = row["debt_name"]
+    balance_str = f"${row['current_balance']:,.2f}"
+    due = row["due_date"] if row["due_date"] else "(None)"
+    min_pay = row["minimum_payment"] if pd.notnull(row["minimum_payment"]) else "(None)"
+    is_recalc = True if row.get("payoff_plan_date") else False
+    
+    # Display the main debt information and Edit/Delete buttons using HTML
+    html = f"""
+    <div class="line-item-container" style="margin-bottom:0px; border-bottom-left-radius:0; border-bottom-right-radius:0;">
+      <span style="color:#fff; font-weight:bold;">{name}</span>
+      <span style="color:#fff;">Due: {due}, Min: {min_pay}</span>
+      <span style="color:red;">{balance_str}</span>
+      <button class="line-item-button" onclick="window.location.href='?action=edit_debt&rowid={row_id}'">Edit</button>
+      <button class="line-item-button remove" onclick="window.location.href='?action=remove_debt&rowid={row_id}'">❌</button>
+    </div>
+    """
+    st.markdown(html, unsafe_allow_html=True)
+    
+    # Use native Streamlit button for the Payoff/Recalc functionality
+    # Create a container that matches the style of the line item
+    button_container = f"""
+    <div style="display:flex; justify-content:center; background-color:#333; 
+                max-width:360px; margin:0 auto 4px auto; padding:4px; 
+                border-top:none; border-bottom-left-radius:4px; border-bottom-right-radius:4px;">
+    </div>
+    """
+    st.markdown(button_container, unsafe_allow_html=True)
+    
+    # Now add the native Streamlit button that will handle the action properly
+    if is_recalc:
+        if st.button("Recalculate Payment Plan", key=f"recalc_btn_{row_id}"):
+            # Process recalc action directly
+            recalculate_payoff_plans([row_id])
+            st.success("Payment plan recalculated!")
+            rerun_fallback()
+    else:
+        if st.button("Create Payoff Plan", key=f"payoff_btn_{row_id}"):
+            # Set the active payoff plan directly
+            st.session_state["active_payoff_plan"] = row_id
+            rerun_fallback()
+
+def render_debt_transaction_edit(row):
+    row_id = row["rowid"]
+    st.markdown(f"<div class='line-item-container' style='background-color:#444; color:#fff; font-weight:bold;'>Editing: {row['debt_name']}</div>", unsafe_allow_html=True)
+    st.session_state["temp_new_balance"] = st.number_input("New Balance", min_value=0.0, format="%.2f",
+                                                           value=float(row["current_balance"]), key=f"edit_debt_balance_{row_id}")
+    col1, col2 = st.columns(2)
+    if col1.button("Save", key=f"save_debt_{row_id}"):
+        update_debt_item(row_id, st.session_state["temp_new_balance"])
+        st.session_state["editing_debt_item"] = None
+        rerun_fallback()
+    if col2.button("Cancel", key=f"cancel_debt_{row_id}"):
+        st.session_state["editing_debt_item"] = None
+        rerun_fallback()
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Updated render_budget_row with try/except blocks for rerun
+# ─────────────────────────────────────────────────────────────────────────────
+def render_budget_row(row, color_class):
+    row_id = row["rowid"]
+    date_str = row["date"].strftime("%Y-%m-%d")
+    item_str = row["budget_item"]
+    amount_str = f"${row['amount']:,.2f}"
+    is_editing = (st.session_state["editing_budget_item"] == row_id)
+    # Occurrences of a recurring series are edited through exceptions; a
+    # payoff plan's rows are fact rows sharing a series_id
+    is_occurrence = pd.notna(row.get("occurrence"))
+    in_series = pd.notna(row.get("series_id"))
+    is_archived = pd.notna(row.get("archived"))
+
+    # Use original column ratio but with slightly more space for buttons
+    main_bar_col, btns_col = st.columns([0.75, 0.25])
+
+    if is_editing:
+        with main_bar_col:
+            st.markdown(f"""
+            <div style="display:flex;align-items:center;background-color:#333;
+                        padding:8px;border-radius:5px;margin-bottom:4px;
+                        justify-content:space-between;">
+                <div style="font-size:14px;font-weight:bold;color:#fff; min-width:80px;">
+                    Editing...
+                </div>
+                <div style="flex:1;margin-left:8px;color:#fff;font-size:14px;">
+                    {item_str}
+                </div>
+                <div style="font-size:14px;font-weight:bold;text-align:right;
+                            min-width:60px;margin-left:8px;color:{color_class};">
+                    {amount_str}
+                </div>
+            </div>
+            """, unsafe_allow_html=True)
+
+            st.session_state["temp_budget_edit_date"] = st.date_input(
+                "Date", value=row["date"], key=f"edit_date_{row_id}"
+            )
+            st.session_state["temp_budget_edit_amount"] = st.number_input(
+                "Amount", min_value=0.0, format="%.2f", 
+                value=float(row["amount"]), key=f"edit_amount_{row_id}"
+            )
+            following = in_series and st.checkbox(
+                f"Apply to this and following ({series_size(row['series_id'])} in series)",
+                key=f"edit_following_{row_id}"
+            )
+
+            sc1, sc2 = st.columns(2)
+            if sc1.button("Save", key=f"save_{row_id}"):
+                save_budget_row(row, is_occurrence, following,
+                                st.session_state["temp_budget_edit_date"],
+                                st.session_state["temp_budget_edit_amount"])
+                st.session_state["editing_budget_item"] = None
+                rerun_fallback()
+            # only the transaction list changes, so no rerun of the whole page
+            sc2.button("Cancel", key=f"cancel_{row_id}", on_click=set_state, args=("editing_budget_item", None))
+
+        with btns_col:
+            if st.button("❌", key=f"remove_{row_id}"):
+                remove_budget_row(row, is_occurrence)
+                rerun_fallback()
+            if in_series and st.button("Delete series", key=f"remove_series_{row_id}"):
+                if is_occurrence:
+                    remove_series(row["series_id"])
+                else:
+                    remove_fact_series(row["series_id"])
+                st.session_state["editing_budget_item"] = None
+                rerun_fallback()
+
+    else:
+        with main_bar_col:
+            st.markdown(f"""
+            <div style="display:flex;align-items:center;background-color:#333;
+                        padding:8px;border-radius:5px;margin-bottom:4px;
+                        justify-content:space-between;">
+                <div style="font-size:14px;font-weight:bold;color:#fff; min-width:80px;">
+                    {date_str}
+                </div>
+                <div style="flex:1;margin-left:8px;color:#fff;font-size:14px;overflow:hidden;text-overflow:ellipsis;white-space:nowrap;">
+                    {item_str}
+                </div>
+                <div style="font-size:14px;font-weight:bold;text-align:right;
+                            min-width:60px;margin-left:8px;color:{color_class};">
+                    {amount_str}
+                </div>
+            </div>
+            """, unsafe_allow_html=True)
+
+        with btns_col:
+            if is_archived:
+                # closed years are read-only once archived
+                st.caption("Archived")
+                return
+            # Create two columns for the buttons to be side by side
+            e_col, x_col = st.columns(2)
+            with e_col:
+                st.button("Edit", key=f"editbtn_{row_id}", use_container_width=True,
+                          on_click=set_state, args=("editing_budget_item", row_id))
+            with x_col:
+                if st.button("❌", key=f"removebtn_{row_id}", use_container_width=True):
+                    remove_budget_row(row, is_occurrence)
+                    rerun_fallback()
+
+def save_budget_row(row, is_occurrence, following, new_date, new_amount):
+    if is_occurrence and following:
+        update_series_from(row["series_id"], int(row["occurrence"]), new_date, new_amount)
+    elif is_occurrence:
+        update_series_occurrence(row["series_id"], int(row["occurrence"]), new_date, new_amount)
+    elif following:
+        update_fact_series_from(row["series_id"], row["date"].date(), new_date, new_amount)
+    else:
+        update_fact_row(row["rowid"], new_date, new_amount)
+
+def remove_budget_row(row, is_occurrence):
+    if is_occurrence:
+        skip_series_occurrence(row["series_id"], int(row["occurrence"]))
+    else:
+        remove_fact_row(row["rowid"])
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Budget Planning calendar and transaction list
+# ─────────────────────────────────────────────────────────────────────────────
+def build_calendar_html(month_rows, year, month):
+    """
+    Day-grid calendar (Sun..Sat) for one month with each day's
+    transactions listed in its cell. month_rows must only hold that month.
+    """
+    days_in_month = calendar.monthrange(year, month)[1]
+    first_weekday = (calendar.monthrange(year, month)[0] + 1) % 7
+    calendar_grid = [["" for _ in range(7)] for _ in range(6)]
+    day_counter = 1
+    for week in range(6):
+        for weekday in range(7):
+            if week == 0 and weekday < first_weekday:
+                continue
+            if day_counter > days_in_month:
+                break
+            cell_html = f"<strong>{day_counter}</strong>"
+            day_tx = month_rows[month_rows["date"].dt.day == day_counter]
+            for _, row in day_tx.iterrows():
+                color = "red" if row["type"]=="expense" else "green"
+                cell_html += f"<br><span style='color:{color};'>{row['amount']:,.2f} ({row['budget_item']})</span>"
+            calendar_grid[week][weekday] = cell_html
+            day_counter += 1
+
+    cal_df = pd.DataFrame(calendar_grid, columns=["Sun","Mon","Tue","Wed","Thu","Fri","Sat"])
+    return f'<div class="calendar-container">{cal_df.to_html(index=False, escape=False)}</div>'
+
+def render_transaction_list(month_rows, targets=None):
+    """targets: {category: envelope target} of the month's expense categories, if any."""
+    targets = targets or {}
+    if month_rows.empty:
+        st.write("No transactions found for this month.")
+        return
+
+    inc_data = month_rows[month_rows["type"]=="income"]
+    exp_data = month_rows[month_rows["type"]=="expense"]
+
+    for type_data, color_class in ((inc_data, "#00cc00"), (exp_data, "#ff4444")):
+        for cat_name, group_df in type_data.groupby("category"):
+            # Calculate category total
+            cat_total = group_df["amount"].sum()
+            target = targets.get(cat_name) if type_data is exp_data else None
+            target_html = f" of ${target:,.2f}" if target is not None else ""
+            total_color = "#ff4444" if target is not None and cat_total > target else "white"
+            # Render category header with total
+            st.markdown(f"""
+            <div class="category-header">
+                <span class="category-name">{cat_name}</span>
+                <span class="category-total" style="color: {total_color};">Total: ${cat_total:,.2f}{target_html}</span>
+            </div>
+            """, unsafe_allow_html=True)
+
+            for _, row in group_df.iterrows():
+                render_budget_row(row, color_class)
+
+def render_search_results(results):
+    if results.empty:
+        st.write("No matching transactions.")
+        return
+    st.caption(f"{len(results)} matching transaction{'s' if len(results) != 1 else ''}, newest first")
+    table = results[["date", "type", "category", "budget_item", "amount", "credit_card", "note"]].copy()
+    table["date"] = pd.to_datetime(table["date"]).dt.date
+    st.dataframe(table.style.format({"amount": "${:,.2f}"}), hide_index=True)
+
+def render_envelopes(report):
+    """Actual-vs-target table of one month's envelopes (see budget_envelopes.py)."""
+    if report.empty:
+        st.caption("No budget targets set for this month.")
+        return
+    over = report[report["remaining"] < 0]
+    if not over.empty:
+        st.caption(f"Over target: {', '.join(over['category'])}")
+    st.dataframe(
+        report,
+        hide_index=True,
+        column_config={
+            "category": "Category",
+            "target": st.column_config.NumberColumn("Target", format="$%.2f"),
+            "actual": st.column_config.NumberColumn("Actual", format="$%.2f"),
+            "remaining": st.column_config.NumberColumn("Remaining", format="$%.2f"),
+            "used": st.column_config.ProgressColumn("Used", min_value=0.0, max_value=1.0, format="percent"),
+        },
+    )
+
+ANOMALY_LABELS = {"duplicate": "Duplicate", "near_duplicate": "Near duplicate", "outlier": "Unusual amount"}
+MAX_DUPLICATE_BUTTONS = 10
+
+def render_anomalies(scan):
+    """Findings of budget_data.anomaly_scan(), with a delete button per exact duplicate."""
+    findings = scan["findings"]
+    if findings is None:
+        st.caption("Scanning transactions for duplicates…")
+        return
+    if not scan["current"]:
+        st.caption("Rescanning after recent changes; these findings may be out of date.")
+    if findings.empty:
+        st.write("No duplicates or unusual amounts found.")
+        return
+    counts = findings["kind"].value_counts()
+    st.caption(", ".join(f"{counts[kind]} {ANOMALY_LABELS[kind].lower()}{'s' if counts[kind] != 1 else ''}"
+                         for kind in ANOMALY_LABELS if kind in counts))
+    table = findings[["kind", "date", "category", "budget_item", "amount", "detail"]].copy()
+    table["kind"] = table["kind"].map(ANOMALY_LABELS)
+    table["date"] = pd.to_datetime(table["date"]).dt.date
+    st.dataframe(table.style.format({"amount": "${:,.2f}"}), hide_index=True)
+
+    duplicates = findings[findings["kind"] == "duplicate"].head(MAX_DUPLICATE_BUTTONS)
+    for row in duplicates.to_dict("records"):
+        label = f"Delete duplicate: {pd.Timestamp(row['date']):%b %d, %Y} {row['budget_item']} ${row['amount']:,.2f}"
+        if st.button(label, key=f"remove_duplicate_{row['rowid']}"):
+            remove_fact_row(row["rowid"])
+            rerun_fallback()
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Stale-data banner
+# ─────────────────────────────────────────────────────────────────────────────
+def render_stale_banner(trace, placeholder, warehouse_state=None):
+    """
+    Warn in placeholder when this rerun served stale data because the
+    warehouse was failing (spans annotated with stale_since).
+    """
+    if trace is None:
+        return
+    stale = [s["stale_since"] for s in trace["spans"] if "stale_since" in s]
+    if not stale:
+        return
+    known = [t for t in stale if t]
+    since = pd.Timestamp(min(known)).strftime("%b %d, %H:%M UTC") if known else "an earlier load"
+    status = " (retrying in the background)" if warehouse_state == "half_open" else ""
+    placeholder.warning(f"The data warehouse is not responding{status}. Showing data from {since}; "
+                        "changes may not be saved until it recovers.", icon="⚠️")
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Sidebar profiler panel
+# ─────────────────────────────────────────────────────────────────────────────
+def _format_bytes(n):
+    for unit in ("B", "KB", "MB", "GB"):
+        if n < 1024 or unit == "GB":
+            return f"{n:,.0f} {unit}" if unit == "B" else f"{n:,.1f} {unit}"
+        n /= 1024
+
+def _format_limit(used, limit):
+    return f"{_format_bytes(used)} / {_format_bytes(limit) if limit else 'no limit'}"
+
+def render_profiler_panel(trace, scan_usage=None):
+    if trace is None:
+        return
+    totals = budget_trace.summarize(trace)
+    with st.sidebar.expander("Profiler", expanded=True):
+        st.write(f"Rerun: {totals['wall_ms']:,.0f} ms "
+                 f"(data {totals['data_ms']:,.0f} ms, render {totals['render_ms']:,.0f} ms)")
+        st.write(f"Warehouse jobs: {totals['jobs']}, scanned {_format_bytes(totals['bytes'])}")
+        if scan_usage is not None:
+            st.write(f"Session scans: {_format_limit(scan_usage['session_bytes'], scan_usage['session_limit'])}")
+            st.write(f"Today's scans: {_format_limit(scan_usage['daily_bytes'], scan_usage['daily_limit'])}")
+        if trace["spans"]:
+            spans_df = pd.DataFrame(trace["spans"])
+            spans_df["name"] = ["  " * d + n for d, n in zip(spans_df["depth"], spans_df["name"])]
+            if "estimated_bytes" not in spans_df:
+                spans_df["estimated_bytes"] = None
+            st.dataframe(spans_df[["name", "kind", "wall_ms", "rows", "estimated_bytes",
+                                   "bytes_processed", "jobs", "cache"]], hide_index=True)
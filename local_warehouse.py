@@ -0,0 +1,380 @@
+import re
+import sqlite3
+import threading
+import uuid
+from collections import Counter
+from datetime import date, datetime, timezone
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from dateutil.relativedelta import relativedelta
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Local storage stand-in for BigQuery
+#
+# Implements the small part of the bigquery.Client interface the app uses:
+#   client.query(sql, job_config=None, timeout=None) -> job with .result() / .to_dataframe()
+#   client.load_table_from_dataframe(df, table_id, job_config=None) -> job
+#   client.insert_rows_json(table_id, rows) -> list of errors
+#   (queries include MERGE ... WHEN NOT MATCHED THEN INSERT, see _MERGE_RE,
+#   and BEGIN TRANSACTION; ...; COMMIT TRANSACTION; scripts)
+#   job.result(page_size=n).to_arrow_iterable() -> record batches of n rows
+#   (slices of the fetched result; BigQuery downloads them page by page)
+# on top of SQLite. A backtick-quoted `project.dataset.table` id is a valid
+# SQLite identifier, so the app's SQL runs mostly unchanged.
+# ─────────────────────────────────────────────────────────────────────────────
+SCHEMAS = {
+    "dimension_budget_categories": [
+        ("rowid", "STRING"), ("type", "STRING"), ("category", "STRING"), ("budget_item", "STRING"),
+        ("updated_at", "TIMESTAMP"), ("tenant_id", "STRING"),
+    ],
+    "fact_budget_inputs": [
+        ("rowid", "STRING"), ("date", "DATE"), ("type", "STRING"), ("amount", "FLOAT64"),
+        ("category", "STRING"), ("budget_item", "STRING"), ("credit_card", "STRING"), ("note", "STRING"),
+        ("updated_at", "TIMESTAMP"), ("tenant_id", "STRING"),
+    ],
+    "fact_debt_items": [
+        ("rowid", "STRING"), ("debt_name", "STRING"), ("current_balance", "FLOAT64"),
+        ("due_date", "STRING"), ("minimum_payment", "FLOAT64"), ("payoff_plan_date", "DATE"),
+        ("updated_at", "TIMESTAMP"), ("tenant_id", "STRING"),
+    ],
+    "data_versions": [
+        ("tenant_id", "STRING"), ("table_name", "STRING"), ("version", "INT64"), ("updated_at", "TIMESTAMP"),
+    ],
+}
+
+_ADD_COLUMN_RE = re.compile(
+    r"^\s*ALTER\s+TABLE\s+`([^`]+)`\s+ADD\s+COLUMN\s+IF\s+NOT\s+EXISTS\s+(\w+)\s+(\w+)\s*;?\s*$",
+    re.IGNORECASE,
+)
+_TABLE_OPTIONS_RE = re.compile(
+    r"\)\s*(PARTITION\s+BY\s+[^\n]+?)?\s*(?:CLUSTER\s+BY\s+([\w\s,]+?))?\s*;?\s*$",
+    re.IGNORECASE,
+)
+
+# The one MERGE form the app writes (insert-if-absent), rewritten for SQLite
+# as INSERT ... SELECT ... WHERE NOT EXISTS
+_MERGE_RE = re.compile(
+    r"^\s*MERGE\s+(`[^`]+`)\s+AS\s+(\w+)\s+USING\s+\((.*)\)\s+AS\s+(\w+)\s+ON\s+(.*?)\s+"
+    r"WHEN\s+NOT\s+MATCHED\s+THEN\s+INSERT\s*\(([^)]*)\)\s*VALUES\s*\(([^)]*)\)\s*;?\s*$",
+    re.IGNORECASE | re.DOTALL,
+)
+
+
+def _merge_as_insert(match):
+    target, target_alias, source_sql, source_alias, condition, columns, values = match.groups()
+    return (f"INSERT INTO {target} ({columns}) SELECT {values} FROM ({source_sql}) AS {source_alias} "
+            f"WHERE NOT EXISTS (SELECT 1 FROM {target} AS {target_alias} WHERE {condition})")
+# A multi-statement transaction: BEGIN TRANSACTION; statements; COMMIT TRANSACTION;
+# (statements must not contain ";" in literals)
+_TRANSACTION_RE = re.compile(
+    r"^\s*BEGIN\s+TRANSACTION\s*;(.*);\s*COMMIT\s+TRANSACTION\s*;?\s*$",
+    re.IGNORECASE | re.DOTALL,
+)
+
+# Rough per-value width used to estimate bytes scanned (BigQuery bills
+# 8 bytes per FLOAT64/DATE and ~2 + len for STRING).
+APPROX_VALUE_BYTES = 12
+
+
+def _format_date(fmt, value):
+    if value is None:
+        return None
+    return datetime.strptime(str(value)[:10], "%Y-%m-%d").strftime(fmt)
+
+
+def _current_timestamp():
+    return _timestamp_text(datetime.now(timezone.utc))
+
+
+def _timestamp_text(value):
+    # Fixed-width UTC text so TIMESTAMP comparisons work as string comparisons
+    value = pd.Timestamp(value)
+    value = value.tz_localize("UTC") if value.tzinfo is None else value.tz_convert("UTC")
+    return value.strftime("%Y-%m-%dT%H:%M:%S.%f+00:00")
+
+
+def _sql_value(value, col_type=None):
+    if value is None or value is pd.NaT:
+        return None
+    if isinstance(value, float) and np.isnan(value):
+        return None
+    if col_type == "TIMESTAMP" and isinstance(value, (datetime, date, str)):
+        return _timestamp_text(value)
+    if col_type == "DATE" and isinstance(value, (datetime, str)):
+        return pd.Timestamp(value).date().isoformat()
+    if isinstance(value, datetime):
+        return _timestamp_text(value)
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+class LocalJob:
+    def __init__(self, columns=None, rows=None, total_bytes_processed=0, num_dml_affected_rows=None):
+        self.columns = columns or []
+        self.rows = rows or []
+        self.total_bytes_processed = total_bytes_processed
+        self.num_dml_affected_rows = num_dml_affected_rows
+        self.page_size = None
+
+    def result(self, timeout=None, page_size=None):
+        self.page_size = page_size
+        return self
+
+    def cancel(self):
+        return True
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def to_dataframe(self):
+        return pd.DataFrame(self.rows, columns=self.columns)
+
+    def to_arrow_iterable(self):
+        page_size = self.page_size or len(self.rows) or 1
+        for start in range(0, len(self.rows), page_size):
+            page = pd.DataFrame(self.rows[start:start + page_size], columns=self.columns)
+            yield pa.RecordBatch.from_pandas(page, preserve_index=False)
+
+
+class LocalTable:
+    """What get_table() returns: just the table id and its clustering."""
+    def __init__(self, table_id, clustering_fields=None):
+        self.table_id = table_id
+        self.clustering_fields = clustering_fields
+
+
+class LocalWarehouse:
+    def __init__(self, path=":memory:", project_id="local", dataset_id="budget_data"):
+        self.project_id = project_id
+        self.dataset_id = dataset_id
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.create_function("FORMAT_DATE", 2, _format_date, deterministic=True)
+        self.conn.create_function("BQ_CURRENT_TIMESTAMP", 0, _current_timestamp)
+        # Number of query()/load_table_from_dataframe() calls, by kind
+        self.calls = Counter()
+        # Clustering columns by table id; a tenant_id-clustered table is
+        # billed only for the queried tenant's rows, as in BigQuery
+        self.clustering = {}
+        for table_name in SCHEMAS:
+            self._create_table(table_name)
+
+    def table_id(self, table_name):
+        return f"{self.project_id}.{self.dataset_id}.{table_name}"
+
+    def _create_table(self, table_name):
+        cols = ", ".join(f'"{name}" {col_type}' for name, col_type in SCHEMAS[table_name])
+        with self.lock:
+            self.conn.execute(f'CREATE TABLE IF NOT EXISTS "{self.table_id(table_name)}" ({cols})')
+            self.conn.commit()
+
+    def _table_bytes(self, sql, params=None):
+        total = 0
+        tenant_id = (params or {}).get("tenant_id")
+        for table_id in set(re.findall(r"`([^`]+)`", sql)):
+            if not self._column_types(table_id):
+                continue
+            if tenant_id is not None and self.clustering.get(table_id, [None])[0] == "tenant_id":
+                row = self.conn.execute(f'SELECT COUNT(*) FROM "{table_id}" WHERE tenant_id = ?',
+                                        (tenant_id,)).fetchone()
+            else:
+                row = self.conn.execute(f'SELECT COUNT(*) FROM "{table_id}"').fetchone()
+            n_cols = len(self._column_types(table_id))
+            total += row[0] * n_cols * APPROX_VALUE_BYTES
+        return total
+
+    def get_table(self, table_id):
+        return LocalTable(table_id, self.clustering.get(table_id))
+
+    def update_table(self, table, fields):
+        if "clustering_fields" in fields:
+            with self.lock:
+                self._cluster(table.table_id, table.clustering_fields)
+        return table
+
+    def _cluster(self, table_id, columns):
+        # The closest SQLite has to clustering is an index on the same columns
+        cols = ", ".join(f'"{c}"' for c in columns)
+        self.conn.execute(f'CREATE INDEX IF NOT EXISTS "{table_id}.cluster" ON "{table_id}" ({cols})')
+        self.conn.commit()
+        self.clustering[table_id] = list(columns)
+
+    def _column_types(self, table_id):
+        return {row[1]: row[2] for row in self.conn.execute(f'PRAGMA table_info("{table_id}")')}
+
+    def _add_column(self, table_id, column, col_type):
+        if column not in self._column_types(table_id):
+            self.conn.execute(f'ALTER TABLE "{table_id}" ADD COLUMN "{column}" {col_type}')
+            self.conn.commit()
+        return LocalJob(num_dml_affected_rows=0)
+
+    def query(self, sql, job_config=None, timeout=None):
+        params = {}
+        if job_config is not None:
+            for param in getattr(job_config, "query_parameters", None) or []:
+                params[param.name] = _sql_value(param.value, getattr(param, "type_", None))
+        sql = re.sub(r"\bCURRENT_TIMESTAMP\(\)", "BQ_CURRENT_TIMESTAMP()", sql)
+        merge = _MERGE_RE.match(sql)
+        if merge:
+            sql = _merge_as_insert(merge)
+        cluster_by = None
+        if sql.lstrip().upper().startswith("CREATE TABLE"):
+            # SQLite has no partitioning; clustering becomes an index
+            match = _TABLE_OPTIONS_RE.search(sql)
+            if match and match.group(2):
+                cluster_by = [c.strip() for c in match.group(2).split(",")]
+            if match:
+                sql = sql[:match.start() + 1]
+        with self.lock:
+            bytes_processed = self._table_bytes(sql, params)
+            if getattr(job_config, "dry_run", False):
+                self.calls["dry_run"] += 1
+                return LocalJob(total_bytes_processed=bytes_processed)
+            self.calls["query"] += 1
+            transaction = _TRANSACTION_RE.match(sql)
+            if transaction:
+                return self._run_transaction(transaction.group(1), params, bytes_processed)
+            add_column = _ADD_COLUMN_RE.match(sql)
+            if add_column:
+                return self._add_column(*add_column.groups())
+            cur = self.conn.execute(sql, params)
+            if cur.description is None:
+                self.conn.commit()
+                if cluster_by:
+                    self._cluster(re.search(r"`([^`]+)`", sql).group(1), cluster_by)
+                return LocalJob(total_bytes_processed=bytes_processed, num_dml_affected_rows=cur.rowcount)
+            columns = [d[0] for d in cur.description]
+            return LocalJob(columns, cur.fetchall(), bytes_processed)
+
+    def _run_transaction(self, script, params, bytes_processed):
+        # All or nothing, like BigQuery: a failing statement rolls back the ones before it
+        if self.conn.in_transaction:
+            self.conn.commit()
+        self.conn.execute("BEGIN")
+        try:
+            for statement in script.split(";"):
+                if statement.strip():
+                    self.conn.execute(statement, params)
+        except Exception:
+            self.conn.rollback()
+            raise
+        self.conn.commit()
+        return LocalJob(total_bytes_processed=bytes_processed)
+
+    def load_table_from_dataframe(self, df, table_id, job_config=None):
+        columns = list(df.columns)
+        col_sql = ", ".join(f'"{c}"' for c in columns)
+        marks = ", ".join("?" for _ in columns)
+        with self.lock:
+            types = self._column_types(table_id)
+            col_types = [types.get(c) for c in columns]
+            rows = [tuple(_sql_value(v, t) for v, t in zip(rec, col_types))
+                    for rec in df.itertuples(index=False, name=None)]
+            self.calls["load"] += 1
+            self.conn.executemany(f'INSERT INTO "{table_id}" ({col_sql}) VALUES ({marks})', rows)
+            self.conn.commit()
+        return LocalJob()
+
+    def insert_rows_json(self, table, json_rows, **kwargs):
+        table_id = getattr(table, "table_id", table)
+        with self.lock:
+            types = self._column_types(table_id)
+            unknown = {c for row in json_rows for c in row} - set(types)
+            if unknown:
+                return [{"index": 0, "errors": [{"message": f"no such field: {sorted(unknown)}"}]}]
+            self.calls["append"] += 1
+            for row in json_rows:
+                columns = list(row)
+                col_sql = ", ".join(f'"{c}"' for c in columns)
+                marks = ", ".join("?" for _ in columns)
+                self.conn.execute(f'INSERT INTO "{table_id}" ({col_sql}) VALUES ({marks})',
+                                  tuple(_sql_value(row[c], types[c]) for c in columns))
+            self.conn.commit()
+        return []
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Deterministic synthetic data
+# ─────────────────────────────────────────────────────────────────────────────
+def _uuid(rng):
+    return str(uuid.UUID(int=int(rng.integers(0, 2**63)) << 64 | int(rng.integers(0, 2**63)), version=4))
+
+
+def generate_synthetic_data(years=3, categories=12, items_per_category=4, debts=5, seed=0, end_date=None):
+    """
+    Build dimension, fact and debt DataFrames shaped like the real tables.
+
+    - `categories` categories (about one in six is income) with
+      `items_per_category` budget items each.
+    - Each item gets 1-4 transactions per month for `years` years ending
+      12 months after `end_date` (default: today), so both history and the
+      forward plan are populated.
+    - `debts` rows in fact_debt_items.
+    The same arguments always produce the same rows.
+    """
+    rng = np.random.default_rng(seed)
+    end_date = end_date or date.today()
+    last_month = date(end_date.year, end_date.month, 1) + relativedelta(months=12)
+    first_month = last_month - relativedelta(months=12 * years - 1)
+
+    dim_rows, items = [], []
+    n_income = max(1, categories // 6)
+    for c in range(categories):
+        type_val = "income" if c < n_income else "expense"
+        category = f"{type_val.capitalize()} Category {c + 1}"
+        dim_rows.append({"rowid": _uuid(rng), "type": type_val.capitalize(), "category": category, "budget_item": ""})
+        for i in range(items_per_category):
+            item = f"{category} Item {i + 1}"
+            dim_rows.append({"rowid": _uuid(rng), "type": type_val.capitalize(), "category": category, "budget_item": item})
+            base = float(rng.uniform(500, 4000) if type_val == "income" else rng.uniform(10, 400))
+            per_month = int(rng.integers(1, 5))
+            items.append((type_val, category, item, base, per_month))
+
+    fact_rows = []
+    month = first_month
+    while month <= last_month:
+        days = (month + relativedelta(months=1) - month).days
+        for type_val, category, item, base, per_month in items:
+            for day in rng.integers(1, days + 1, size=per_month):
+                fact_rows.append({
+                    "rowid": _uuid(rng),
+                    "date": date(month.year, month.month, int(day)),
+                    "type": type_val,
+                    "amount": round(max(0.0, float(rng.normal(base, base * 0.15))), 2),
+                    "category": category,
+                    "budget_item": item,
+                    "credit_card": None,
+                    "note": "",
+                })
+        month += relativedelta(months=1)
+
+    debt_rows = []
+    for d in range(debts):
+        debt_rows.append({
+            "rowid": _uuid(rng),
+            "debt_name": f"Debt {d + 1}",
+            "current_balance": round(float(rng.uniform(500, 20000)), 2),
+            "due_date": f"{int(rng.integers(1, 29))}th",
+            "minimum_payment": round(float(rng.uniform(25, 300)), 2),
+            "payoff_plan_date": None,
+        })
+
+    return {
+        "dimension_budget_categories": pd.DataFrame(dim_rows),
+        "fact_budget_inputs": pd.DataFrame(fact_rows),
+        "fact_debt_items": pd.DataFrame(debt_rows),
+    }
+
+
+def seed_warehouse(warehouse, data, tenant_id="default"):
+    for table_name, df in data.items():
+        if not df.empty:
+            if "tenant_id" not in df:
+                df = df.assign(tenant_id=tenant_id)
+            warehouse.load_table_from_dataframe(df, warehouse.table_id(table_name))
+    warehouse.calls.clear()
@@ -1,63 +1,29 @@
 import streamlit as st
 import pandas as pd
-from google.cloud import bigquery
-from google.oauth2 import service_account
 from datetime import datetime, date
 import os
 import calendar
-import uuid
+import functools
+import tempfile
+import time
 from dateutil.relativedelta import relativedelta
-
-# ─────────────────────────────────────────────────────────────────────────────
-# 0) Query Parameter and Rerun Fallback Functions
-# ─────────────────────────────────────────────────────────────────────────────
-def get_query_params_fallback():
-    """
-    Safely read query params:
-    - If st.query_params exists (newer Streamlit), use it.
-    - Else fallback to st.experimental_get_query_params (older Streamlit).
-    
-    Returns a dict-like object that can be accessed with standard
-    dictionary syntax.
-    """
-    if hasattr(st, "query_params"):
-        # Convert to dict to ensure consistent behavior
-        return dict(st.query_params)
-    else:
-        return st.experimental_get_query_params()
-
-def set_query_params_fallback(**kwargs):
-    """
-    Safely set query params:
-    - If st.query_params.update exists (newest Streamlit), use it.
-    - Else if st.query_params exists (newer Streamlit), manually set.
-    - Else fallback to st.experimental_set_query_params (older Streamlit).
-    """
-    if hasattr(st, "query_params") and hasattr(st.query_params, "update"):
-        # Newest API (Streamlit 1.32+)
-        st.query_params.update(**kwargs)
-    elif hasattr(st, "query_params"):
-        # Newer API but without update method
-        # Clear existing params then set new ones
-        current_params = dict(st.query_params)
-        for key in list(current_params.keys()):
-            del st.query_params[key]
-        for key, value in kwargs.items():
-            st.query_params[key] = value
-    else:
-        # Legacy API
-        st.experimental_set_query_params(**kwargs)
-
-def rerun_fallback():
-    """
-    Safely rerun the app:
-    - If st.rerun exists (newer Streamlit), use it.
-    - Else fallback to st.experimental_rerun (older Streamlit).
-    """
-    if hasattr(st, "rerun"):
-        st.rerun()
-    else:
-        st.experimental_rerun()
+import budget_data
+import budget_export
+import budget_trace
+from budget_data import (
+    load_dimension_index, add_dimension_row, load_fact_rows, search_transactions, load_monthly_totals,
+    load_category_totals, save_fact_data, add_recurring_series, remove_old_payoff_lines_for_debt,
+    load_envelopes, set_envelope_target, load_credit_cards, save_credit_card, remove_credit_card,
+    load_card_statements, anomaly_scan, export_table,
+    load_debt_items, add_debt_item, remove_debt_item, update_debt_item,
+    update_debt_payoff_plan_date, insert_monthly_payments_for_debt, recalculate_payoff_plans,
+)
+from budget_views import (
+    get_query_params_fallback, set_query_params_fallback, rerun_fallback,
+    submission_key, new_submission, build_calendar_html, render_transaction_list, render_search_results, render_profiler_panel,
+    render_stale_banner, render_envelopes, render_anomalies,
+)
+from budget_forecast import simulate_forecast
 
 # ─────────────────────────────────────────────────────────────────────────────
 # 1) Session State Initialization
@@ -93,6 +59,15 @@ if "active_payoff_plan" not in st.session_state:
 if "temp_payoff_date" not in st.session_state:
     st.session_state["temp_payoff_date"] = datetime.today().date()
 
+if "forecast_result" not in st.session_state:
+    st.session_state["forecast_result"] = None
+
+# One trace per rerun; set BUDGET_TRACE_LOG to also append traces to a JSON-lines file
+budget_trace.configure(os.environ.get("BUDGET_TRACE_LOG"))
+st.session_state["profiler_trace"] = budget_trace.start_rerun(
+    previous=st.session_state.get("profiler_trace")
+)
+
 # ─────────────────────────────────────────────────────────────────────────────
 # 2) Custom CSS for Mobile–Optimized Layout
 # ─────────────────────────────────────────────────────────────────────────────
@@ -467,198 +442,56 @@ button[data-baseweb="button"] div:contains("➕") {
 # ─────────────────────────────────────────────────────────────────────────────
 # 3) Google Cloud & BigQuery Setup using Streamlit Secrets
 # ─────────────────────────────────────────────────────────────────────────────
-bigquery_secrets = st.secrets["bigquery"]
-credentials = service_account.Credentials.from_service_account_info(bigquery_secrets)
-PROJECT_ID = bigquery_secrets["project_id"]
-DATASET_ID = "budget_data"
-
-CATS_TABLE_NAME = "dimension_budget_categories"
-FACT_TABLE_NAME = "fact_budget_inputs"
-DEBT_TABLE_NAME = "fact_debt_items"
-
-client = bigquery.Client(credentials=credentials, project=PROJECT_ID)
-
-# ─────────────────────────────────────────────────────────────────────────────
-# 4) Dimension Table Functions (Categories/Items)
-# ─────────────────────────────────────────────────────────────────────────────
-def load_dimension_rows(type_val):
-    query = f"""
-    SELECT rowid, type, category, budget_item
-    FROM `{PROJECT_ID}.{DATASET_ID}.{CATS_TABLE_NAME}`
-    WHERE LOWER(type) = LOWER('{type_val}')
-    """
-    return client.query(query).to_dataframe()
-
-def add_dimension_row(type_val, category_val, budget_item_val):
-    table_id = f"{PROJECT_ID}.{DATASET_ID}.{CATS_TABLE_NAME}"
-    capital_type = type_val.capitalize()
-    df = pd.DataFrame([{
-        "rowid": str(uuid.uuid4()),
-        "type": capital_type,
-        "category": category_val,
-        "budget_item": budget_item_val
-    }])
-    job = client.load_table_from_dataframe(df, table_id,
-        job_config=bigquery.LoadJobConfig(write_disposition="WRITE_APPEND"))
-    job.result()
-
-# ─────────────────────────────────────────────────────────────────────────────
-# 5) Fact Table Functions (Budget Planning)
-# ─────────────────────────────────────────────────────────────────────────────
-def load_fact_data():
-    query = f"SELECT * FROM `{PROJECT_ID}.{DATASET_ID}.{FACT_TABLE_NAME}`"
-    df = client.query(query).to_dataframe()
-    df['date'] = pd.to_datetime(df['date'])
-    return df
-
-def save_fact_data(rows_df):
-    table_id = f"{PROJECT_ID}.{DATASET_ID}.{FACT_TABLE_NAME}"
-    job = client.load_table_from_dataframe(rows_df, table_id,
-        job_config=bigquery.LoadJobConfig(write_disposition="WRITE_APPEND"))
-    job.result()
-
-def remove_fact_row(row_id):
-    query = f"""
-    DELETE FROM `{PROJECT_ID}.{DATASET_ID}.{FACT_TABLE_NAME}`
-    WHERE rowid = '{row_id}'
+budget_data.connect(st.secrets)
+if "scan_counter" not in st.session_state:
+    st.session_state["scan_counter"] = budget_data.ScanCounter()
+if "tenant_id" not in st.session_state:
+    st.session_state["tenant_id"] = budget_data.tenant_for_user(st.user.get("email"))
+if st.session_state["tenant_id"] is None:
+    st.error("This account is not linked to a household. Ask the administrator to add it.")
+    st.stop()
+if "journal_changes" not in st.session_state:
+    st.session_state["journal_changes"] = []
+
+def bind_session():
     """
-    client.query(query).result()
-
-def update_fact_row(row_id, new_date, new_amount):
-    date_str = new_date.strftime("%Y-%m-%d")
-    query = f"""
-    UPDATE `{PROJECT_ID}.{DATASET_ID}.{FACT_TABLE_NAME}`
-    SET date = '{date_str}', amount = {new_amount}
-    WHERE rowid = '{row_id}'
+    Point the data layer's per-session context (tenant, scan counter, undo
+    list) at this session. Those are contextvars, so a fragment rerun,
+    which runs on a new thread without the top of the script, binds again.
     """
-    client.query(query).result()
-
-def remove_old_payoff_lines_for_debt(debt_name):
-    escaped_name = debt_name.replace("'", "''")
-    query = f"""
-    DELETE FROM `{PROJECT_ID}.{DATASET_ID}.{FACT_TABLE_NAME}`
-    WHERE type='expense'
-      AND category='Debt Payment'
-      AND budget_item='{escaped_name}'
-      AND note='Auto Payoff Plan'
-    """
-    client.query(query).result()
+    budget_data.set_session_counter(st.session_state["scan_counter"])
+    budget_data.set_tenant(st.session_state["tenant_id"])
+    budget_data.set_session_changes(st.session_state["journal_changes"])
 
-# ─────────────────────────────────────────────────────────────────────────────
-# 6) Debt Domination Table Functions
-# ─────────────────────────────────────────────────────────────────────────────
-def load_debt_items():
-    query = f"SELECT * FROM `{PROJECT_ID}.{DATASET_ID}.{DEBT_TABLE_NAME}`"
-    df = client.query(query).to_dataframe()
-    if "payoff_plan_date" in df.columns:
-        df["payoff_plan_date"] = pd.to_datetime(df["payoff_plan_date"]).dt.date
-    return df
-
-def add_debt_item(debt_name, current_balance, due_date, min_payment):
-    table_id = f"{PROJECT_ID}.{DATASET_ID}.{DEBT_TABLE_NAME}"
-    if due_date == "(None)":
-        due_date = None
-
-    min_payment_val = None
-    if min_payment.strip():
-        try:
-            min_payment_val = float(min_payment)
-        except:
-            min_payment_val = None
-
-    df = pd.DataFrame([{
-        "rowid": str(uuid.uuid4()),
-        "debt_name": debt_name,
-        "current_balance": current_balance,
-        "due_date": due_date,
-        "minimum_payment": min_payment_val,
-        "payoff_plan_date": None
-    }])
-    job = client.load_table_from_dataframe(df, table_id,
-        job_config=bigquery.LoadJobConfig(write_disposition="WRITE_APPEND"))
-    job.result()
-
-def remove_debt_item(row_id):
-    query = f"""
-    DELETE FROM `{PROJECT_ID}.{DATASET_ID}.{DEBT_TABLE_NAME}`
-    WHERE rowid = '{row_id}'
-    """
-    client.query(query).result()
+bind_session()
+# One tiny query per rerun tells us whether any session has written since
+budget_data.check_data_versions()
+# Folds settled journal events into the base tables, in the background
+budget_data.maybe_compact_journals()
 
-def update_debt_item(row_id, new_balance):
-    query = f"""
-    UPDATE `{PROJECT_ID}.{DATASET_ID}.{DEBT_TABLE_NAME}`
-    SET current_balance = {new_balance}
-    WHERE rowid = '{row_id}'
+def page_fragment(fn):
     """
-    client.query(query).result()
-
-def update_debt_payoff_plan_date(row_id, new_date):
-    if new_date is None:
-        query = f"""
-        UPDATE `{PROJECT_ID}.{DATASET_ID}.{DEBT_TABLE_NAME}`
-        SET payoff_plan_date = NULL
-        WHERE rowid = '{row_id}'
-        """
-    else:
-        date_str = new_date.strftime("%Y-%m-%d")
-        query = f"""
-        UPDATE `{PROJECT_ID}.{DATASET_ID}.{DEBT_TABLE_NAME}`
-        SET payoff_plan_date = '{date_str}'
-        WHERE rowid = '{row_id}'
-        """
-    client.query(query).result()
-
-def insert_monthly_payments_for_debt(debt_name, total_balance, debt_due_date_str, payoff_date):
-    remove_old_payoff_lines_for_debt(debt_name)
-    digits = "".join(ch for ch in (debt_due_date_str or "") if ch.isdigit())
-    day_of_month = 1
-    if digits:
+    st.fragment plus tracing: fn runs in a span of its name, and when a
+    widget inside fn reruns only fn, that rerun gets its own trace, named
+    after the page and the fragment.
+    """
+    @st.fragment
+    @functools.wraps(fn)
+    def run_fragment(*args, **kwargs):
+        fragment_rerun = budget_trace.current_trace() is None
+        if fragment_rerun:
+            bind_session()
+            st.session_state["profiler_trace"] = budget_trace.start_rerun(
+                previous=st.session_state.get("profiler_trace"),
+                page=f"{st.session_state.get('page_choice')} / {fn.__name__}",
+            )
         try:
-            day_of_month = int(digits)
-        except:
-            day_of_month = 1
-    today_dt = datetime.today().date()
-    if payoff_date <= today_dt:
-        return
-    start_year = today_dt.year
-    start_month = today_dt.month
-    payoff_year = payoff_date.year
-    payoff_month = payoff_date.month
-    months_list = []
-    y, m = start_year, start_month
-    while (y < payoff_year) or (y == payoff_year and m <= payoff_month):
-        last_day = calendar.monthrange(y, m)[1]
-        actual_day = min(day_of_month, last_day)
-        dt_candidate = date(y, m, actual_day)
-        if dt_candidate >= today_dt:
-            months_list.append(dt_candidate)
-        m += 1
-        if m > 12:
-            m = 1
-            y += 1
-    if not months_list:
-        return
-    monthly_amount = round(total_balance / len(months_list), 2)
-    table_id = f"{PROJECT_ID}.{DATASET_ID}.{FACT_TABLE_NAME}"
-    rows_to_insert = []
-    for d in months_list:
-        new_row_id = str(uuid.uuid4())
-        rows_to_insert.append({
-            "rowid": new_row_id,
-            "date": d,
-            "type": "expense",
-            "amount": monthly_amount,
-            "category": "Debt Payment",
-            "budget_item": debt_name,
-            "credit_card": None,
-            "note": "Auto Payoff Plan"
-        })
-    if rows_to_insert:
-        df = pd.DataFrame(rows_to_insert)
-        job = client.load_table_from_dataframe(df, table_id,
-            job_config=bigquery.LoadJobConfig(write_disposition="WRITE_APPEND"))
-        job.result()
+            with budget_trace.span(fn.__name__):
+                return fn(*args, **kwargs)
+        finally:
+            if fragment_rerun:
+                budget_trace.finish_rerun()
+    return run_fragment
 
 # ─────────────────────────────────────────────────────────────────────────────
 # 7) Query Parameter Processing
@@ -668,15 +501,8 @@ if "recalc" in params:
     row_id = params["recalc"]
     if isinstance(row_id, list):
         row_id = row_id[0]
-    reloaded_df = load_debt_items()
-    match = reloaded_df[reloaded_df["rowid"] == row_id]
-    if not match.empty:
-        plan_data = match.iloc[0]
-        plan_name = plan_data["debt_name"]
-        plan_balance = plan_data["current_balance"]
-        plan_due = plan_data["due_date"] if plan_data["due_date"] else ""
-        plan_existing = plan_data["payoff_plan_date"] if plan_data["payoff_plan_date"] else datetime.today().date()
-        insert_monthly_payments_for_debt(plan_name, plan_balance, plan_due, plan_existing)
+    # Keyed by the debt's state and the day, so following the link twice writes once
+    recalculate_payoff_plans([row_id])
     set_query_params_fallback()
     rerun_fallback()
 
@@ -707,249 +533,71 @@ button[data-baseweb="button"] div:contains("➕") {
 # 9) Sidebar Navigation
 # ─────────────────────────────────────────────────────────────────────────────
 st.sidebar.title("Mielke Finances")
-page_choice = st.sidebar.radio("Navigation", ["Budget Planning", "Debt Domination", "Budget Overview"])
-
-# ─────────────────────────────────────────────────────────────────────────────
-# Helper functions to render transaction and debt rows using inline HTML
-# ─────────────────────────────────────────────────────────────────────────────
-def render_transaction_row(row, color_class):
-    row_id = row["rowid"]
-    date_str = row["date"].strftime("%Y-%m-%d")
-    item_str = row["budget_item"]
-    amount_str = f"${row['amount']:,.2f}"
-    html = f"""
-    <div class="line-item-container">
-      <span style="color:#fff; font-weight:bold;">{date_str}</span>
-      <span style="color:#fff;">{item_str}</span>
-      <span style="color:{color_class};">{amount_str}</span>
-      <button class="line-item-button" onclick="window.location.href='?action=edit&rowid={row_id}'">Edit</button>
-      <button class="line-item-button remove" onclick="window.location.href='?action=remove&rowid={row_id}'">❌</button>
-    </div>
-    """
-    st.markdown(html, unsafe_allow_html=True)
-
-def render_transaction_edit(row, color_class):
-    row_id = row["rowid"]
-    st.markdown(f"<div class='line-item-container' style='background-color:#444; color:#fff; font-weight:bold;'>Editing: {row['budget_item']} (${row['amount']:,.2f})</div>", unsafe_allow_html=True)
-    st.session_state["temp_budget_edit_date"] = st.date_input("Date", value=row["date"], key=f"edit_date_{row_id}")
-    st.session_state["temp_budget_edit_amount"] = st.number_input("Amount", min_value=0.0, format="%.2f",
-                                                                  value=float(row["amount"]), key=f"edit_amount_{row_id}")
-    col1, col2 = st.columns(2)
-    if col1.button("Save", key=f"save_{row_id}"):
-        update_fact_row(row_id, st.session_state["temp_budget_edit_date"],
-                        st.session_state["temp_budget_edit_amount"])
-        st.session_state["editing_budget_item"] = None
-        rerun_fallback()
-    if col2.button("Cancel", key=f"cancel_{row_id}"):
-        st.session_state["editing_budget_item"] = None
-        rerun_fallback()
-
-def render_debt_transaction_row(row):
-    row_id = row["rowid"]
-    name = row["debt_name"]
-    balance_str = f"${row['current_balance']:,.2f}"
-    due = row["due_date"] if row["due_date"] else "(None)"
-    min_pay = row["minimum_payment"] if pd.notnull(row["minimum_payment"]) else "(None)"
-    is_recalc = True if row.get("payoff_plan_date") else False
-    
-    # Display the main debt information and Edit/Delete buttons using HTML
-    html = f"""
-    <div class="line-item-container" style="margin-bottom:0px; border-bottom-left-radius:0; border-bottom-right-radius:0;">
-      <span style="color:#fff; font-weight:bold;">{name}</span>
-      <span style="color:#fff;">Due: {due}, Min: {min_pay}</span>
-      <span style="color:red;">{balance_str}</span>
-      <button class="line-item-button" onclick="window.location.href='?action=edit_debt&rowid={row_id}'">Edit</button>
-      <button class="line-item-button remove" onclick="window.location.href='?action=remove_debt&rowid={row_id}'">❌</button>
-    </div>
-    """
-    st.markdown(html, unsafe_allow_html=True)
-    
-    # Use native Streamlit button for the Payoff/Recalc functionality
-    # Create a container that matches the style of the line item
-    button_container = f"""
-    <div style="display:flex; justify-content:center; background-color:#333; 
-                max-width:360px; margin:0 auto 4px auto; padding:4px; 
-                border-top:none; border-bottom-left-radius:4px; border-bottom-right-radius:4px;">
-    </div>
-    """
-    st.markdown(button_container, unsafe_allow_html=True)
-    
-    # Now add the native Streamlit button that will handle the action properly
-    if is_recalc:
-        if st.button("Recalculate Payment Plan", key=f"recalc_btn_{row_id}"):
-            # Process recalc action directly
-            reloaded_df = load_debt_items()
-            match = reloaded_df[reloaded_df["rowid"] == row_id]
-            if not match.empty:
-                plan_data = match.iloc[0]
-                plan_name = plan_data["debt_name"]
-                plan_balance = plan_data["current_balance"]
-                plan_due = plan_data["due_date"] if plan_data["due_date"] else ""
-                plan_existing = plan_data["payoff_plan_date"] if plan_data["payoff_plan_date"] else datetime.today().date()
-                insert_monthly_payments_for_debt(plan_name, plan_balance, plan_due, plan_existing)
-                st.success("Payment plan recalculated!")
-                rerun_fallback()
-    else:
-        if st.button("Create Payoff Plan", key=f"payoff_btn_{row_id}"):
-            # Set the active payoff plan directly
-            st.session_state["active_payoff_plan"] = row_id
-            rerun_fallback()
-
-def render_debt_transaction_edit(row):
-    row_id = row["rowid"]
-    st.markdown(f"<div class='line-item-container' style='background-color:#444; color:#fff; font-weight:bold;'>Editing: {row['debt_name']}</div>", unsafe_allow_html=True)
-    st.session_state["temp_new_balance"] = st.number_input("New Balance", min_value=0.0, format="%.2f",
-                                                           value=float(row["current_balance"]), key=f"edit_debt_balance_{row_id}")
-    col1, col2 = st.columns(2)
-    if col1.button("Save", key=f"save_debt_{row_id}"):
-        update_debt_item(row_id, st.session_state["temp_new_balance"])
-        st.session_state["editing_debt_item"] = None
-        rerun_fallback()
-    if col2.button("Cancel", key=f"cancel_debt_{row_id}"):
-        st.session_state["editing_debt_item"] = None
+page_choice = st.sidebar.radio("Navigation", ["Budget Planning", "Debt Domination", "Budget Overview"],
+                               key="page_choice")
+budget_trace.set_page(page_choice)
+# The rest of the page script is one span; data functions and fragments nest in it
+page_span = budget_trace.open_span(page_choice)
+if budget_data.snapshots_enabled() and st.sidebar.button("Refresh data"):
+    budget_data.refresh_snapshots()
+if st.session_state["journal_changes"]:
+    last_change = st.session_state["journal_changes"][-1]
+    if st.sidebar.button(f"↩ Undo: {last_change['label']}", key="undo_last_change"):
+        budget_data.undo_last_change()
         rerun_fallback()
+if st.sidebar.checkbox("Show change history", key="show_change_history"):
+    for history_table in budget_data.JOURNALED_COLUMNS:
+        st.sidebar.dataframe(budget_data.load_change_history(history_table, limit=20), hide_index=True)
+# Filled in at the end of the rerun if any data was served stale
+stale_banner = st.empty()
 
 # ─────────────────────────────────────────────────────────────────────────────
-# Updated render_budget_row with try/except blocks for rerun
+# Budget Planning fragments
+#
+# The page is three fragments, so a click only reruns the part it affects:
+# - planning_month_view: month navigation, metrics and (nested) the
+#   calendar and the transaction list. Only this reruns when the month
+#   changes.
+# - envelope_panel: the month's actual-vs-target table. Saving a target
+#   reruns the app, because the list headers show targets too.
+# - transaction_calendar / transaction_list: an edit toggle reruns only the
+#   list. Saving or removing a row reruns the app, because totals change.
+# - transaction_form: the pickers and ➕ forms rerun only the form. Date,
+#   amount, repeat and note are batched in an st.form and sent once, on
+#   "Add Transaction".
 # ─────────────────────────────────────────────────────────────────────────────
-def render_budget_row(row, color_class):
-    row_id = row["rowid"]
-    date_str = row["date"].strftime("%Y-%m-%d")
-    item_str = row["budget_item"]
-    amount_str = f"${row['amount']:,.2f}"
-    is_editing = (st.session_state["editing_budget_item"] == row_id)
-
-    # Use original column ratio but with slightly more space for buttons
-    main_bar_col, btns_col = st.columns([0.75, 0.25])
-
-    if is_editing:
-        with main_bar_col:
-            st.markdown(f"""
-            <div style="display:flex;align-items:center;background-color:#333;
-                        padding:8px;border-radius:5px;margin-bottom:4px;
-                        justify-content:space-between;">
-                <div style="font-size:14px;font-weight:bold;color:#fff; min-width:80px;">
-                    Editing...
-                </div>
-                <div style="flex:1;margin-left:8px;color:#fff;font-size:14px;">
-                    {item_str}
-                </div>
-                <div style="font-size:14px;font-weight:bold;text-align:right;
-                            min-width:60px;margin-left:8px;color:{color_class};">
-                    {amount_str}
-                </div>
-            </div>
-            """, unsafe_allow_html=True)
-
-            st.session_state["temp_budget_edit_date"] = st.date_input(
-                "Date", value=row["date"], key=f"edit_date_{row_id}"
-            )
-            st.session_state["temp_budget_edit_amount"] = st.number_input(
-                "Amount", min_value=0.0, format="%.2f", 
-                value=float(row["amount"]), key=f"edit_amount_{row_id}"
-            )
-
-            sc1, sc2 = st.columns(2)
-            if sc1.button("Save", key=f"save_{row_id}"):
-                update_fact_row(
-                    row_id, 
-                    st.session_state["temp_budget_edit_date"],
-                    st.session_state["temp_budget_edit_amount"]
-                )
-                st.session_state["editing_budget_item"] = None
-                rerun_fallback()
-            if sc2.button("Cancel", key=f"cancel_{row_id}"):
-                st.session_state["editing_budget_item"] = None
-                rerun_fallback()
-
-        with btns_col:
-            if st.button("❌", key=f"remove_{row_id}"):
-                remove_fact_row(row_id)
-                rerun_fallback()
-
-    else:
-        with main_bar_col:
-            st.markdown(f"""
-            <div style="display:flex;align-items:center;background-color:#333;
-                        padding:8px;border-radius:5px;margin-bottom:4px;
-                        justify-content:space-between;">
-                <div style="font-size:14px;font-weight:bold;color:#fff; min-width:80px;">
-                    {date_str}
-                </div>
-                <div style="flex:1;margin-left:8px;color:#fff;font-size:14px;overflow:hidden;text-overflow:ellipsis;white-space:nowrap;">
-                    {item_str}
-                </div>
-                <div style="font-size:14px;font-weight:bold;text-align:right;
-                            min-width:60px;margin-left:8px;color:{color_class};">
-                    {amount_str}
-                </div>
-            </div>
-            """, unsafe_allow_html=True)
-
-        with btns_col:
-            # Create two columns for the buttons to be side by side
-            e_col, x_col = st.columns(2)
-            with e_col:
-                if st.button("Edit", key=f"editbtn_{row_id}", use_container_width=True):
-                    st.session_state["editing_budget_item"] = row_id
-                    rerun_fallback()
-            with x_col:
-                if st.button("❌", key=f"removebtn_{row_id}", use_container_width=True):
-                    remove_fact_row(row_id)
-                    rerun_fallback()
-
-# ─────────────────────────────────────────────────────────────────────────────
-# PAGE 1: Budget Planning
-# ─────────────────────────────────────────────────────────────────────────────
-if page_choice == "Budget Planning":
-    st.markdown("""
-        <h1 style='text-align: center; font-size: 50px; font-weight: bold; 
-                   color: black; text-shadow: 0px 0px 10px #00ccff, 
-                                 0px 0px 20px #00ccff;'>
-            Mielke Budget
-        </h1>
-    """, unsafe_allow_html=True)
+def shift_month(step):
+    month_index = st.session_state["current_year"] * 12 + st.session_state["current_month"] - 1 + step
+    st.session_state["current_year"], month_zero = divmod(month_index, 12)
+    st.session_state["current_month"] = month_zero + 1
 
+@page_fragment
+def planning_month_view():
     # Display Month Title and Navigation Buttons in one horizontal block
     current_month = st.session_state["current_month"]
     current_year = st.session_state["current_year"]
-    
+
     # Create a 3-column layout for the month navigation
     col_prev, col_title, col_next = st.columns([1, 3, 1])
-    
-    # Previous month arrow button
+
+    # Previous month arrow button (the callback runs before this fragment reruns)
     with col_prev:
-        if st.button("←", key="prev_month_arrow"):
-            if current_month == 1:
-                st.session_state["current_month"] = 12
-                st.session_state["current_year"] -= 1
-            else:
-                st.session_state["current_month"] -= 1
-            rerun_fallback()
-    
+        st.button("←", key="prev_month_arrow", on_click=shift_month, args=(-1,))
+
     # Month/Year title in center column
     with col_title:
         st.markdown(f"<div style='text-align: center; font-size: 24px; font-weight: bold; padding: 10px;'>{calendar.month_name[current_month]} {current_year}</div>", unsafe_allow_html=True)
-    
+
     # Next month arrow button
     with col_next:
-        if st.button("→", key="next_month_arrow"):
-            if current_month == 12:
-                st.session_state["current_month"] = 1
-                st.session_state["current_year"] += 1
-            else:
-                st.session_state["current_month"] += 1
-            rerun_fallback()
+        st.button("→", key="next_month_arrow", on_click=shift_month, args=(1,))
 
-    fact_data = load_fact_data()
-    fact_data.sort_values("date", ascending=True, inplace=True)
-    filtered_data = fact_data[
-        (fact_data["date"].dt.month == current_month) &
-        (fact_data["date"].dt.year == current_year)
-    ].copy()
+    month_start = date(current_year, current_month, 1)
+    month_end = date(current_year, current_month, calendar.monthrange(current_year, current_month)[1])
 
-    total_income = filtered_data[filtered_data["type"]=="income"]["amount"].sum()
-    total_expenses = filtered_data[filtered_data["type"]=="expense"]["amount"].sum()
+    month_totals = load_monthly_totals(month_start, month_end)
+    total_income = month_totals[month_totals["type"]=="income"]["amount"].sum()
+    total_expenses = month_totals[month_totals["type"]=="expense"]["amount"].sum()
     leftover = total_income - total_expenses
 
     st.markdown(f"""
@@ -969,48 +617,80 @@ if page_choice == "Budget Planning":
     </div>
     """, unsafe_allow_html=True)
 
+    envelope_panel(month_start, month_end)
+    transaction_calendar(month_start, month_end)
+    transaction_list(month_start, month_end)
+
+@page_fragment
+def envelope_panel(month_start, month_end):
+    st.markdown("<div class='section-subheader'>Budget Targets</div>", unsafe_allow_html=True)
+    render_envelopes(load_envelopes(month_start, month_end))
+
+    with st.expander("Set a budget target"):
+        expense_categories = list(load_dimension_index().get("expense", {}))
+        if not expense_categories:
+            st.write("Add an expense category first.")
+            return
+        with st.form("envelope_form"):
+            category = st.selectbox("Category", expense_categories, key="envelope_category")
+            target = st.number_input("Monthly target (0 removes it)", min_value=0.0, format="%.2f",
+                                     key="envelope_target")
+            months = st.number_input("For how many months, starting this one", min_value=1, max_value=24,
+                                     value=1, step=1, key="envelope_months")
+            if st.form_submit_button("Save Target"):
+                set_envelope_target(category, month_start, target, months=int(months))
+                rerun_fallback()
+
+@page_fragment
+def transaction_calendar(month_start, month_end):
+    month_rows = load_fact_rows(month_start, month_end)
+
     # Build a day-grid calendar for the selected month
-    days_in_month = calendar.monthrange(current_year, current_month)[1]
-    first_weekday = (calendar.monthrange(current_year, current_month)[0] + 1) % 7
-    calendar_grid = [["" for _ in range(7)] for _ in range(6)]
-    day_counter = 1
-    for week in range(6):
-        for weekday in range(7):
-            if week == 0 and weekday < first_weekday:
-                continue
-            if day_counter > days_in_month:
-                break
-            cell_html = f"<strong>{day_counter}</strong>"
-            day_tx = filtered_data[filtered_data["date"].dt.day == day_counter]
-            for _, row in day_tx.iterrows():
-                color = "red" if row["type"]=="expense" else "green"
-                cell_html += f"<br><span style='color:{color};'>{row['amount']:,.2f} ({row['budget_item']})</span>"
-            calendar_grid[week][weekday] = cell_html
-            day_counter += 1
-
-    cal_df = pd.DataFrame(calendar_grid, columns=["Sun","Mon","Tue","Wed","Thu","Fri","Sat"])
-    st.markdown(f'<div class="calendar-container">{cal_df.to_html(index=False, escape=False)}</div>', unsafe_allow_html=True)
+    st.markdown(build_calendar_html(month_rows, month_start.year, month_start.month), unsafe_allow_html=True)
+
+@page_fragment
+def transaction_list(month_start, month_end):
+    st.markdown("<div class='section-subheader'>Transactions This Month</div>", unsafe_allow_html=True)
+
+    # Same cached rows as the calendar: no second query
+    envelopes = load_envelopes(month_start, month_end)
+    render_transaction_list(load_fact_rows(month_start, month_end),
+                            targets=dict(zip(envelopes["category"], envelopes["target"])))
+
+def close_new_dimension_form(flag_key, text_key):
+    st.session_state[flag_key] = False
+    st.session_state[text_key] = ""
+
+def save_new_dimension_row(flag_key, text_key, type_val, category_val):
+    """➕ form callback: a new category (category_val None) or a new item in category_val."""
+    name = st.session_state[text_key].strip()
+    if name:
+        # The token is renewed when the ➕ form opens
+        key = submission_key(flag_key, type_val, category_val, name)
+        if category_val is None:
+            add_dimension_row(type_val, name, "", key=key)
+        else:
+            add_dimension_row(type_val, category_val, name, key=key)
+    close_new_dimension_form(flag_key, text_key)
 
+@page_fragment
+def transaction_form():
     st.markdown("""
     <div class="transaction-form-container">
         <div class="transaction-form-title">Add New Transaction</div>
     """, unsafe_allow_html=True)
 
-    # Form to add Income/Expense
-    cA, cB = st.columns([1,3])
-    with cA:
-        st.write("Date:")
-    with cB:
-        date_input = st.date_input("", value=datetime.today(), label_visibility="collapsed")
-
+    # Type, category and item drive each other's options, so they stay
+    # live widgets (rerunning only this fragment); the rest is batched below
     cA, cB = st.columns([1,3])
     with cA:
         st.write("Type:")
     with cB:
         type_input = st.selectbox("", ["income","expense"], label_visibility="collapsed")
 
-    dimension_df = load_dimension_rows(type_input)
-    all_categories = sorted(dimension_df["category"].unique())
+    # Pickers come from the in-memory type -> category -> items index
+    type_categories = load_dimension_index().get(type_input, {})
+    all_categories = list(type_categories)
     if not all_categories:
         all_categories = ["(No categories yet)"]
 
@@ -1024,24 +704,20 @@ if page_choice == "Budget Planning":
         with cat_plus:
             if st.button("➕", key="cat_plus"):
                 st.session_state["show_new_category_form"] = True
+                new_submission("show_new_category_form")
 
     if st.session_state["show_new_category_form"]:
         st.write("Add New Category")
-        st.session_state["temp_new_category"] = st.text_input("Category Name", st.session_state["temp_new_category"])
+        st.text_input("Category Name", key="temp_new_category")
         cc1, cc2 = st.columns(2)
-        if cc1.button("Save Category"):
-            new_cat = st.session_state["temp_new_category"].strip()
-            if new_cat:
-                add_dimension_row(type_input, new_cat, "")
-            st.session_state["show_new_category_form"] = False
-            st.session_state["temp_new_category"] = ""
-            rerun_fallback()
-        if cc2.button("Cancel"):
-            st.session_state["show_new_category_form"] = False
-            st.session_state["temp_new_category"] = ""
-
-    items_for_cat = dimension_df[dimension_df["category"]==category_input]["budget_item"].unique()
-    items_for_cat = [i for i in items_for_cat if i!=""]
+        # Callbacks run before the fragment reruns, so the pickers above
+        # already show the new category (the dimension index is updated in place)
+        cc1.button("Save Category", on_click=save_new_dimension_row,
+                   args=("show_new_category_form", "temp_new_category", type_input, None))
+        cc2.button("Cancel", on_click=close_new_dimension_form,
+                   args=("show_new_category_form", "temp_new_category"))
+
+    items_for_cat = type_categories.get(category_input, [])
     if not items_for_cat:
         items_for_cat = ["(No items yet)"]
 
@@ -1055,154 +731,175 @@ if page_choice == "Budget Planning":
         with item_plus:
             if st.button("➕", key="item_plus"):
                 st.session_state["show_new_item_form"] = True
+                new_submission("show_new_item_form")
 
     if st.session_state["show_new_item_form"]:
         st.write(f"Add New Item for Category: {category_input}")
-        st.session_state["temp_new_item"] = st.text_input("New Budget Item", st.session_state["temp_new_item"])
+        st.text_input("New Budget Item", key="temp_new_item")
         ic1, ic2 = st.columns(2)
-        if ic1.button("Save Item"):
-            new_item = st.session_state["temp_new_item"].strip()
-            if new_item:
-                add_dimension_row(type_input, category_input, new_item)
-            st.session_state["show_new_item_form"] = False
-            st.session_state["temp_new_item"] = ""
-            rerun_fallback()
-        if ic2.button("Cancel"):
-            st.session_state["show_new_item_form"] = False
-            st.session_state["temp_new_item"] = ""
-
-    cA, cB = st.columns([1,3])
-    with cA:
-        st.write("Amount:")
-    with cB:
-        amount_input = st.number_input("", min_value=0.0, format="%.2f", label_visibility="collapsed")
-
-    cA, cB = st.columns([1,3])
-    with cA:
-        st.write("Repeat for:")
-    with cB:
-        num_months = st.number_input("", min_value=1, max_value=36, value=1, 
-                                 step=1, help="Number of months this transaction should be repeated", 
-                                 label_visibility="collapsed")
-    
-    cA, cB = st.columns([1,3])
-    with cA:
-        st.write("Note:")
-    with cB:
-        note_input = st.text_area("", label_visibility="collapsed")
-
-    cX, cY = st.columns([1,3])
-    with cY:
-        if st.button("Add Transaction"):
-            # Generate transactions for the selected number of months
-            rows_to_insert = []
-            
-            # Get the day of the month from the selected date
-            day_of_month = date_input.day
-            
-            # For each month in the range
-            for i in range(num_months):
-                # Calculate the date for this occurrence
-                if i == 0:
-                    # First occurrence uses the exact date selected
-                    current_date = date_input
-                else:
-                    # For subsequent months, use the same day of month
-                    # Create a date for the next month
-                    next_month = date_input.month + i
-                    next_year = date_input.year
-                    
-                    # Handle year rollover if needed
-                    while next_month > 12:
-                        next_month -= 12
-                        next_year += 1
-                    
-                    # Handle months with fewer days than the selected day
-                    # (e.g., if selected 31st but next month only has 30 days)
-                    max_day = calendar.monthrange(next_year, next_month)[1]
-                    actual_day = min(day_of_month, max_day)
-                    
-                    current_date = date(next_year, next_month, actual_day)
-                
-                # Create a transaction for this month
-                row_id = str(uuid.uuid4())
-                
-                # Add a note indicating this is part of a recurring series for all but the first transaction
-                current_note = note_input
-                if i > 0:
-                    if current_note:
-                        current_note += f" (Recurring {i+1}/{num_months})"
-                    else:
-                        current_note = f"Recurring {i+1}/{num_months}"
-                elif num_months > 1:
-                    if current_note:
-                        current_note += f" (Recurring 1/{num_months})"
-                    else:
-                        current_note = f"Recurring 1/{num_months}"
-                
-                rows_to_insert.append({
-                    "rowid": row_id,
-                    "date": current_date,
-                    "type": type_input,
-                    "amount": amount_input,
-                    "category": category_input,
-                    "budget_item": budget_item_input,
-                    "credit_card": None,
-                    "note": current_note
-                })
-            
-            # Save all transactions at once
-            if rows_to_insert:
-                tx_df = pd.DataFrame(rows_to_insert)
-                save_fact_data(tx_df)
-                
-                # Show a success message with details about the recurring transactions
-                if num_months > 1:
-                    st.success(f"Added {num_months} recurring transactions for {budget_item_input}")
-                else:
-                    st.success(f"Added transaction for {budget_item_input}")
-                    
-                rerun_fallback()
-        # Add this right after the "Add Transaction" button code (after rerun_fallback())
+        ic1.button("Save Item", on_click=save_new_dimension_row,
+                   args=("show_new_item_form", "temp_new_item", type_input, category_input))
+        ic2.button("Cancel", on_click=close_new_dimension_form,
+                   args=("show_new_item_form", "temp_new_item"))
+
+    # Nothing in here reruns anything until "Add Transaction" is pressed
+    with st.form("add_transaction_form", border=False):
+        cA, cB = st.columns([1,3])
+        with cA:
+            st.write("Date:")
+        with cB:
+            date_input = st.date_input("", value=datetime.today(), label_visibility="collapsed")
+
+        cA, cB = st.columns([1,3])
+        with cA:
+            st.write("Amount:")
+        with cB:
+            amount_input = st.number_input("", min_value=0.0, format="%.2f", label_visibility="collapsed",
+                                           key="transaction_amount")
+
+        cA, cB = st.columns([1,3])
+        with cA:
+            st.write("Card:")
+        with cB:
+            card_input = st.selectbox("", ["(None)"] + list(load_credit_cards()["card_name"]),
+                                      label_visibility="collapsed", key="transaction_card")
+
+        cA, cB = st.columns([1,3])
+        with cA:
+            st.write("Repeat for:")
+        with cB:
+            num_months = st.number_input("", min_value=1, max_value=36, value=1, 
+                                     step=1, help="Number of months this transaction should be repeated", 
+                                     label_visibility="collapsed", key="transaction_months")
+
+        cA, cB = st.columns([1,3])
+        with cA:
+            st.write("Note:")
+        with cB:
+            note_input = st.text_area("", label_visibility="collapsed")
+
+        cX, cY = st.columns([1,3])
+        with cY:
+            submitted = st.form_submit_button("Add Transaction")
+
+    if submitted:
+        fields = {
+            "type": type_input,
+            "amount": amount_input,
+            "category": category_input,
+            "budget_item": budget_item_input,
+            "credit_card": None if card_input == "(None)" else card_input,
+            "note": note_input,
+        }
+        # Replaying this submission (a rerun, a double-click) writes nothing twice
+        key = submission_key("add_transaction", date_input, num_months, *fields.values())
+        if num_months > 1:
+            # One rule row, whatever the number of months (see budget_series.py)
+            add_recurring_series(date_input, "monthly", fields, occurrences=num_months, key=key)
+            st.success(f"Added {num_months} recurring transactions for {budget_item_input}")
+        else:
+            save_fact_data(pd.DataFrame([{"rowid": key, "date": date_input, **fields}]))
+            st.success(f"Added transaction for {budget_item_input}")
+        rerun_fallback()
+    else:
+        new_submission("add_transaction")
     st.markdown("</div>", unsafe_allow_html=True)  # Close the transaction form container
 
-    st.markdown("<div class='section-subheader'>Transactions This Month</div>", unsafe_allow_html=True)
+# ─────────────────────────────────────────────────────────────────────────────
+# Export fragment
+#
+# "Prepare Export" streams each table to a file on local disk, page by page
+# (see budget_data.export_table()), under a progress bar; the download
+# buttons read a file only when clicked. A new export replaces the
+# session's previous files, and files older than EXPORT_MAX_AGE_S are swept.
+# ─────────────────────────────────────────────────────────────────────────────
+EXPORT_DIR = os.path.join(tempfile.gettempdir(), "budget_exports")
+EXPORT_MAX_AGE_S = 24 * 3600
+
+def sweep_exports(directory, keep=()):
+    cutoff = time.time() - EXPORT_MAX_AGE_S
+    for entry in os.scandir(directory):
+        if entry.path not in keep and entry.stat().st_mtime < cutoff:
+            os.remove(entry.path)
+
+def open_export(path):
+    return open(path, "rb")
+
+@page_fragment
+def export_panel():
+    with st.form("export_form"):
+        ec1, ec2, ec3 = st.columns(3)
+        export_start = ec1.date_input("From", value=date(datetime.today().year, 1, 1), key="export_start")
+        export_end = ec2.date_input("To", value=datetime.today().date(), key="export_end")
+        export_format = ec3.selectbox("Format", list(budget_export.FORMATS), key="export_format")
+        prepare = st.form_submit_button("Prepare Export")
+    if prepare:
+        for old in st.session_state.get("export_files", []):
+            if os.path.exists(old["path"]):
+                os.remove(old["path"])
+        directory = os.path.join(EXPORT_DIR, budget_data.current_tenant())
+        os.makedirs(directory, exist_ok=True)
+        sweep_exports(directory)
+        tables = list(budget_data.EXPORT_COLUMNS)
+        bar = st.progress(0.0, text="Exporting...")
+        files = []
+        for n, table_name in enumerate(tables):
+            dated = table_name == budget_data.FACT_TABLE_NAME
+            start, end = (export_start, export_end) if dated else (None, None)
+            name = budget_export.file_name(table_name, export_format, start, end)
+            fd, path = tempfile.mkstemp(suffix=f"-{name}", dir=directory)
+            os.close(fd)
+
+            def show_rows(rows, n=n, table_name=table_name):
+                bar.progress(n / len(tables), text=f"{table_name}: {rows:,} rows")
+            rows = export_table(table_name, path, export_format, start, end, progress=show_rows)
+            files.append({"path": path, "name": name, "rows": rows,
+                          "mime": budget_export.FORMATS[export_format]})
+        bar.progress(1.0, text="Export ready")
+        st.session_state["export_files"] = files
+    for export in st.session_state.get("export_files", []):
+        if os.path.exists(export["path"]):
+            st.download_button(f"⬇ {export['name']} ({export['rows']:,} rows)",
+                               data=functools.partial(open_export, export["path"]),
+                               file_name=export["name"], mime=export["mime"], on_click="ignore",
+                               key=f"download_{export['name']}")
 
-    if filtered_data.empty:
-        st.write("No transactions found for this month.")
-    else:
-        inc_data = filtered_data[filtered_data["type"]=="income"]
-        exp_data = filtered_data[filtered_data["type"]=="expense"]
-
-        if not inc_data.empty:
-            for cat_name, group_df in inc_data.groupby("category"):
-                # Calculate category total
-                cat_total = group_df["amount"].sum()
-                # Render category header with total
-                st.markdown(f"""
-                <div class="category-header">
-                    <span class="category-name">{cat_name}</span>
-                    <span class="category-total" style="color: white;">Total: ${cat_total:,.2f}</span>
-                </div>
-                """, unsafe_allow_html=True)
-                
-                for _, row in group_df.iterrows():
-                    render_budget_row(row, "#00cc00")
-
-        if not exp_data.empty:
-            for cat_name, group_df in exp_data.groupby("category"):
-                # Calculate category total
-                cat_total = group_df["amount"].sum()
-                # Render category header with total
-                st.markdown(f"""
-                <div class="category-header">
-                    <span class="category-name">{cat_name}</span>
-                    <span class="category-total" style="color: white;">Total: ${cat_total:,.2f}</span>
-                </div>
-                """, unsafe_allow_html=True)
-                
-                for _, row in group_df.iterrows():
-                    render_budget_row(row, "#ff4444")
+# ─────────────────────────────────────────────────────────────────────────────
+# PAGE 1: Budget Planning
+# ─────────────────────────────────────────────────────────────────────────────
+if page_choice == "Budget Planning":
+    st.markdown("""
+        <h1 style='text-align: center; font-size: 50px; font-weight: bold; 
+                   color: black; text-shadow: 0px 0px 10px #00ccff, 
+                                 0px 0px 20px #00ccff;'>
+            Mielke Budget
+        </h1>
+    """, unsafe_allow_html=True)
+
+    planning_month_view()
+    transaction_form()
+
+    with st.expander("🔍 Search transactions"):
+        search_text = st.text_input("Search notes, items, categories and cards", key="search_text")
+        cA, cB = st.columns(2)
+        with cA:
+            search_min = st.number_input("Min amount", min_value=0.0, value=0.0, format="%.2f", key="search_min")
+        with cB:
+            search_max = st.number_input("Max amount", min_value=0.0, value=0.0, format="%.2f", key="search_max",
+                                         help="0 means no upper bound")
+        search_dates = st.date_input("Date range", value=(), key="search_dates")
+        search_start = search_dates[0] if len(search_dates) > 0 else None
+        search_end = search_dates[1] if len(search_dates) > 1 else search_start
+        # The index is only built once someone actually searches
+        if search_text.strip() or search_min or search_max or search_start:
+            results = search_transactions(search_text, min_amount=search_min or None,
+                                          max_amount=search_max or None,
+                                          start_date=search_start, end_date=search_end)
+            render_search_results(results)
+
+    # The scan runs on a background thread over the shared fact rows
+    with st.expander("🧹 Duplicates and unusual amounts"):
+        render_anomalies(anomaly_scan())
 # ─────────────────────────────────────────────────────────────────────────────
 # PAGE 2: Debt Domination
 # ─────────────────────────────────────────────────────────────────────────────
@@ -1215,6 +912,10 @@ elif page_choice == "Debt Domination":
     """, unsafe_allow_html=True)
 
     debt_df = load_debt_items()
+    # Statement balances come from the in-memory card cycle index
+    card_statements = load_card_statements()
+    statements_by_debt = {row["debt_name"]: row for row in card_statements.to_dict("records")
+                          if pd.notnull(row["debt_name"])}
     total_debt = debt_df["current_balance"].sum() if not debt_df.empty else 0.0
 
     st.markdown(f"""
@@ -1298,6 +999,13 @@ elif page_choice == "Debt Domination":
                         </div>
                     </div>
                     """, unsafe_allow_html=True)
+                    statement = statements_by_debt.get(row_name)
+                    if statement is not None:
+                        st.caption(
+                            f"💳 {statement['card_name']}: statement closing "
+                            f"{statement['statement_close']:%b %d} ${statement['statement_balance']:,.2f}, "
+                            f"next cycle (closing {statement['next_close']:%b %d}) "
+                            f"${statement['next_balance']:,.2f}")
 
                 with btns_col:
                     e_col, payoff_col, x_col = st.columns([0.30, 0.50, 0.20])
@@ -1337,6 +1045,36 @@ elif page_choice == "Debt Domination":
                         remove_old_payoff_lines_for_debt(row_name)
                         rerun_fallback()
 
+    st.subheader("Credit Cards")
+    if card_statements.empty:
+        st.write("No cards set up. Add one to tag expenses with it and follow its statement cycles.")
+    else:
+        table = card_statements.rename(columns={
+            "card_name": "Card", "debt_name": "Debt", "closing_day": "Closes on day",
+            "statement_close": "Statement closes", "statement_balance": "Statement balance",
+            "next_close": "Next closes", "next_balance": "Next balance",
+        })
+        st.dataframe(table.style.format({"Statement balance": "${:,.2f}", "Next balance": "${:,.2f}"}),
+                     hide_index=True)
+
+    with st.expander("Add or change a card"):
+        card_name = st.text_input("Card name (as tagged on transactions)", key="card_name")
+        closing_day = st.number_input("Statement closing day", min_value=1, max_value=31, value=25, step=1,
+                                      key="card_closing_day")
+        debt_names = ["(None)"] + list(debt_df["debt_name"]) if not debt_df.empty else ["(None)"]
+        card_debt = st.selectbox("Paid down as debt", debt_names, key="card_debt")
+        if st.button("Save Card", key="save_card"):
+            if card_name.strip():
+                save_credit_card(card_name.strip(), int(closing_day),
+                                 None if card_debt == "(None)" else card_debt)
+            rerun_fallback()
+        if not card_statements.empty:
+            removed_card = st.selectbox("Card to remove", list(card_statements["card_name"]),
+                                        key="card_to_remove")
+            if st.button("Remove Card", key="remove_card"):
+                remove_credit_card(removed_card)
+                rerun_fallback()
+
     if st.session_state["active_payoff_plan"] is not None:
         reloaded_df = load_debt_items()
         match = reloaded_df[reloaded_df["rowid"]==st.session_state["active_payoff_plan"]]
@@ -1358,18 +1096,19 @@ elif page_choice == "Debt Domination":
                     plan_name,
                     plan_balance,
                     plan_due,
+                    st.session_state["temp_payoff_date"],
+                    key=submission_key("payoff_plan", st.session_state["active_payoff_plan"], plan_balance,
+                                       st.session_state["temp_payoff_date"]),
+                )
+                update_debt_payoff_plan_date(
+                    st.session_state["active_payoff_plan"],
                     st.session_state["temp_payoff_date"]
                 )
-                date_str = st.session_state["temp_payoff_date"].strftime("%Y-%m-%d")
-                query = f"""
-                UPDATE `{PROJECT_ID}.{DATASET_ID}.{DEBT_TABLE_NAME}`
-                SET payoff_plan_date = '{date_str}'
-                WHERE rowid = '{st.session_state["active_payoff_plan"]}'
-                """
-                client.query(query).result()
 
                 st.session_state["active_payoff_plan"] = None
                 rerun_fallback()
+            else:
+                new_submission("payoff_plan")
             if cancel_col.button("Cancel"):
                 st.session_state["active_payoff_plan"] = None
                 rerun_fallback()
@@ -1382,8 +1121,12 @@ elif page_choice == "Debt Domination":
     new_min_payment = st.text_input("Minimum Payment (Optional, blank=none)")
     if st.button("Add Debt"):
         if new_debt_name.strip():
-            add_debt_item(new_debt_name.strip(), new_debt_balance, new_due_date, new_min_payment)
+            add_debt_item(new_debt_name.strip(), new_debt_balance, new_due_date, new_min_payment,
+                          key=submission_key("add_debt", new_debt_name.strip(), new_debt_balance,
+                                             new_due_date, new_min_payment))
         rerun_fallback()
+    else:
+        new_submission("add_debt")
 
 # ─────────────────────────────────────────────────────────────────────────────
 # PAGE 3: Budget Overview (Forward 12 months)
@@ -1402,13 +1145,12 @@ elif page_choice == "Budget Overview":
     start_date = first_of_this_month
     end_date = first_of_this_month + relativedelta(months=12) - relativedelta(days=1)
 
-    fact_data = load_fact_data()
-    fact_data["date"] = pd.to_datetime(fact_data["date"])
-    mask = (fact_data["date"]>=start_date) & (fact_data["date"]<=end_date)
-    data_12mo = fact_data[mask].copy()
+    # Month and category rollups are aggregated in the warehouse
+    monthly_sums = load_monthly_totals(start_date.date(), end_date.date())
+    monthly_cat = load_category_totals(start_date.date(), end_date.date())
 
-    total_inc_12 = data_12mo[data_12mo["type"]=="income"]["amount"].sum()
-    total_exp_12 = data_12mo[data_12mo["type"]=="expense"]["amount"].sum()
+    total_inc_12 = monthly_sums[monthly_sums["type"]=="income"]["amount"].sum()
+    total_exp_12 = monthly_sums[monthly_sums["type"]=="expense"]["amount"].sum()
     leftover_12 = total_inc_12 - total_exp_12
 
     st.markdown(f"""
@@ -1428,10 +1170,6 @@ elif page_choice == "Budget Overview":
     </div>
     """, unsafe_allow_html=True)
 
-    data_12mo["year_month"] = data_12mo["date"].dt.to_period("M")
-    monthly_sums = data_12mo.groupby(["year_month","type"])["amount"].sum().reset_index()
-    monthly_cat = data_12mo.groupby(["year_month","type","category"])["amount"].sum().reset_index()
-
     monthly_sums.sort_values("year_month", inplace=True)
     monthly_cat.sort_values(["year_month","type","category"], inplace=True)
     unique_months = monthly_sums["year_month"].drop_duplicates().sort_values()
@@ -1486,5 +1224,57 @@ elif page_choice == "Budget Overview":
                     amt = row["amount"]
                     st.write(f" - {cat_name}: ${amt:,.2f}")
 
+        # Actual vs target from the envelope ledger, for months with targets
+        envelopes = load_envelopes(ym.start_time.date(), ym.end_time.date())
+        if not envelopes.empty:
+            st.markdown("<b>Budget Targets:</b>", unsafe_allow_html=True)
+            render_envelopes(envelopes)
+
+    # Monte Carlo risk view built on the same grouped data as above
+    st.markdown("<hr>", unsafe_allow_html=True)
+    st.subheader("Risk Forecast")
+    history_start = start_date - relativedelta(months=24)
+    history_cat = load_category_totals(history_start.date(), (start_date - relativedelta(days=1)).date())
+
+    fc1, fc2 = st.columns(2)
+    with fc1:
+        n_sims = st.number_input("Simulated years", min_value=1000, max_value=200000,
+                                 value=20000, step=1000)
+    with fc2:
+        forecast_seed = st.number_input("Seed", min_value=0, value=42, step=1)
+    if st.button("Run Forecast"):
+        debt_df = load_debt_items()
+        debt_start = debt_df["current_balance"].sum() if not debt_df.empty else 0.0
+        with st.spinner("Simulating..."):
+            st.session_state["forecast_result"] = simulate_forecast(
+                monthly_cat, history_cat, debt_start=debt_start,
+                n_sims=int(n_sims), seed=int(forecast_seed)
+            )
+
+    forecast = st.session_state["forecast_result"]
+    if forecast is not None and forecast["n_sims"]:
+        st.write(f"Percentile bands over {forecast['n_sims']:,} simulated years")
+        st.markdown("<b>Monthly Leftover</b>", unsafe_allow_html=True)
+        st.line_chart(forecast["leftover"])
+        st.dataframe(forecast["leftover"].style.format("${:,.2f}"))
+        st.markdown("<b>Total Debt</b>", unsafe_allow_html=True)
+        st.line_chart(forecast["debt"])
+        st.dataframe(forecast["debt"].style.format("${:,.2f}"))
+
+    with st.expander("📤 Export history"):
+        export_panel()
+
     st.markdown("<hr>", unsafe_allow_html=True)
     st.write("End of 12-month Forward Budget Overview")
+
+# ─────────────────────────────────────────────────────────────────────────────
+# 10) Profiler Panel
+# ─────────────────────────────────────────────────────────────────────────────
+budget_trace.close_span(page_span)
+current_trace = budget_trace.current_trace()
+if current_trace is not None and any(s["cache"] == "fallback" for s in current_trace["spans"]):
+    st.sidebar.warning("Query scan budget reached: some figures are from cached data.")
+render_stale_banner(current_trace, stale_banner, budget_data.warehouse_state())
+if st.sidebar.checkbox("Show profiler", key="show_profiler"):
+    render_profiler_panel(current_trace, budget_data.scan_usage())
+budget_trace.finish_rerun()
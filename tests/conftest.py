@@ -0,0 +1,67 @@
+import os
+import sys
+import time
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from streamlit import logger as streamlit_logger  # noqa: E402
+from streamlit.testing.v1 import AppTest  # noqa: E402
+
+import budget_data  # noqa: E402
+from local_warehouse import LocalWarehouse, generate_synthetic_data, seed_warehouse  # noqa: E402
+
+APP_PATH = os.path.join(REPO_ROOT, "streamlit_budget.py")
+
+# The app's collapsed empty labels log a warning with a stack trace on every rerun
+streamlit_logger.set_log_level("error")
+
+SYNTHETIC_DATA = generate_synthetic_data(years=3, categories=12, items_per_category=4, debts=4, seed=0)
+
+
+class Interaction:
+    """Wall time and warehouse calls (by kind) of one AppTest rerun."""
+    def __init__(self, seconds, calls):
+        self.seconds = seconds
+        self.queries = calls.get("query", 0)
+        self.dry_runs = calls.get("dry_run", 0)
+        self.loads = calls.get("load", 0)
+        self.appends = calls.get("append", 0)
+
+    def __repr__(self):
+        return (f"Interaction({self.seconds * 1000:.0f} ms, queries={self.queries}, "
+                f"dry_runs={self.dry_runs}, loads={self.loads}, appends={self.appends})")
+
+
+@pytest.fixture
+def warehouse():
+    wh = LocalWarehouse()
+    seed_warehouse(wh, SYNTHETIC_DATA)
+    budget_data.use_client(wh, wh.project_id)
+    budget_data.ensure_schema()
+    budget_data.clear_caches()
+    yield wh
+    budget_data.use_client(None, None)
+
+
+@pytest.fixture
+def app(warehouse):
+    return AppTest.from_file(APP_PATH, default_timeout=60)
+
+
+@pytest.fixture
+def measure(warehouse):
+    """
+    measure(element_or_app) runs it and returns an Interaction; the
+    app must not raise.
+    """
+    def _measure(runnable):
+        warehouse.calls.clear()
+        start = time.perf_counter()
+        at = runnable.run()
+        elapsed = time.perf_counter() - start
+        assert not at.exception, [e.message for e in at.exception]
+        return Interaction(elapsed, dict(warehouse.calls))
+    return _measure
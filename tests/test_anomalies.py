@@ -0,0 +1,70 @@
+"""
+Duplicate and anomaly detection: exact and near duplicates, per-item
+outliers, and the background scan that keeps up with writes.
+"""
+import time
+from datetime import date, timedelta
+
+import pandas as pd
+
+import budget_data
+from budget_anomalies import find_anomalies
+
+TODAY = date.today()
+
+
+def _row(rowid, day, amount, item="Groceries Item", category="Groceries", type_val="expense"):
+    return {"rowid": rowid, "date": day, "type": type_val, "amount": amount, "category": category,
+            "budget_item": item, "credit_card": None, "note": None}
+
+
+def _wait_for_scan(timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        scan = budget_data.anomaly_scan()
+        if scan["current"]:
+            return scan["findings"]
+        time.sleep(0.02)
+    raise AssertionError("anomaly scan did not finish")
+
+
+def test_duplicates_near_duplicates_and_outliers():
+    rows = [_row(f"r{n}", date(2024, 1, 1) + timedelta(days=7 * n), 50.0 + n % 3) for n in range(12)]
+    rows += [
+        _row("copy", date(2024, 1, 1), 50.0),                       # exact copy of r0
+        _row("near", date(2024, 1, 10), 51.0),                      # r1 two days later
+        _row("big", date(2024, 5, 1), 900.0),                       # far from the item's median
+        _row("other", date(2024, 1, 1), 50.0, item="Other Item"),   # same amount, other item
+    ]
+    found = find_anomalies(pd.DataFrame(rows))
+    by_kind = {kind: list(group["rowid"]) for kind, group in found.groupby("kind")}
+    assert by_kind == {"duplicate": ["copy"], "near_duplicate": ["near"], "outlier": ["big"]}
+    assert found.loc[found["rowid"] == "copy", "duplicate_of"].iloc[0] == "r0"
+    assert found.loc[found["rowid"] == "near", "duplicate_of"].iloc[0] == "r1"
+    assert find_anomalies(pd.DataFrame(rows[:12])).empty
+
+
+def test_background_scan_follows_writes(warehouse):
+    budget_data.check_data_versions()
+    before = _wait_for_scan()
+    rows = budget_data.load_fact_rows(TODAY.replace(day=1), TODAY.replace(day=28))
+    original = rows[rows["series_id"].isna()].iloc[0]
+    copy = {column: original[column] for column in
+            ("date", "type", "amount", "category", "budget_item", "credit_card", "note")}
+    budget_data.save_fact_data(pd.DataFrame([dict(copy, rowid="double-click")]))
+    findings = _wait_for_scan()
+    duplicates = findings[findings["kind"] == "duplicate"]
+    assert "double-click" in set(duplicates["rowid"])
+    assert len(findings) > len(before)
+
+
+def test_findings_in_the_ui(app, measure):
+    budget_data.check_data_versions()
+    rows = budget_data.load_fact_rows(TODAY.replace(day=1), TODAY.replace(day=28))
+    original = rows[rows["series_id"].isna()].iloc[0].drop(["series_id"], errors="ignore")
+    budget_data.save_fact_data(pd.DataFrame([dict(original, rowid="double-click")]))
+    _wait_for_scan()
+    app.run()
+    run = measure(app.button(key="remove_duplicate_double-click").click())
+    assert run.appends >= 1, run
+    assert "double-click" not in set(budget_data.fact_dataset().frame["rowid"])
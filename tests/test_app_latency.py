@@ -0,0 +1,135 @@
+"""
+Headless latency and warehouse-call budgets for every page.
+
+Each test drives streamlit_budget.py through AppTest against the local
+SQLite stand-in seeded with synthetic data, then checks the rerun wall
+time and the number of warehouse calls one interaction makes. Time
+bounds are deliberately loose (scale them with BUDGET_LATENCY_SCALE on
+slow machines); the call counts are exact budgets. Every script run
+starts with one data_versions check, which is counted in the budgets.
+"""
+import os
+from datetime import date
+
+import pandas as pd
+
+LATENCY_SCALE = float(os.environ.get("BUDGET_LATENCY_SCALE", "1"))
+
+PLANNING_RERUN_S = 3.0 * LATENCY_SCALE
+DEBT_RERUN_S = 1.5 * LATENCY_SCALE
+OVERVIEW_RERUN_S = 3.0 * LATENCY_SCALE
+
+
+def _go_to(at, page):
+    return at.sidebar.radio[0].set_value(page)
+
+
+def _selectbox_with_options(at, options):
+    return next(sb for sb in at.selectbox if list(sb.options) == options)
+
+
+def test_budget_planning_first_load(app, measure):
+    run = measure(app)
+    assert run.seconds < PLANNING_RERUN_S, run
+    # version check, monthly totals, the fact table, the recurring series (no
+    # exceptions are read without one), the envelope targets, the card
+    # settings and the dimension index on a cold process
+    assert run.queries <= 7, run
+    assert run.loads == 0, run
+
+    # nothing was written, so everything but the version check is cached
+    run = measure(app)
+    assert run.queries <= 1, run
+
+
+def test_month_navigation(app, measure):
+    app.run()
+    run = measure(app.button(key="next_month_arrow").click())
+    assert run.seconds < PLANNING_RERUN_S, run
+    # one run (the arrows are callbacks, no st.rerun()): version check and the new
+    # month's totals; its rows are a slice of the shared fact dataset
+    assert run.queries <= 2, run
+    assert run.loads == 0, run
+
+
+def test_type_switch_in_transaction_form(app, measure):
+    app.run()
+    run = measure(_selectbox_with_options(app, ["income", "expense"]).set_value("expense"))
+    assert run.seconds < PLANNING_RERUN_S, run
+    # pickers are served from the dimension index: no per-type query
+    assert run.queries <= 1, run
+
+
+def test_add_transaction_is_one_merge(app, measure):
+    app.run()
+    app.number_input(key="transaction_amount").set_value(42.5)
+    run = measure(next(b for b in app.button if b.label == "Add Transaction").click())
+    # an idempotent MERGE on the submission's rowid, not a load job
+    assert run.loads == 0, run
+    # the version bump is a streaming append, not a query
+    assert run.appends == 1, run
+    # the MERGE, two version checks (the submit, then st.rerun()) and the month's reads after it
+    assert run.queries <= 5, run
+
+
+def test_edit_toggle_only_touches_the_list(app, measure):
+    app.run()
+    run = measure(next(b for b in app.button if b.label == "Edit").click())
+    assert run.seconds < PLANNING_RERUN_S, run
+    # a callback, not a write: just the version check
+    assert run.queries <= 1, run
+    assert any(b.label == "Save" for b in app.button)
+
+
+def test_new_item_updates_picker_without_query(app, measure):
+    app.run()
+    app.button(key="item_plus").click().run()
+    app.text_input[0].set_value("Synthetic New Item")
+    run = measure(next(b for b in app.button if b.label == "Save Item").click())
+    assert run.loads == 0, run
+    assert any("Synthetic New Item" in sb.options for sb in app.selectbox)
+    assert run.queries <= 5, run
+
+
+def test_debt_domination(app, measure):
+    app.run()
+    run = measure(_go_to(app, "Debt Domination"))
+    assert run.seconds < DEBT_RERUN_S, run
+    # version check and one read of the debt items, however many sections use them
+    assert run.queries == 2, run
+    assert run.loads == 0, run
+    # the next rerun reads the debt items from the versioned cache
+    run = measure(app)
+    assert run.queries == 1, run
+
+
+def test_budget_overview(app, measure):
+    app.run()
+    run = measure(_go_to(app, "Budget Overview"))
+    assert run.seconds < OVERVIEW_RERUN_S, run
+    # version check, 12-month totals, 12-month categories, forecast history
+    assert run.queries <= 4, run
+    assert run.loads == 0, run
+
+
+def test_dry_runs_match_reads(app, measure):
+    run = measure(app)
+    # every read is dry-run first except the version check, a small
+    # grouped read of data_versions (see compact_data_versions())
+    assert run.dry_runs == run.queries - 1, run
+
+
+def test_write_from_another_process_is_picked_up(app, measure, warehouse):
+    app.run()
+    # another server process adds a transaction to this month and bumps the version
+    warehouse.load_table_from_dataframe(pd.DataFrame([{
+        "rowid": "other-process", "date": date.today(), "type": "income", "amount": 12345.67,
+        "category": "Income Category 1", "budget_item": "Income Category 1 Item 1",
+        "credit_card": None, "note": "", "tenant_id": "default",
+    }]), warehouse.table_id("fact_budget_inputs"))
+    warehouse.query(f"INSERT INTO `{warehouse.table_id('data_versions')}` "
+                    "(tenant_id, table_name, version) VALUES ('default', 'fact_budget_inputs', 1)")
+    run = measure(app)
+    # version check, then monthly totals and month rows refetched
+    assert run.queries == 3, run
+    assert any("12,345.67" in md.value for md in app.markdown), run
@@ -0,0 +1,112 @@
+"""
+Hot/cold archival: closed years move to the archive and summary tables,
+rollups are unchanged, and the hot table shrinks.
+"""
+import sqlite3
+from datetime import date
+
+import pandas as pd
+import pytest
+
+import budget_data
+
+THIS_YEAR = date.today().year
+HISTORY_START = date(THIS_YEAR - 3, 1, 1)
+HISTORY_END = date(THIS_YEAR, 12, 31)
+
+
+def test_rollups_are_unchanged_by_archiving(warehouse):
+    budget_data.check_data_versions()
+    before_totals = budget_data.load_monthly_totals(HISTORY_START, HISTORY_END)
+    before_categories = budget_data.load_category_totals(HISTORY_START, HISTORY_END)
+    hot_before = len(budget_data.load_fact_data())
+
+    moved = budget_data.archive_closed_years()
+    assert moved > 0
+    budget_data.check_data_versions()
+    hot = budget_data.load_fact_data()
+    assert len(hot) == hot_before - moved
+    assert hot["date"].min() >= pd.Timestamp(THIS_YEAR, 1, 1)
+
+    pd.testing.assert_frame_equal(budget_data.load_monthly_totals(HISTORY_START, HISTORY_END), before_totals,
+                                  check_dtype=False)
+    pd.testing.assert_frame_equal(budget_data.load_category_totals(HISTORY_START, HISTORY_END),
+                                  before_categories, check_dtype=False)
+    # a second run has nothing left to move
+    assert budget_data.archive_closed_years() == 0
+
+
+def test_archived_months_stay_browsable(warehouse):
+    budget_data.check_data_versions()
+    month_start, month_end = date(THIS_YEAR - 1, 6, 1), date(THIS_YEAR - 1, 6, 30)
+    rows = budget_data.load_fact_rows(month_start, month_end)
+    budget_data.archive_closed_years()
+    budget_data.check_data_versions()
+    archived = budget_data.load_fact_rows(month_start, month_end)
+    assert sorted(archived["rowid"]) == sorted(rows["rowid"])
+    assert archived["archived"].all()
+
+
+def test_recent_edits_postpone_archiving(warehouse):
+    budget_data.check_data_versions()
+    old = budget_data.load_fact_rows(date(THIS_YEAR - 1, 3, 1), date(THIS_YEAR - 1, 3, 31))
+    budget_data.update_fact_row(old["rowid"].iloc[0], date(THIS_YEAR - 1, 3, 2), 1.0)
+    # the edit is still in the journal (younger than JOURNAL_SETTLE)
+    assert budget_data.archive_closed_years() is None
+
+
+def test_snapshot_rollups_include_summaries(warehouse, tmp_path):
+    budget_data.check_data_versions()
+    budget_data.archive_closed_years()
+    budget_data.check_data_versions()
+    expected = budget_data.load_category_totals(HISTORY_START, HISTORY_END)
+    budget_data.enable_snapshots(str(tmp_path))
+    actual = budget_data.load_category_totals(HISTORY_START, HISTORY_END)
+    pd.testing.assert_frame_equal(actual, expected, check_dtype=False)
+
+
+def _count(warehouse, table_name):
+    return warehouse.conn.execute(f'SELECT COUNT(*) FROM "{warehouse.table_id(table_name)}"').fetchone()[0]
+
+
+def test_a_failed_archive_run_moves_nothing(warehouse):
+    budget_data.check_data_versions()
+    expected = budget_data.load_category_totals(HISTORY_START, HISTORY_END)
+    hot_before = _count(warehouse, budget_data.FACT_TABLE_NAME)
+    # the last statement of the transaction fails: the copies go with it
+    warehouse.conn.execute(f"""
+    CREATE TRIGGER no_delete BEFORE DELETE ON "{warehouse.table_id(budget_data.FACT_TABLE_NAME)}"
+    BEGIN SELECT RAISE(ABORT, 'quota exceeded'); END
+    """)
+    with pytest.raises(sqlite3.DatabaseError):
+        budget_data.archive_closed_years()
+    assert _count(warehouse, budget_data.ARCHIVE_TABLE_NAME) == 0
+    assert _count(warehouse, budget_data.SUMMARY_TABLE_NAME) == 0
+    assert _count(warehouse, budget_data.FACT_TABLE_NAME) == hot_before
+
+    warehouse.conn.execute("DROP TRIGGER no_delete")
+    assert budget_data.archive_closed_years() > 0
+    budget_data.check_data_versions()
+    pd.testing.assert_frame_equal(budget_data.load_category_totals(HISTORY_START, HISTORY_END), expected,
+                                  check_dtype=False)
+
+
+def test_rows_already_archived_are_not_counted_twice(warehouse):
+    budget_data.check_data_versions()
+    expected = budget_data.load_category_totals(HISTORY_START, HISTORY_END)
+    base_id = warehouse.table_id(budget_data.FACT_TABLE_NAME)
+    archive_id = warehouse.table_id(budget_data.ARCHIVE_TABLE_NAME)
+    cols = ", ".join(name for name, _ in budget_data.JOURNALED_COLUMNS[budget_data.FACT_TABLE_NAME])
+    # archived and summarized already, but still in the hot table too
+    warehouse.conn.execute(f"""
+    INSERT INTO "{archive_id}" ({cols})
+    SELECT {cols} FROM "{base_id}" WHERE date < '{THIS_YEAR - 1}-07-01'
+    """)
+    warehouse.conn.commit()
+    budget_data.rebuild_monthly_summaries()
+
+    moved = budget_data.archive_closed_years()
+    budget_data.check_data_versions()
+    assert _count(warehouse, budget_data.ARCHIVE_TABLE_NAME) == moved
+    pd.testing.assert_frame_equal(budget_data.load_category_totals(HISTORY_START, HISTORY_END), expected,
+                                  check_dtype=False)
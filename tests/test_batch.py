@@ -0,0 +1,115 @@
+"""
+Batch jobs outside Streamlit: bulk payoff plan recalculation, summary
+rebuilds, and the budget_batch command line (progress and exit codes).
+"""
+from datetime import date
+
+import pandas as pd
+import pytest
+
+import budget_batch
+import budget_data
+from budget_payoff import payment_dates
+
+THIS_YEAR = date.today().year
+HISTORY_START = date(THIS_YEAR - 3, 1, 1)
+HISTORY_END = date(THIS_YEAR, 12, 31)
+PAYOFF = date(THIS_YEAR + 2, 6, 1)
+
+
+@pytest.fixture
+def secrets(warehouse, tmp_path):
+    # connect() keeps the warehouse fixture's client; the file only has to parse
+    path = tmp_path / "secrets.toml"
+    path.write_text('[local_warehouse]\npath = "unused.sqlite"\n')
+    return str(path)
+
+
+def _plan_lines(debt_name):
+    frame = budget_data.fact_dataset().frame
+    return frame[(frame["budget_item"] == debt_name) & (frame["note"] == "Auto Payoff Plan")]
+
+
+def test_payment_dates():
+    today = date(2024, 1, 20)
+    dates = payment_dates("15th", date(2024, 4, 1), today)
+    assert dates == [date(2024, 2, 15), date(2024, 3, 15), date(2024, 4, 15)]
+    assert payment_dates("31", date(2024, 2, 1), date(2024, 1, 1)) == [date(2024, 1, 31), date(2024, 2, 29)]
+    assert payment_dates("15", today, today) == []
+
+
+def test_recalculate_payoff_plans_in_bulk(warehouse):
+    budget_data.check_data_versions()
+    debts = budget_data.load_debt_items().head(2)
+    for rowid, name in zip(debts["rowid"], debts["debt_name"]):
+        budget_data.insert_monthly_payments_for_debt(name, 1000.0, "10", PAYOFF)
+        budget_data.update_debt_payoff_plan_date(rowid, PAYOFF)
+    budget_data.update_debt_item(debts["rowid"].iloc[0], 600.0)
+    budget_data.check_data_versions()
+
+    steps = []
+    warehouse.calls.clear()
+    payments = budget_data.recalculate_payoff_plans(progress=lambda *step: steps.append(step))
+    assert [step[:2] for step in steps] == [(1, 2), (2, 2)]
+    # bulk: one journaled delete of every old line and one MERGE of every new one (plus their version bumps)
+    assert warehouse.calls["append"] == 3 and warehouse.calls["load"] == 0
+    lines = _plan_lines(debts["debt_name"].iloc[0])
+    assert len(lines) * 2 == payments
+    assert lines["amount"].sum() == pytest.approx(600.0, abs=0.5)
+
+    # a second run the same day writes no rows (its MERGE still bumps the version)
+    budget_data.check_data_versions()
+    warehouse.calls.clear()
+    assert budget_data.recalculate_payoff_plans() == payments
+    assert warehouse.calls["append"] == 1
+    assert len(_plan_lines(debts["debt_name"].iloc[0])) == len(lines)
+
+
+def test_rebuild_merges_summaries_of_each_archive_run(warehouse):
+    budget_data.check_data_versions()
+    budget_data.archive_closed_years()
+    # a late entry for an archived month is archived by the next run, in a summary row of its own
+    late = budget_data.load_archived_rows(date(THIS_YEAR - 1, 5, 1), date(THIS_YEAR - 1, 5, 31)).iloc[0]
+    budget_data.save_fact_data(pd.DataFrame([{
+        "rowid": "late", "date": late["date"].date(), "type": late["type"], "amount": 12.5,
+        "category": late["category"], "budget_item": late["budget_item"], "credit_card": None, "note": None,
+    }]))
+    assert budget_data.archive_closed_years() == 1
+    budget_data.check_data_versions()
+    expected = budget_data.load_category_totals(HISTORY_START, HISTORY_END)
+
+    summary_id = warehouse.table_id(budget_data.SUMMARY_TABLE_NAME)
+    count = f'SELECT COUNT(DISTINCT year_month || type || category), COUNT(*) FROM "{summary_id}"'
+    distinct, stored = warehouse.conn.execute(count).fetchone()
+    assert stored == distinct + 1
+    assert budget_data.rebuild_monthly_summaries() == distinct
+    assert warehouse.conn.execute(count).fetchone() == (distinct, distinct)
+    budget_data.check_data_versions()
+    pd.testing.assert_frame_equal(budget_data.load_category_totals(HISTORY_START, HISTORY_END), expected,
+                                  check_dtype=False)
+
+
+def test_cli_runs_jobs_with_progress(secrets, tmp_path, capsys):
+    out = tmp_path / "exports"
+    code = budget_batch.main(["compact", "rebuild-aggregates", "recalc-payoffs", "export",
+                              "--secrets", secrets, "--out", str(out), "--format", "parquet"])
+    assert code == budget_batch.EXIT_OK
+    errors = capsys.readouterr().err
+    assert "[default] compact: 1/" in errors and "[default] export: 2/2" in errors
+    exported = pd.read_parquet(out / "default" / f"{budget_data.FACT_TABLE_NAME}.parquet")
+    assert len(exported) == len(budget_data.load_fact_data())
+
+
+def test_cli_exit_codes(secrets, capsys):
+    budget_data.check_data_versions()
+    old = budget_data.load_fact_rows(date(THIS_YEAR - 1, 3, 1), date(THIS_YEAR - 1, 3, 31))
+    budget_data.update_fact_row(old["rowid"].iloc[0], date(THIS_YEAR - 1, 3, 2), 1.0)
+    # the edit is not settled yet: archiving has to wait
+    assert budget_batch.main(["archive", "--secrets", secrets, "--quiet"]) == budget_batch.EXIT_TEMPFAIL
+    assert "retry later" in capsys.readouterr().err
+    assert budget_batch.main(["compact", "--secrets", secrets, "--tenant", "no such tenant!"]) == \
+        budget_batch.EXIT_FAILED
+    assert budget_batch.main(["compact", "--secrets", "missing.toml"]) == budget_batch.EXIT_FAILED
+    with pytest.raises(SystemExit) as exited:
+        budget_batch.main(["defragment", "--secrets", secrets])
+    assert exited.value.code == 2
@@ -0,0 +1,78 @@
+"""
+Credit card statement cycles: closing dates, the per-card, per-cycle
+charge index and its upkeep on writes, and the Debt Domination view.
+"""
+from datetime import date, timedelta
+
+import pandas as pd
+
+import budget_data
+from budget_cards import CardCycleIndex, cycle_start, statement_close
+
+TODAY = date.today()
+CARD = "Synthetic Visa"
+
+
+def _charge(rowid, day, amount, card=CARD, type_val="expense"):
+    return {"rowid": rowid, "date": day, "type": type_val, "amount": amount, "category": "Expense Category 1",
+            "budget_item": "Expense Category 1 Item 1", "credit_card": card, "note": None}
+
+
+def test_closing_dates():
+    assert statement_close(date(2024, 3, 10), 25) == date(2024, 3, 25)
+    assert statement_close(date(2024, 3, 26), 25) == date(2024, 4, 25)
+    assert statement_close(date(2024, 12, 30), 25) == date(2025, 1, 25)
+    # a closing day past the month's end closes on its last day
+    assert statement_close(date(2024, 2, 10), 31) == date(2024, 2, 29)
+    assert cycle_start(date(2024, 3, 31), 31) == date(2024, 3, 1)
+    assert cycle_start(date(2024, 4, 25), 25) == date(2024, 3, 26)
+
+
+def test_index_moves_with_each_change():
+    rows = pd.DataFrame([_charge("a", date(2024, 3, 10), 40.0), _charge("b", date(2024, 3, 26), 60.0),
+                         _charge("c", date(2024, 3, 12), 5.0, card="Other"),
+                         _charge("d", date(2024, 3, 12), 900.0, type_val="income")])
+    index = CardCycleIndex(rows, {CARD: 25})
+    assert index.balance(CARD, date(2024, 3, 25)) == 40.0
+    assert index.balance(CARD, date(2024, 4, 25)) == 60.0
+    index.update_row("b", date=date(2024, 3, 20))
+    assert index.balance(CARD, date(2024, 3, 25)) == 100.0
+    index.remove_rows(["a"])
+    index.add_rows(pd.DataFrame([_charge("e", date(2024, 4, 1), 7.5)]))
+    assert index.balance(CARD, date(2024, 3, 25)) == 60.0
+    assert index.balance(CARD, date(2024, 4, 25)) == 7.5
+
+
+def test_statements_follow_writes_without_rereading(warehouse):
+    budget_data.check_data_versions()
+    budget_data.save_credit_card(CARD, 25, "Synthetic Debt 1")
+    budget_data.check_data_versions()
+    statement = budget_data.load_card_statements(TODAY).iloc[0]
+    assert statement["statement_balance"] == 0.0 and statement["debt_name"] == "Synthetic Debt 1"
+
+    budget_data.save_fact_data(pd.DataFrame([_charge("charge", TODAY, 42.0)]))
+    budget_data.check_data_versions()
+    warehouse.calls.clear()
+    statement = budget_data.load_card_statements(TODAY).iloc[0]
+    assert statement["statement_balance"] == 42.0
+    assert warehouse.calls["query"] == 0
+
+    next_day = statement["statement_close"] + timedelta(days=1)
+    budget_data.update_fact_row("charge", next_day, 42.0)
+    fields = {k: v for k, v in _charge("", TODAY, 10.0).items() if k not in ("rowid", "date")}
+    budget_data.add_recurring_series(TODAY, "monthly", fields, occurrences=1)
+    budget_data.check_data_versions()
+    statement = budget_data.load_card_statements(TODAY).iloc[0]
+    assert statement["statement_balance"] == 10.0
+    assert statement["next_balance"] == 42.0
+
+
+def test_debt_page_shows_statement(app, measure):
+    budget_data.check_data_versions()
+    debt_name = budget_data.load_debt_items()["debt_name"].iloc[0]
+    budget_data.save_credit_card(CARD, 25, debt_name)
+    budget_data.save_fact_data(pd.DataFrame([_charge("charge", TODAY, 42.0)]))
+    app.run()
+    run = measure(app.sidebar.radio[0].set_value("Debt Domination"))
+    assert any(CARD in caption.value and "$42.00" in caption.value for caption in app.caption), run
+    assert any(CARD in list(frame.value["Card"]) for frame in app.dataframe)
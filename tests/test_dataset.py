@@ -0,0 +1,110 @@
+"""
+Shared fact dataset: date ranges are binary-searched views of one sorted
+copy, shared by every session and replaced (not mutated) on writes, and a
+write gives the same rows as rebuilding the dataset without re-sorting it.
+"""
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+import budget_data
+from budget_dataset import FactDataset
+
+MONTH_START = date.today().replace(day=1)
+MONTH_END = MONTH_START.replace(day=28)
+
+
+def _rows():
+    return pd.DataFrame([
+        {"rowid": "c", "date": date(2024, 3, 1), "amount": 30.0},
+        {"rowid": "a", "date": date(2024, 1, 31), "amount": 10.0},
+        {"rowid": "b", "date": date(2024, 2, 1), "amount": 20.0},
+        {"rowid": "b2", "date": date(2024, 2, 29), "amount": 21.0},
+    ])
+
+
+def test_ranges_are_inclusive_views():
+    dataset = FactDataset(_rows())
+    february = dataset.rows(date(2024, 2, 1), date(2024, 2, 29))
+    assert list(february["rowid"]) == ["b", "b2"]
+    assert np.shares_memory(february["amount"].to_numpy(), dataset.frame["amount"].to_numpy())
+    assert dataset.rows(date(2023, 1, 1), date(2023, 12, 31)).empty
+    assert list(dataset.rows(date(2024, 1, 1), date(2024, 12, 31))["rowid"]) == ["a", "b", "b2", "c"]
+
+
+def test_modifying_a_view_leaves_the_dataset_alone():
+    dataset = FactDataset(_rows())
+    february = dataset.rows(date(2024, 2, 1), date(2024, 2, 29))
+    february.loc[0, "amount"] = -1.0
+    february["year_month"] = february["date"].dt.to_period("M")
+    assert dataset.frame["amount"].tolist() == [10.0, 20.0, 21.0, 30.0]
+    assert "year_month" not in dataset.frame.columns
+
+
+def test_changes_return_a_new_dataset():
+    dataset = FactDataset(_rows())
+    changed = (dataset.add_rows(pd.DataFrame([{"rowid": "d", "date": date(2024, 2, 15), "amount": 5.0}]))
+               .update_row("a", date=date(2024, 2, 20))
+               .remove_rows(["c"]))
+    assert list(changed.frame["rowid"]) == ["b", "d", "a", "b2"]
+    assert list(dataset.frame["rowid"]) == ["a", "b", "b2", "c"]
+
+
+def test_writes_match_a_rebuild():
+    rng = np.random.default_rng(3)
+    dataset = FactDataset(_rows())
+    for n in range(40):
+        frame = dataset.frame.copy()
+        day = date(2024, 1, 1) + pd.Timedelta(days=int(rng.integers(0, 90)))
+        rowid = frame["rowid"].iloc[int(rng.integers(0, len(frame)))]
+        if n % 3 == 0:
+            row = pd.DataFrame([{"rowid": f"n{n}", "date": day, "amount": float(n)}])
+            frame = pd.concat([frame, row], ignore_index=True)
+            dataset = dataset.add_rows(row)
+        elif n % 3 == 1:
+            frame.loc[frame["rowid"] == rowid, "date"] = pd.Timestamp(day)
+            dataset = dataset.update_row(rowid, date=day)
+        else:
+            frame = frame[frame["rowid"] != rowid]
+            dataset = dataset.remove_rows([rowid])
+        rebuilt = FactDataset(frame)
+        pd.testing.assert_frame_equal(dataset.frame, rebuilt.frame)
+        assert (dataset.days == rebuilt.days).all()
+
+
+def test_appended_rows_are_sorted_on_the_next_read():
+    dataset = FactDataset(_rows())
+    earlier = dataset.add_rows(pd.DataFrame([{"rowid": "z", "date": date(2024, 1, 2), "amount": 1.0}]))
+    later = earlier.add_rows(pd.DataFrame([{"rowid": "y", "date": date(2024, 1, 3), "amount": 2.0}]))
+    assert list(later.rows(date(2024, 1, 1), date(2024, 1, 31))["rowid"]) == ["z", "y", "a"]
+    assert list(earlier.frame["rowid"]) == ["z", "a", "b", "b2", "c"]
+
+
+def test_an_update_copies_only_the_changed_column():
+    dataset = FactDataset(_rows())
+    changed = dataset.update_row("b", amount=25.0)
+    assert changed.frame["amount"].tolist() == [10.0, 25.0, 21.0, 30.0]
+    assert dataset.frame["amount"].tolist() == [10.0, 20.0, 21.0, 30.0]
+    assert np.shares_memory(changed.days, dataset.days)
+    assert np.shares_memory(changed.frame["date"].to_numpy(), dataset.frame["date"].to_numpy())
+
+
+def test_sessions_share_one_copy(warehouse):
+    budget_data.check_data_versions()
+    first = budget_data.load_fact_rows(MONTH_START, MONTH_END)
+    warehouse.calls.clear()
+    second = budget_data.load_fact_rows(MONTH_START, MONTH_END)
+    assert warehouse.calls["query"] == 0 and len(second) > 0
+    assert np.shares_memory(first["amount"].to_numpy(), second["amount"].to_numpy())
+
+    budget_data.save_fact_data(pd.DataFrame([{
+        "rowid": "new", "date": MONTH_START, "type": "expense", "amount": 12.0,
+        "category": "Expense Category 1", "budget_item": "Expense Category 1 Item 1",
+        "credit_card": None, "note": None,
+    }]))
+    budget_data.check_data_versions()
+    warehouse.calls.clear()
+    after = budget_data.load_fact_rows(MONTH_START, MONTH_END)
+    assert warehouse.calls["query"] == 0
+    assert len(after) == len(first) + 1 and "new" not in set(first["rowid"])
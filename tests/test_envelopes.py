@@ -0,0 +1,82 @@
+"""
+Envelope budgets: per-(category, month) targets and the ledger of actuals
+that writers keep current without re-reading the fact table.
+"""
+from datetime import date
+
+import pandas as pd
+
+import budget_data
+from budget_envelopes import EnvelopeLedger
+
+MONTH_START = date.today().replace(day=1)
+MONTH_END = (pd.Timestamp(MONTH_START) + pd.offsets.MonthEnd(0)).date()
+MONTH = f"{MONTH_START:%Y-%m}"
+CATEGORY = "Expense Category 2"
+
+
+def _row(rowid, amount, category=CATEGORY, type_val="expense", day=3):
+    return {"rowid": rowid, "date": MONTH_START.replace(day=day), "type": type_val, "amount": amount,
+            "category": category, "budget_item": f"{category} Item 1", "credit_card": None, "note": None}
+
+
+def test_ledger_moves_with_each_change():
+    ledger = EnvelopeLedger(pd.DataFrame([_row("a", 40.0), _row("b", 60.0), _row("c", 900.0, type_val="income")]))
+    assert ledger.month_actuals(MONTH) == {CATEGORY: 100.0}
+    ledger.add_rows(pd.DataFrame([_row("d", 5.0, category="Fun")]))
+    ledger.update_row("a", amount=10.0)
+    assert ledger.month_actuals(MONTH) == {CATEGORY: 70.0, "Fun": 5.0}
+    ledger.update_row("b", date=pd.Timestamp(MONTH_START) + pd.DateOffset(months=1))
+    ledger.remove_rows(["d"])
+    assert ledger.month_actuals(MONTH) == {CATEGORY: 10.0}
+    ledger.remove_where(category=CATEGORY)
+    assert ledger.month_actuals(MONTH) == {}
+
+
+def test_targets_are_journaled_and_span_months(warehouse):
+    budget_data.check_data_versions()
+    assert budget_data.load_envelopes(MONTH_START, MONTH_END).empty
+    budget_data.set_envelope_target(CATEGORY, MONTH_START, 500.0, months=3)
+    budget_data.check_data_versions()
+    targets = budget_data.load_envelope_targets()
+    assert len(targets) == 3 and set(targets["target"]) == {500.0}
+    change_id = budget_data.set_envelope_target(CATEGORY, MONTH_START, 0)
+    budget_data.check_data_versions()
+    assert sorted(budget_data.load_envelope_targets()["year_month"])[0] > MONTH
+    budget_data.undo_change(budget_data.ENVELOPE_TABLE_NAME, change_id)
+    budget_data.check_data_versions()
+    assert len(budget_data.load_envelope_targets()) == 3
+
+
+def test_actuals_follow_writes_without_rereading(warehouse):
+    budget_data.check_data_versions()
+    budget_data.set_envelope_target(CATEGORY, MONTH_START, 500.0)
+    budget_data.check_data_versions()
+    before = budget_data.load_envelopes(MONTH_START, MONTH_END).iloc[0]
+
+    budget_data.save_fact_data(pd.DataFrame([_row("new", 75.0)]))
+    budget_data.check_data_versions()
+    warehouse.calls.clear()
+    report = budget_data.load_envelopes(MONTH_START, MONTH_END)
+    assert report.iloc[0]["actual"] == before["actual"] + 75.0
+    assert report.iloc[0]["remaining"] == 500.0 - report.iloc[0]["actual"]
+    # the ledger was moved in place: no read of the fact table
+    assert warehouse.calls["query"] == 0
+
+    budget_data.update_fact_row("new", MONTH_START.replace(day=3), 25.0)
+    budget_data.check_data_versions()
+    assert budget_data.load_envelopes(MONTH_START, MONTH_END).iloc[0]["actual"] == before["actual"] + 25.0
+    budget_data.remove_fact_row("new")
+    budget_data.check_data_versions()
+    assert budget_data.load_envelopes(MONTH_START, MONTH_END).iloc[0]["actual"] == before["actual"]
+
+
+def test_planning_page_shows_targets(app, measure):
+    budget_data.check_data_versions()
+    rows = budget_data.load_fact_rows(MONTH_START, MONTH_END)
+    category = rows[rows["type"] == "expense"]["category"].iloc[0]
+    budget_data.set_envelope_target(category, MONTH_START, 1.0)
+    run = measure(app)
+    assert any(list(frame.value["category"]) == [category] for frame in app.dataframe), run
+    # the category header in the transaction list shows the target too
+    assert any("of $1.00" in md.value for md in app.markdown)
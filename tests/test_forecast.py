@@ -0,0 +1,76 @@
+"""
+Monte Carlo forecast: seeded chunks give the same bands for any number of
+workers, the bands are ordered, and a plan without history or without
+categories still gives sensible bands.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+import budget_forecast
+
+MONTHS = ["2031-01", "2031-02", "2031-03"]
+
+
+def _grouped(rows):
+    return pd.DataFrame(rows, columns=["year_month", "type", "category", "amount"])
+
+
+def _plan():
+    rows = []
+    for ym in MONTHS:
+        rows += [(ym, "income", "Salary", 5000.0), (ym, "expense", "Groceries", 900.0),
+                 (ym, "expense", budget_forecast.DEBT_CATEGORY, 400.0)]
+    return _grouped(rows)
+
+
+def _history():
+    rows = []
+    for n, ym in enumerate(["2030-07", "2030-08", "2030-09", "2030-10", "2030-11", "2030-12"]):
+        rows += [(ym, "income", "Salary", 5000.0 + 300 * (n % 2)), (ym, "expense", "Groceries", 700.0 + 80 * n),
+                 (ym, "expense", budget_forecast.DEBT_CATEGORY, 400.0)]
+    return _grouped(rows)
+
+
+def test_same_seed_same_bands_for_any_worker_count():
+    n_sims = 2 * budget_forecast.CHUNK_SIZE + 500
+    in_process = budget_forecast.simulate_forecast(_plan(), _history(), debt_start=2000.0, n_sims=n_sims,
+                                                   seed=7, workers=1)
+    pooled = budget_forecast.simulate_forecast(_plan(), _history(), debt_start=2000.0, n_sims=n_sims,
+                                               seed=7, workers=2)
+    pool = budget_forecast._shared_pool()
+    again = budget_forecast.simulate_forecast(_plan(), _history(), debt_start=2000.0, n_sims=n_sims,
+                                              seed=7, workers=3)
+    # every run shares one pool for the process
+    assert budget_forecast._shared_pool() is pool
+    pd.testing.assert_frame_equal(again["leftover"], pooled["leftover"])
+    assert in_process["n_sims"] == pooled["n_sims"] == n_sims
+    pd.testing.assert_frame_equal(in_process["leftover"], pooled["leftover"])
+    pd.testing.assert_frame_equal(in_process["debt"], pooled["debt"])
+    other = budget_forecast.simulate_forecast(_plan(), _history(), debt_start=2000.0, n_sims=n_sims,
+                                              seed=8, workers=1)
+    assert not np.allclose(other["leftover"].to_numpy(), in_process["leftover"].to_numpy())
+
+
+def test_bands_are_ordered():
+    result = budget_forecast.simulate_forecast(_plan(), _history(), debt_start=2000.0, n_sims=3000, workers=1)
+    for bands in (result["leftover"], result["debt"]):
+        assert list(bands.index) == MONTHS
+        values = bands.to_numpy()
+        assert (np.diff(values, axis=1) >= 0).all()
+    leftover = result["leftover"]
+    assert (leftover["p5"] < leftover["p50"]).all() and (leftover["p50"] < leftover["p95"]).all()
+    # the planned leftover is near the median
+    assert leftover["p50"].to_numpy() == pytest.approx(3700.0, rel=0.05)
+
+
+def test_no_history_or_no_categories():
+    # without history every category is fixed: all bands are the plan
+    fixed = budget_forecast.simulate_forecast(_plan(), _grouped([]), debt_start=1000.0, n_sims=500, workers=1)
+    assert fixed["leftover"].to_numpy() == pytest.approx(3700.0)
+    assert list(fixed["debt"]["p50"]) == pytest.approx([600.0, 200.0, 0.0])
+
+    empty = budget_forecast.simulate_forecast(_grouped([]), _history(), n_sims=500)
+    assert empty["n_sims"] == 0
+    assert empty["leftover"].empty and empty["debt"].empty
+    assert list(empty["leftover"].columns) == [f"p{p}" for p in budget_forecast.DEFAULT_PERCENTILES]
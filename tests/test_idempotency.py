@@ -0,0 +1,155 @@
+"""
+Idempotent writes: rowids from idempotency keys, MERGE-on-rowid inserts
+that skip rows already written, and retried submissions that write once.
+"""
+from datetime import date, timedelta
+
+import pandas as pd
+
+import budget_data
+
+TODAY = date.today()
+
+
+def _rows(key, count):
+    return pd.DataFrame([{
+        "rowid": budget_data.derived_rowid(key, n), "date": TODAY, "type": "expense", "amount": 1.0 + n,
+        "category": "Expense Category 1", "budget_item": "Expense Category 1 Item 1",
+        "credit_card": None, "note": "retried",
+    } for n in range(count)])
+
+
+def _count(warehouse, table_name, column, value):
+    """Rows stored in the base table (MERGE writes there), however many are current."""
+    table_id = warehouse.table_id(table_name)
+    return warehouse.conn.execute(f'SELECT COUNT(*) FROM "{table_id}" WHERE "{column}" = ?', (value,)).fetchone()[0]
+
+
+def test_keys_are_stable():
+    key = budget_data.idempotency_key("add_transaction", "token", TODAY, 42.5)
+    assert key == budget_data.idempotency_key("add_transaction", "token", TODAY, 42.5)
+    assert key != budget_data.idempotency_key("add_transaction", "other token", TODAY, 42.5)
+    assert budget_data.derived_rowid(key, 0) != budget_data.derived_rowid(key, 1)
+
+
+def test_saving_the_same_rows_twice_inserts_once(warehouse):
+    budget_data.check_data_versions()
+    # more rows than one MERGE statement takes
+    rows = _rows("bulk", budget_data.MERGE_CHUNK_ROWS + 50)
+    assert budget_data.save_fact_data(rows) == len(rows)
+    assert budget_data.save_fact_data(rows) == 0
+    # a retry of a partly applied write inserts only the rest
+    more = _rows("bulk", budget_data.MERGE_CHUNK_ROWS + 60)
+    assert budget_data.save_fact_data(more) == 10
+    assert _count(warehouse, budget_data.FACT_TABLE_NAME, "note", "retried") == len(more)
+    frame = budget_data.fact_dataset().frame
+    assert (frame["note"] == "retried").sum() == len(more)
+
+
+def test_replay_after_compaction_does_not_undo_edits(warehouse, monkeypatch):
+    budget_data.check_data_versions()
+    rows = _rows("compacted", 3)
+    budget_data.save_fact_data(rows)
+    deleted, edited, kept = rows["rowid"]
+    budget_data.remove_fact_row(deleted)
+    budget_data.update_fact_row(edited, TODAY, 99.0)
+    monkeypatch.setattr(budget_data, "JOURNAL_SETTLE", timedelta(0))
+    budget_data.compact_journal(budget_data.FACT_TABLE_NAME)
+    assert _count(warehouse, budget_data.FACT_TABLE_NAME, "rowid", deleted) == 0
+
+    assert budget_data.save_fact_data(rows) == 0
+    assert _count(warehouse, budget_data.FACT_TABLE_NAME, "rowid", deleted) == 0
+    budget_data.check_data_versions()
+    frame = budget_data.fact_dataset().frame.set_index("rowid")
+    assert deleted not in frame.index and kept in frame.index
+    assert frame.loc[edited, "amount"] == 99.0
+
+
+def test_a_batch_bumps_the_version_once(warehouse):
+    versions_id = warehouse.table_id(budget_data.VERSIONS_TABLE_NAME)
+
+    def version_rows():
+        return warehouse.conn.execute(f'SELECT COUNT(*) FROM "{versions_id}" WHERE table_name = ?',
+                                      (budget_data.FACT_TABLE_NAME,)).fetchone()[0]
+
+    before = version_rows()
+    budget_data.save_fact_data(_rows("chunks", 2 * budget_data.MERGE_CHUNK_ROWS + 1))
+    assert version_rows() == before + 1
+
+
+def test_retried_merge_whose_first_attempt_committed_is_seen(warehouse, monkeypatch):
+    budget_data.check_data_versions()
+    assert not (budget_data.fact_dataset().frame["note"] == "retried").any()
+    query = warehouse.query
+    lost = []
+
+    def reply_lost(sql, job_config=None, timeout=None):
+        job = query(sql, job_config, timeout)
+        if sql.lstrip().startswith("MERGE") and not lost:
+            lost.append(sql)
+            raise TimeoutError("reply lost")
+        return job
+
+    monkeypatch.setattr(warehouse, "query", reply_lost)
+    # the retry inserts nothing, but the rows are new to every cache
+    assert budget_data.save_fact_data(_rows("lost", 3)) == 0
+    assert lost
+    budget_data.check_data_versions()
+    assert (budget_data.fact_dataset().frame["note"] == "retried").sum() == 3
+
+
+def test_keyed_writers_are_no_ops_on_retry(warehouse):
+    budget_data.check_data_versions()
+    key = budget_data.idempotency_key("add_debt", "token")
+    budget_data.add_debt_item("Retried Debt", 900.0, "15", "25", key=key)
+    budget_data.add_debt_item("Retried Debt", 900.0, "15", "25", key=key)
+    assert (budget_data.load_debt_items()["debt_name"] == "Retried Debt").sum() == 1
+
+    key = budget_data.idempotency_key("show_new_item_form", "token")
+    budget_data.add_dimension_row("expense", "Expense Category 1", "Retried Item", key=key)
+    budget_data.add_dimension_row("expense", "Expense Category 1", "Retried Item", key=key)
+    assert _count(warehouse, budget_data.CATS_TABLE_NAME, "budget_item", "Retried Item") == 1
+
+    key = budget_data.idempotency_key("payoff_plan", "token")
+    payoff = date(TODAY.year + 1, 12, 1)
+    budget_data.insert_monthly_payments_for_debt("Retried Debt", 900.0, "15", payoff, key=key)
+    planned = budget_data.fact_series_rowids(key)
+    assert planned
+    budget_data.insert_monthly_payments_for_debt("Retried Debt", 900.0, "15", payoff, key=key)
+    assert budget_data.fact_series_rowids(key) == planned
+    assert _count(warehouse, budget_data.FACT_TABLE_NAME, "series_id", key) == len(planned)
+
+
+def test_replayed_submission_writes_once(app, measure):
+    app.run()
+    app.number_input(key="transaction_amount").set_value(42.5)
+    add = next(b for b in app.button if b.label == "Add Transaction")
+    # the same submission twice, as a second click landing before the rerun would send it
+    token = app.session_state["add_transaction_submission"]
+    add.click().run()
+    app.session_state["add_transaction_submission"] = token
+    next(b for b in app.button if b.label == "Add Transaction").click().run()
+    frame = budget_data.fact_dataset().frame
+    assert ((frame["amount"] == 42.5) & (frame["date"] == pd.Timestamp(TODAY))).sum() == 1
+
+
+def test_resubmitted_payoff_plan_is_written_again(app):
+    app.run()
+    app.sidebar.radio[0].set_value("Debt Domination").run()
+    debt = budget_data.load_debt_items().iloc[0]
+    payoff = date(TODAY.year + 1, 12, 1)
+
+    def submit_plan():
+        app.session_state["active_payoff_plan"] = debt["rowid"]
+        app.session_state["temp_payoff_date"] = payoff
+        app.run()
+        next(b for b in app.button if b.label == "Submit").click().run()
+        budget_data.check_data_versions()
+        frame = budget_data.fact_dataset().frame
+        return ((frame["budget_item"] == debt["debt_name"]) & (frame["note"] == "Auto Payoff Plan")).sum()
+
+    planned = submit_plan()
+    assert planned
+    budget_data.remove_old_payoff_lines_for_debt(debt["debt_name"])
+    # the same plan again, as a new submission: written, not taken for a replay
+    assert submit_plan() == planned
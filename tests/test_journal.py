@@ -0,0 +1,117 @@
+"""
+Change journal: edits and deletes are appended events, reads see the
+current state, undo restores it and compaction folds events into the base
+tables without changing what is read.
+"""
+from datetime import date, datetime, timedelta, timezone
+
+import pytest
+
+import budget_data
+
+MONTH_START = date.today().replace(day=1)
+MONTH_END = MONTH_START.replace(day=28)
+
+
+@pytest.fixture
+def changes(warehouse):
+    session_changes = []
+    budget_data.set_session_changes(session_changes)
+    yield session_changes
+    budget_data.set_session_changes(None)
+
+
+def _base_rows(warehouse, table_name):
+    return warehouse.conn.execute(f'SELECT rowid, amount FROM "{warehouse.table_id(table_name)}"').fetchall()
+
+
+def test_edits_are_appends_not_dml(warehouse, changes):
+    rows = budget_data.load_fact_rows(MONTH_START, MONTH_END)
+    edited, removed = rows["rowid"].iloc[0], rows["rowid"].iloc[1]
+    base = _base_rows(warehouse, budget_data.FACT_TABLE_NAME)
+    warehouse.calls.clear()
+    budget_data.update_fact_row(edited, MONTH_START, 999.0)
+    budget_data.remove_fact_row(removed)
+    # one append per change (plus a version row each); the queries only read the before-images
+    assert warehouse.calls["append"] == 4
+    assert _base_rows(warehouse, budget_data.FACT_TABLE_NAME) == base
+
+    budget_data.check_data_versions()
+    after = budget_data.load_fact_rows(MONTH_START, MONTH_END).set_index("rowid")
+    assert after.loc[edited, "amount"] == 999.0
+    assert removed not in after.index
+    assert [change["label"] for change in changes] == ["Edit transaction", "Delete transaction"]
+
+
+def test_undo_restores_previous_state(warehouse, changes):
+    debts = budget_data.load_debt_items().set_index("rowid")
+    row_id = debts.index[0]
+    budget_data.update_debt_item(row_id, 1.0)
+    budget_data.remove_debt_item(debts.index[1])
+
+    assert budget_data.undo_last_change() == "Delete debt"
+    assert budget_data.undo_last_change() == "Update debt balance"
+    assert budget_data.undo_last_change() is None
+    budget_data.check_data_versions()
+    restored = budget_data.load_debt_items().set_index("rowid")
+    assert sorted(restored.index) == sorted(debts.index)
+    assert restored.loc[row_id, "current_balance"] == debts.loc[row_id, "current_balance"]
+    assert len(budget_data.load_change_history(budget_data.DEBT_TABLE_NAME)) == 4
+
+
+def test_compaction_keeps_current_state(warehouse, changes, monkeypatch):
+    rows = budget_data.load_fact_rows(MONTH_START, MONTH_END)
+    edited, removed = rows["rowid"].iloc[0], rows["rowid"].iloc[1]
+    budget_data.update_fact_row(edited, MONTH_START, 999.0)
+    budget_data.remove_fact_row(removed)
+    budget_data.check_data_versions()
+    expected = budget_data.load_category_totals(MONTH_START, MONTH_END)
+
+    # settle the events just written
+    monkeypatch.setattr(budget_data, "JOURNAL_SETTLE", timedelta(0))
+    assert budget_data.compact_journal(budget_data.FACT_TABLE_NAME) == 2
+    assert budget_data.compact_journal(budget_data.FACT_TABLE_NAME) == 0
+    base = dict(_base_rows(warehouse, budget_data.FACT_TABLE_NAME))
+    assert base[edited] == 999.0 and removed not in base
+
+    budget_data.check_data_versions()
+    assert budget_data._compacted_through(budget_data.FACT_TABLE_NAME) > datetime.now(timezone.utc) - timedelta(1)
+    assert budget_data.load_category_totals(MONTH_START, MONTH_END).equals(expected)
+
+
+def test_snapshot_syncs_journaled_edits(warehouse, changes, tmp_path):
+    budget_data.enable_snapshots(str(tmp_path))
+    rows = budget_data.load_fact_rows(MONTH_START, MONTH_END)
+    edited, removed = rows["rowid"].iloc[0], rows["rowid"].iloc[1]
+    budget_data.update_fact_row(edited, MONTH_START, 999.0)
+    budget_data.remove_fact_row(removed)
+    after = budget_data.load_fact_rows(MONTH_START, MONTH_END).set_index("rowid")
+    assert after.loc[edited, "amount"] == 999.0
+    assert removed not in after.index
+
+
+def test_version_rows_fold_into_one_per_table(warehouse, changes, monkeypatch):
+    rows = budget_data.load_fact_rows(MONTH_START, MONTH_END)
+    for amount in (1.0, 2.0, 3.0):
+        budget_data.update_fact_row(rows["rowid"].iloc[0], MONTH_START, amount)
+    monkeypatch.setattr(budget_data, "JOURNAL_SETTLE", timedelta(0))
+    budget_data.compact_journal(budget_data.FACT_TABLE_NAME)
+    versions = budget_data.check_data_versions()
+    compacted_through = budget_data._compacted_through(budget_data.FACT_TABLE_NAME)
+    versions_id = warehouse.table_id(budget_data.VERSIONS_TABLE_NAME)
+    count = f'SELECT COUNT(*), COUNT(DISTINCT table_name) FROM "{versions_id}"'
+    stored, tables = warehouse.conn.execute(count).fetchone()
+    assert stored > tables
+
+    # rows that may still be in the streaming buffer are not touched
+    assert budget_data.compact_data_versions() == 0
+    monkeypatch.setattr(budget_data, "VERSION_ROWS_SETTLE", timedelta(0))
+    warehouse.calls.clear()
+    assert budget_data.compact_data_versions() == stored - tables
+    assert warehouse.calls["append"] == 0
+    assert warehouse.conn.execute(count).fetchone() == (tables, tables)
+    assert budget_data.compact_data_versions() == 0
+
+    budget_data.clear_caches()
+    assert budget_data.check_data_versions() == versions
+    assert budget_data._compacted_through(budget_data.FACT_TABLE_NAME) == compacted_through
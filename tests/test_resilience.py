@@ -0,0 +1,110 @@
+"""
+Warehouse failures: retries, the circuit breaker, and stale results served
+(with a banner) while the warehouse is down.
+"""
+from datetime import date
+
+import pytest
+from google.api_core import exceptions as api_exceptions
+
+import budget_data
+import budget_resilience
+from budget_resilience import CircuitBreaker, WarehouseUnavailable, call_with_retries
+
+MONTH_START = date.today().replace(day=1)
+MONTH_END = MONTH_START.replace(day=28)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _fail(*args, **kwargs):
+    raise api_exceptions.ServiceUnavailable("backend down")
+
+
+@pytest.fixture
+def outage(warehouse, monkeypatch):
+    """Call outage() to make every warehouse call fail; no retry waits."""
+    monkeypatch.setattr(budget_resilience.random, "uniform", lambda low, high: 0)
+
+    def start():
+        monkeypatch.setattr(warehouse, "query", _fail)
+        monkeypatch.setattr(warehouse, "insert_rows_json", _fail)
+    return start
+
+
+def test_breaker_opens_fails_fast_and_probes():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout_s=10, clock=clock)
+    for _ in range(2):
+        with pytest.raises(api_exceptions.ServiceUnavailable):
+            breaker.call(lambda: _fail())
+    assert breaker.state == "open"
+    with pytest.raises(WarehouseUnavailable):
+        breaker.call(lambda: "not called")
+
+    # bad SQL is not the warehouse's fault: it does not count
+    clock.now = 10
+    assert breaker.probe_due()
+    with pytest.raises(api_exceptions.BadRequest):
+        breaker.call(lambda: (_ for _ in ()).throw(api_exceptions.BadRequest("syntax")))
+    assert breaker.call(lambda: "ok") == "ok"
+    assert breaker.state == "closed"
+
+
+def test_only_transient_errors_are_retried():
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise api_exceptions.TooManyRequests("slow down")
+        return "ok"
+    assert call_with_retries(flaky, attempts=3, sleep=lambda s: None) == "ok"
+
+    attempts.clear()
+    with pytest.raises(api_exceptions.NotFound):
+        call_with_retries(lambda: attempts.append(1) or _raise(api_exceptions.NotFound("no table")),
+                          sleep=lambda s: None)
+    assert len(attempts) == 1
+
+
+def _raise(exc):
+    raise exc
+
+
+def _drop_versioned_results():
+    # keyed by the tables they read; the last good results (no tables) stay
+    budget_data._results.discard(budget_data.current_tenant(), lambda key: key[0])
+
+
+def test_reads_are_served_stale_during_an_outage(warehouse, outage):
+    budget_data.check_data_versions()
+    expected = budget_data.load_monthly_totals(MONTH_START, MONTH_END)
+    outage()
+    # the version check keeps the last good versions, so cached results are served
+    assert budget_data.check_data_versions()[budget_data.FACT_TABLE_NAME] == 0
+    _drop_versioned_results()
+    assert budget_data.load_monthly_totals(MONTH_START, MONTH_END).equals(expected)
+    assert budget_data.warehouse_state() == "open"
+
+    # with the breaker open a read no longer waits on the warehouse at all
+    warehouse.calls.clear()
+    assert budget_data.load_monthly_totals(MONTH_START, MONTH_END).equals(expected)
+    with pytest.raises(WarehouseUnavailable):
+        budget_data.add_dimension_row("expense", "During Outage", "")
+
+
+def test_stale_banner(app, outage):
+    app.run()
+    assert not app.warning
+    outage()
+    _drop_versioned_results()
+    app.run()
+    assert not app.exception
+    assert any("not responding" in w.value for w in app.warning)
@@ -0,0 +1,83 @@
+"""
+Query cost guardrails: reads are estimated against the session and daily
+scan limits, over-budget reads fall back to the last good result, and the
+estimate of a repeated read comes from its last scan instead of a dry run.
+"""
+import pytest
+
+import budget_data
+import budget_trace
+
+
+@pytest.fixture
+def session(warehouse):
+    """A session scan counter; limits and counter are reset afterwards."""
+    counter = budget_data.ScanCounter()
+    budget_data.set_session_counter(counter)
+    yield counter
+    budget_data.configure_scan_limits()
+    budget_data.set_session_counter(None)
+
+
+def _query(warehouse, table_name):
+    return f"SELECT * FROM `{warehouse.table_id(table_name)}` WHERE tenant_id = @tenant_id"
+
+
+def _read(query):
+    budget_trace.start_rerun()
+    with budget_trace.span("read", kind="data") as record:
+        df = budget_data.read_query(query, budget_data._tenant_config())
+    return df, record
+
+
+def test_read_over_a_limit_without_a_result_raises(warehouse, session):
+    query = _query(warehouse, budget_data.FACT_TABLE_NAME)
+    needed = budget_data.estimate_bytes(query, budget_data._tenant_config())
+    warehouse.calls.clear()
+    budget_data.configure_scan_limits(session_bytes=needed - 1, daily_bytes=None)
+    with pytest.raises(budget_data.QueryBudgetExceeded, match="Session scan budget"):
+        _read(query)
+
+    budget_data.configure_scan_limits(session_bytes=None, daily_bytes=needed - 1)
+    with pytest.raises(budget_data.QueryBudgetExceeded, match="Daily scan budget"):
+        _read(query)
+    assert session.bytes == 0 and warehouse.calls["query"] == 0
+
+
+def test_read_over_a_limit_serves_the_last_result(warehouse, session):
+    query = _query(warehouse, budget_data.DEBT_TABLE_NAME)
+    first, record = _read(query)
+    assert record["estimated_bytes"] == record["bytes_processed"] > 0
+
+    budget_data.configure_scan_limits(session_bytes=session.bytes + 1)
+    warehouse.calls.clear()
+    again, record = _read(query)
+    assert record["cache"] == "fallback"
+    assert warehouse.calls["query"] == 0
+    assert again.equals(first)
+
+
+def test_limits_add_up_across_reads(warehouse, session):
+    debts = _query(warehouse, budget_data.DEBT_TABLE_NAME)
+    categories = _query(warehouse, budget_data.CATS_TABLE_NAME)
+    _, first = _read(debts)
+    _, second = _read(categories)
+    assert session.queries == 2
+    assert session.bytes == first["bytes_processed"] + second["bytes_processed"]
+    assert budget_data.scan_usage()["daily_bytes"] == session.bytes
+
+    # room for one more debt read but not for the categories after it
+    budget_data.configure_scan_limits(session_bytes=session.bytes + first["bytes_processed"] +
+                                      second["bytes_processed"] - 1)
+    _read(debts)
+    _, record = _read(categories)
+    assert record["cache"] == "fallback"
+
+
+def test_repeated_reads_skip_the_dry_run(warehouse, session):
+    query = _query(warehouse, budget_data.DEBT_TABLE_NAME)
+    warehouse.calls.clear()
+    _, first = _read(query)
+    _, second = _read(query)
+    assert warehouse.calls["dry_run"] == 1 and warehouse.calls["query"] == 2
+    assert second["estimated_bytes"] == first["bytes_processed"]
@@ -0,0 +1,74 @@
+"""
+Transaction search: prefix/AND matching, amount and date filters, and
+in-place maintenance on writes.
+"""
+from datetime import date
+
+import pandas as pd
+
+import budget_data
+from budget_search import SearchIndex
+
+
+def _rows():
+    return pd.DataFrame([
+        {"rowid": "a", "date": date(2024, 1, 5), "type": "expense", "amount": 54.10,
+         "category": "Groceries", "budget_item": "Whole Foods", "credit_card": "Visa 1234", "note": "weekly shop"},
+        {"rowid": "b", "date": date(2024, 2, 9), "type": "expense", "amount": 120.00,
+         "category": "Groceries", "budget_item": "Costco", "credit_card": "Amex", "note": None},
+        {"rowid": "c", "date": date(2024, 3, 1), "type": "income", "amount": 3000.00,
+         "category": "Salary", "budget_item": "Paycheck", "credit_card": None, "note": "March pay"},
+    ])
+
+
+def test_prefix_and_all_words():
+    index = SearchIndex(_rows())
+    assert list(index.search("groc")["rowid"]) == ["b", "a"]
+    assert list(index.search("groc visa")["rowid"]) == ["a"]
+    assert index.search("groc salary").empty
+
+
+def test_amount_and_date_filters():
+    index = SearchIndex(_rows())
+    assert list(index.search("", min_amount=100)["rowid"]) == ["c", "b"]
+    assert list(index.search("groceries", max_amount=100)["rowid"]) == ["a"]
+    assert list(index.search("", start_date=date(2024, 2, 1), end_date=date(2024, 2, 29))["rowid"]) == ["b"]
+
+
+def test_incremental_changes():
+    index = SearchIndex(_rows())
+    index.add_rows(pd.DataFrame([{"rowid": "d", "date": date(2024, 4, 2), "type": "expense", "amount": 9.99,
+                                  "category": "Streaming", "budget_item": "Netflix", "credit_card": "Visa 1234",
+                                  "note": ""}]))
+    assert list(index.search("visa")["rowid"]) == ["d", "a"]
+    index.update_row("a", amount=500.0)
+    assert list(index.search("visa", min_amount=100)["rowid"]) == ["a"]
+    index.remove_rows(["d"])
+    index.remove_where(category="Salary")
+    assert "netflix" not in index.postings
+    assert list(index.search("")["rowid"]) == ["b", "a"]
+
+
+def test_search_is_kept_current_without_requery(warehouse):
+    budget_data.check_data_versions()
+    assert len(budget_data.search_transactions("income category 1 item 1")) > 0
+    budget_data.save_fact_data(pd.DataFrame([{
+        "rowid": "new", "date": date.today(), "type": "expense", "amount": 77.0,
+        "category": "Expense Category 3", "budget_item": "Expense Category 3 Item 1",
+        "credit_card": "Chase Sapphire", "note": "birthday gift",
+    }]))
+    budget_data.check_data_versions()
+    warehouse.calls.clear()
+    results = budget_data.search_transactions("birth sapph", min_amount=50)
+    assert list(results["rowid"]) == ["new"]
+    # answered from the in-process index: no query, not even a dry run
+    assert sum(warehouse.calls.values()) == 0, warehouse.calls
+
+
+def test_search_box(app, measure):
+    app.run()
+    run = measure(app.text_input(key="search_text").input("expense category 2 item 3"))
+    # one full read of the fact table builds the index
+    assert run.queries <= 2, run
+    results = [frame for frame in app.dataframe if "credit_card" in frame.value.columns]
+    assert len(results) == 1 and len(results[0].value) > 0
@@ -0,0 +1,136 @@
+"""
+Recurring series: one rule row, occurrences generated per window, and
+per-occurrence exceptions.
+"""
+from datetime import date
+
+import pandas as pd
+
+import budget_data
+from budget_series import expand_series, last_occurrence
+
+MONTH_START = date.today().replace(day=1)
+MONTH_END = MONTH_START.replace(day=28)
+FIELDS = {"type": "expense", "amount": 1000.0, "category": "Expense Category 1",
+          "budget_item": "Expense Category 1 Item 1", "credit_card": None, "note": "rent"}
+
+
+def _rule(**changes):
+    rule = dict(FIELDS, rowid="s", start_date=date(2024, 1, 31), cadence="monthly", occurrences=36, end_date=None)
+    return pd.DataFrame([dict(rule, **changes)])
+
+
+def _exceptions(*rows):
+    return pd.DataFrame(list(rows), columns=["series_id", "occurrence", "action", "date", "amount", "note"])
+
+
+def test_window_expansion_clamps_month_ends():
+    rows = expand_series(_rule(), None, date(2024, 2, 1), date(2024, 4, 30))
+    assert [d.date() for d in rows["date"]] == [date(2024, 2, 29), date(2024, 3, 31), date(2024, 4, 30)]
+    assert list(rows["rowid"]) == ["s:2", "s:3", "s:4"]
+    assert rows["note"].iloc[0] == "rent (Recurring 2/36)"
+    assert expand_series(_rule(), None, date(2027, 1, 1), date(2027, 12, 31)).empty
+
+
+def test_end_date_and_cadence():
+    rule = _rule(cadence="weekly", occurrences=None, end_date=date(2024, 3, 1))
+    assert last_occurrence(rule.iloc[0].to_dict()) == 5
+    rows = expand_series(rule, None, date(2024, 2, 20), date(2024, 12, 31))
+    assert [d.date() for d in rows["date"]] == [date(2024, 2, 21), date(2024, 2, 28)]
+
+
+def test_exceptions_override_skip_and_move_in():
+    exceptions = _exceptions(
+        {"series_id": "s", "occurrence": 2, "action": "skip"},
+        {"series_id": "s", "occurrence": 3, "action": "override", "amount": 1200.0},
+        # occurrence 5 (May 31) moved into April
+        {"series_id": "s", "occurrence": 5, "action": "override", "date": date(2024, 4, 2)},
+    )
+    rows = expand_series(_rule(), exceptions, date(2024, 2, 1), date(2024, 4, 30)).set_index("rowid")
+    assert list(rows.index) == ["s:3", "s:4", "s:5"]
+    assert rows.loc["s:3", "amount"] == 1200.0
+    assert rows.loc["s:5", "date"] == pd.Timestamp(2024, 4, 2)
+
+
+def test_series_is_one_row_and_edits_are_o1(warehouse):
+    budget_data.check_data_versions()
+    fact_rows = budget_data.load_fact_data()
+    series_id = budget_data.add_recurring_series(MONTH_START, "monthly", FIELDS, occurrences=36)
+    budget_data.check_data_versions()
+    assert len(budget_data.load_fact_data()) == len(fact_rows)
+    assert len(budget_data.load_recurring_series()) == 1
+
+    later = (pd.Timestamp(MONTH_START) + pd.DateOffset(months=30)).date()
+    month = budget_data.load_fact_rows(later, later.replace(day=28))
+    assert month["series_id"].eq(series_id).sum() == 1
+
+    warehouse.calls.clear()
+    budget_data.update_series(series_id, amount=1100.0)
+    assert warehouse.calls["append"] == 2     # one journal event and the version
+    budget_data.check_data_versions()
+    totals = budget_data.load_monthly_totals(later, later.replace(day=28))
+    assert totals.loc[totals["type"] == "expense", "amount"].iloc[0] >= 1100.0
+    month = budget_data.load_fact_rows(later, later.replace(day=28))
+    assert month.loc[month["series_id"] == series_id, "amount"].iloc[0] == 1100.0
+
+
+def test_occurrence_edits_become_exceptions(warehouse):
+    series_id = budget_data.add_recurring_series(MONTH_START, "monthly", FIELDS, occurrences=3)
+    budget_data.update_series_occurrence(series_id, 1, MONTH_START.replace(day=5), 950.0)
+    budget_data.skip_series_occurrence(series_id, 2)
+    rows = budget_data.load_series_rows(MONTH_START, date(MONTH_START.year + 1, 12, 31))
+    assert list(rows["occurrence"]) == [1, 3]
+    assert rows["amount"].iloc[0] == 950.0 and rows["date"].iloc[0] == pd.Timestamp(MONTH_START.replace(day=5))
+    budget_data.remove_series(series_id)
+    assert budget_data.load_series_rows(MONTH_START, date(MONTH_START.year + 1, 12, 31)).empty
+
+
+def test_repeat_adds_one_rule_row(app, measure):
+    app.run()
+    app.number_input(key="transaction_amount").set_value(250.0)
+    app.number_input(key="transaction_months").set_value(36)
+    run = measure(next(b for b in app.button if b.label == "Add Transaction").click())
+    # one MERGE of the rule row, however many months
+    assert run.loads == 0 and run.appends == 1, run
+    assert len(budget_data.load_recurring_series()) == 1
+
+
+def test_payoff_plan_series_edit_following_and_delete(warehouse):
+    budget_data.check_data_versions()
+    payoff = date(date.today().year + 1, 12, 1)
+    budget_data.insert_monthly_payments_for_debt("Test Card", 2400.0, "15", payoff)
+    facts = budget_data.load_fact_data()
+    series_id = facts.loc[facts["budget_item"] == "Test Card", "series_id"].iloc[0]
+    rowids = budget_data.fact_series_rowids(series_id)
+    plan = facts.set_index("rowid").loc[rowids]
+    assert len(plan) >= 12 and (plan["budget_item"] == "Test Card").all()
+    assert budget_data.series_size(series_id) == len(plan)
+
+    from_date = plan["date"].iloc[2].date()
+    warehouse.calls.clear()
+    budget_data.update_fact_series_from(series_id, from_date, from_date.replace(day=20), 300.0)
+    # one set-based read and one journal append (plus the version), not one job per row
+    assert warehouse.calls["query"] == 1 and warehouse.calls["append"] == 2
+    budget_data.check_data_versions()
+    after = budget_data.load_fact_data().set_index("rowid").loc[rowids]
+    assert (after["amount"].iloc[:2] == plan["amount"].iloc[:2]).all()
+    assert (after["amount"].iloc[2:] == 300.0).all()
+    assert (after["date"].iloc[2:].dt.day == 20).all()
+
+    warehouse.calls.clear()
+    budget_data.remove_fact_series(series_id)
+    assert warehouse.calls["query"] == 1 and warehouse.calls["append"] == 2
+    budget_data.check_data_versions()
+    assert not budget_data.load_fact_data()["rowid"].isin(rowids).any()
+    assert budget_data.fact_series_rowids(series_id) == []
+
+
+def test_rule_edit_following_splits_the_series(warehouse):
+    series_id = budget_data.add_recurring_series(MONTH_START, "monthly", FIELDS, occurrences=12)
+    fourth = (pd.Timestamp(MONTH_START) + pd.DateOffset(months=3)).date()
+    continued = budget_data.update_series_from(series_id, 4, fourth.replace(day=10), 1500.0)
+    rows = budget_data.load_series_rows(MONTH_START, date(MONTH_START.year + 2, 12, 31))
+    assert len(rows) == 12
+    assert list(rows.loc[rows["series_id"] == series_id, "amount"]) == [1000.0] * 3
+    moved = rows[rows["series_id"] == continued]
+    assert len(moved) == 9 and (moved["amount"] == 1500.0).all() and (moved["date"].dt.day == 10).all()
@@ -0,0 +1,53 @@
+"""
+Parquet snapshots: reads match the warehouse, and a sync after a write
+fetches only the delta.
+"""
+from datetime import date
+
+import pandas as pd
+import pytest
+
+import budget_data
+
+MONTH_START = date.today().replace(day=1)
+MONTH_END = MONTH_START.replace(day=28)
+
+
+@pytest.fixture
+def snapshots(warehouse, tmp_path):
+    # the warehouse fixture's use_client(None, None) turns them off again
+    budget_data.enable_snapshots(str(tmp_path))
+    return budget_data.snapshot_store()
+
+
+def test_snapshot_rollups_match_warehouse(warehouse, tmp_path):
+    expected = budget_data.load_category_totals(MONTH_START, MONTH_END)
+    budget_data.enable_snapshots(str(tmp_path))
+    actual = budget_data.load_category_totals(MONTH_START, MONTH_END)
+    pd.testing.assert_frame_equal(actual, expected, check_dtype=False)
+
+
+def test_delta_sync_after_writes(warehouse, snapshots):
+    rows = budget_data.load_fact_rows(MONTH_START, MONTH_END)
+    warehouse.calls.clear()
+    assert len(budget_data.load_fact_rows(MONTH_START, MONTH_END)) == len(rows)
+    assert warehouse.calls["query"] == 0
+
+    updated, removed = rows["rowid"].iloc[0], rows["rowid"].iloc[1]
+    budget_data.update_fact_row(updated, MONTH_START, 999.0)
+    budget_data.remove_fact_row(removed)
+    warehouse.calls.clear()
+    after = budget_data.load_fact_rows(MONTH_START, MONTH_END).set_index("rowid")
+    # changed rows plus the live rowid list, not the whole table
+    assert warehouse.calls["query"] == 2
+    assert after.loc[updated, "amount"] == 999.0
+    assert removed not in after.index
+
+
+def test_snapshot_reopens_from_disk(warehouse, tmp_path):
+    budget_data.enable_snapshots(str(tmp_path))
+    rows = budget_data.load_fact_rows(MONTH_START, MONTH_END)
+    budget_data.enable_snapshots(str(tmp_path))
+    store = budget_data.snapshot_store()
+    assert store.tables[budget_data.FACT_TABLE_NAME].frame is not None
+    assert len(budget_data.load_fact_rows(MONTH_START, MONTH_END)) == len(rows)
@@ -0,0 +1,164 @@
+"""
+Tenant isolation: rows, version checks, caches and scanned bytes are all
+per household.
+"""
+from datetime import date
+
+import pandas as pd
+import pytest
+
+import budget_data
+from budget_cache import DEFAULT_TENANT_BYTES, TenantCache
+from local_warehouse import generate_synthetic_data, seed_warehouse
+
+MONTH_START = date.today().replace(day=1)
+MONTH_END = MONTH_START.replace(day=28)
+
+
+@pytest.fixture
+def two_tenants(warehouse):
+    # "default" is seeded by the warehouse fixture; add a smaller household
+    seed_warehouse(warehouse, generate_synthetic_data(years=1, categories=3, items_per_category=2,
+                                                      debts=1, seed=1), tenant_id="smith")
+    yield warehouse
+    budget_data.set_tenant(budget_data.DEFAULT_TENANT)
+
+
+def test_reads_only_see_the_current_tenant(two_tenants):
+    budget_data.set_tenant("smith")
+    debts = budget_data.load_debt_items()
+    assert len(debts) == 1 and set(debts["tenant_id"]) == {"smith"}
+    assert set(budget_data.load_dimension_index()["expense"]) == {"Expense Category 2", "Expense Category 3"}
+
+    budget_data.set_tenant(budget_data.DEFAULT_TENANT)
+    assert len(budget_data.load_debt_items()) == 4
+
+
+def test_dimension_type_is_a_parameter_not_sql(two_tenants):
+    budget_data.set_tenant("smith")
+    assert set(budget_data.load_dimension_rows("Expense")["type"].str.lower()) == {"expense"}
+    # quoted text in the type cannot widen the filter to other tenants
+    assert budget_data.load_dimension_rows("x') OR ('1' = '1").empty
+
+
+def test_writes_and_versions_are_per_tenant(two_tenants):
+    budget_data.set_tenant("smith")
+    budget_data.check_data_versions()
+    before = budget_data.load_fact_rows(MONTH_START, MONTH_END)
+
+    budget_data.set_tenant(budget_data.DEFAULT_TENANT)
+    budget_data.save_fact_data(pd.DataFrame([{
+        "rowid": "default-only", "date": MONTH_START, "type": "expense", "amount": 1.0,
+        "category": "Expense Category 3", "budget_item": "Expense Category 3 Item 1",
+        "credit_card": None, "note": "",
+    }]))
+
+    budget_data.set_tenant("smith")
+    assert budget_data.check_data_versions()[budget_data.FACT_TABLE_NAME] == 0
+    two_tenants.calls.clear()
+    after = budget_data.load_fact_rows(MONTH_START, MONTH_END)
+    assert two_tenants.calls["query"] == 0
+    assert "default-only" not in set(after["rowid"]) and len(after) == len(before)
+
+
+def test_scanned_bytes_follow_the_tenants_data(two_tenants):
+    query = (f"SELECT * FROM `{two_tenants.table_id('fact_budget_inputs')}` "
+             "WHERE tenant_id = @tenant_id")
+    budget_data.set_tenant("smith")
+    small = budget_data.estimate_bytes(query, budget_data._tenant_config())
+    budget_data.set_tenant(budget_data.DEFAULT_TENANT)
+    large = budget_data.estimate_bytes(query, budget_data._tenant_config())
+    assert 0 < small * 5 < large
+
+
+def test_rows_from_before_tenancy_are_backfilled_once(warehouse, monkeypatch):
+    debts_id = warehouse.table_id(budget_data.DEBT_TABLE_NAME)
+    warehouse.conn.execute(f'INSERT INTO "{debts_id}" (rowid, debt_name) VALUES (?, ?)', ("legacy", "Old Loan"))
+    warehouse.conn.commit()
+    query = warehouse.query
+    statements = []
+
+    def recording(sql, job_config=None, timeout=None):
+        statements.append(sql.strip())
+        return query(sql, job_config, timeout)
+
+    monkeypatch.setattr(warehouse, "query", recording)
+    budget_data.ensure_schema()
+    assert sum(sql.startswith("UPDATE") for sql in statements) == 1
+    stored = warehouse.conn.execute(f'SELECT tenant_id FROM "{debts_id}" WHERE rowid = ?', ("legacy",)).fetchone()
+    assert stored == (budget_data.DEFAULT_TENANT,)
+    # nothing left to backfill: no DML on the next start
+    statements.clear()
+    budget_data.ensure_schema()
+    assert not any(sql.startswith("UPDATE") for sql in statements)
+
+
+def test_version_rows_from_before_tenancy_are_read_not_backfilled(warehouse, monkeypatch):
+    # data_versions takes streaming inserts, which DML cannot update yet
+    versions_id = warehouse.table_id(budget_data.VERSIONS_TABLE_NAME)
+    warehouse.conn.executemany(f'INSERT INTO "{versions_id}" (table_name, version, updated_at) VALUES (?, ?, ?)',
+                               [(budget_data.DEBT_TABLE_NAME, 2**60 - 1, "2020-01-01T00:00:00+00:00"),
+                                (budget_data.DEBT_TABLE_NAME, 2**60, "2020-01-02T00:00:00+00:00")])
+    warehouse.conn.commit()
+    query = warehouse.query
+    statements = []
+
+    def recording(sql, job_config=None, timeout=None):
+        statements.append(sql.strip())
+        return query(sql, job_config, timeout)
+
+    monkeypatch.setattr(warehouse, "query", recording)
+    budget_data.ensure_schema()
+    assert not any(sql.startswith("UPDATE") and versions_id in sql for sql in statements)
+    assert budget_data.check_data_versions()[budget_data.DEBT_TABLE_NAME] == 2**60
+
+    # once settled they are folded into the default tenant's rows
+    assert budget_data.compact_data_versions() == 1
+    rows = warehouse.conn.execute(f'SELECT tenant_id, version FROM "{versions_id}" WHERE version >= ?',
+                                  (2**60 - 1,)).fetchall()
+    assert rows == [(budget_data.DEFAULT_TENANT, 2**60)]
+
+
+def test_invalid_tenant_is_rejected():
+    with pytest.raises(ValueError):
+        budget_data.set_tenant("../other")
+
+
+def test_tenant_cache_limits_each_tenant_separately():
+    frame = pd.DataFrame({"x": range(1000)})
+    size = int(frame.memory_usage(deep=True).sum())
+    cache = TenantCache(max_bytes_per_tenant=size * 2, max_tenants=2)
+    for key in range(3):
+        cache.put("a", key, frame)
+    cache.put("b", 0, frame)
+    assert cache.get("a", 0) is None and cache.get("a", 2) is not None
+    assert cache.usage()["a"] == {"entries": 2, "bytes": size * 2}
+    assert cache.get("b", 0) is not None
+
+    cache.put("c", 0, frame)
+    assert "a" not in cache.usage()
+
+
+def test_last_good_results_are_kept_per_tenant_under_its_limit(two_tenants):
+    query = (f"SELECT * FROM `{two_tenants.table_id('fact_budget_inputs')}` "
+             "WHERE tenant_id = @tenant_id")
+    budget_data.set_tenant("smith")
+    first = budget_data.read_query(query, budget_data._tenant_config())
+    usage = budget_data.cache_usage()
+    assert budget_data.DEFAULT_TENANT not in usage
+    assert usage["smith"]["bytes"] >= first.memory_usage(deep=True).sum()
+
+    # callers share the stored rows but cannot change them
+    first.loc[0, "amount"] = -1.0
+    budget_data.configure_scan_limits(session_bytes=1)
+    try:
+        again = budget_data.read_query(query, budget_data._tenant_config())
+    finally:
+        budget_data.configure_scan_limits()
+    assert again.loc[0, "amount"] != -1.0
+
+    budget_data._results.configure(max_bytes_per_tenant=1)
+    try:
+        assert budget_data.cache_usage()["smith"]["bytes"] == 0
+    finally:
+        budget_data._results.configure(max_bytes_per_tenant=DEFAULT_TENANT_BYTES)
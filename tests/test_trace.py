@@ -0,0 +1,83 @@
+"""
+Per-rerun tracing: spans nest under the page span, data spans carry the
+warehouse annotations, and the sidebar profiler shows them.
+"""
+import pytest
+
+import budget_trace
+
+
+@pytest.fixture(autouse=True)
+def no_trace_left_behind():
+    # traces started here must not collect the next tests' spans
+    token = budget_trace._current_trace.set(None)
+    yield
+    budget_trace._current_trace.reset(token)
+
+
+@budget_trace.traced
+def _load(rows, **annotations):
+    budget_trace.annotate(**annotations)
+    return list(range(rows))
+
+
+@budget_trace.traced
+def _load_twice():
+    return _load(2, bytes_processed=100, jobs=1) + _load(1, cache="hit")
+
+
+def test_spans_nest_under_the_page_and_carry_annotations():
+    trace = budget_trace.start_rerun()
+    page = budget_trace.open_span("Budget Planning")
+    with budget_trace.span("transaction_list"):
+        _load(3, bytes_processed=500, jobs=1, cache="miss", estimated_bytes=480)
+    _load_twice()
+    budget_trace.finish_rerun()
+
+    assert [(record["name"], record["parent"]) for record in trace["spans"]] == [
+        ("Budget Planning", None), ("transaction_list", "Budget Planning"), ("_load", "transaction_list"),
+        ("_load_twice", "Budget Planning"), ("_load", "_load_twice"), ("_load", "_load_twice"),
+    ]
+    _, _, listed, twice, _, _ = trace["spans"]
+    assert (listed["rows"], listed["bytes_processed"], listed["cache"], listed["estimated_bytes"]) == \
+        (3, 500, "miss", 480)
+    assert twice["rows"] == 3
+    # the page span was left open by the script and closed with the rerun
+    assert page["wall_ms"] is not None and all(record["wall_ms"] is not None for record in trace["spans"])
+
+    totals = budget_trace.summarize(trace)
+    assert totals["bytes"] == 600 and totals["jobs"] == 2
+    # the loads inside _load_twice are not counted twice
+    assert abs(totals["data_ms"] - listed["wall_ms"] - twice["wall_ms"]) < 1e-6
+
+
+def test_an_interrupted_rerun_is_closed_by_the_next(tmp_path):
+    log = tmp_path / "trace.jsonl"
+    budget_trace.configure(str(log))
+    try:
+        first = budget_trace.start_rerun(page="Debt Domination")
+        budget_trace.open_span("Debt Domination")
+        second = budget_trace.start_rerun(previous=first)
+        budget_trace.finish_rerun()
+    finally:
+        budget_trace.configure(None)
+    assert first["interrupted"] and not second["interrupted"]
+    assert len(log.read_text().splitlines()) == 2
+
+
+def test_profiler_panel_shows_span_timings_and_annotations(app):
+    app.session_state["show_profiler"] = True
+    app.run()
+    assert not app.exception
+    spans = app.sidebar.dataframe[0].value
+    names = [name.strip() for name in spans["name"]]
+    assert {"check_data_versions", "Budget Planning", "transaction_list", "load_fact_rows"} <= set(names)
+    assert spans["wall_ms"].notna().all()
+    fresh = spans[[name == "load_fact_rows" for name in names]].iloc[0]
+    assert fresh["estimated_bytes"] > 0 and fresh["bytes_processed"] > 0 and fresh["jobs"] == 1
+
+    app.run()
+    spans = app.sidebar.dataframe[0].value
+    names = [name.strip() for name in spans["name"]]
+    cached = spans[[name == "load_fact_rows" for name in names]]
+    assert (cached["cache"] == "hit").all() and (cached["jobs"] == 0).all()